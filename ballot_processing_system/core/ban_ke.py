@@ -0,0 +1,128 @@
+# ban_ke.py - Bản kê (manifest) của một lần chạy batch, để chạy lại tiếp từ chỗ bị dừng
+import os
+import json
+import hashlib
+import threading
+
+XONG = 'xong'
+LOI = 'loi'
+
+def bam_file(duong_dan: str, kich_thuoc_khoi: int = 1 << 20) -> str:
+    """Mã băm nội dung file (BLAKE2b, đọc từng khối để không nạp cả file nén / PDF lớn vào bộ nhớ)"""
+    bam = hashlib.blake2b(digest_size=16)
+    with open(duong_dan, 'rb') as f:
+        for khoi in iter(lambda: f.read(kich_thuoc_khoi), b''):
+            bam.update(khoi)
+    return bam.hexdigest()
+
+def bam_cau_hinh(cau_hinh: dict) -> str:
+    """Vân tay của cấu hình: băm JSON đã sắp xếp khóa"""
+    return hashlib.blake2b(json.dumps(cau_hinh, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+class BanKe:
+    """
+    Bản kê JSON Lines đặt trong thư mục kết quả: mỗi phiếu xử lý xong thêm một dòng {khóa phiếu,
+    mã băm nội dung file đầu vào, vân tay cấu hình, trạng thái, file kết quả}. Dòng sau của cùng
+    một phiếu ghi đè dòng trước. Chỉ ghi thêm cuối file nên bị dừng giữa chừng cũng chỉ mất dòng
+    đang ghi dở, và nhiều tiến trình (--processes) ghi chung được.
+    
+    Khi chạy lại, phiếu có dòng 'xong' khớp mã băm và vân tay cấu hình, và file kết quả còn đọc
+    được, thì dùng lại kết quả cũ. Mã băm được dùng lại khi kích thước và mtime của file không đổi,
+    nên chạy lại không phải đọc lại các file đã xử lý.
+    """
+    
+    def __init__(self, duong_dan: str, van_tay_cau_hinh: str):
+        """
+        Args:
+            duong_dan: File bản kê (.jsonl), tạo mới nếu chưa có
+            van_tay_cau_hinh: Vân tay cấu hình của processor (đổi cấu hình thì xử lý lại mọi phiếu)
+        """
+        self.duong_dan = duong_dan
+        self.van_tay_cau_hinh = van_tay_cau_hinh
+        self._khoa = threading.Lock()
+        
+        # Khóa phiếu -> dòng mới nhất; đường dẫn file đầu vào -> (kích thước, mtime, mã băm)
+        self._dong_theo_khoa = {}
+        self._bam_theo_file = {}
+        # Mã băm đã tính trong lần chạy này (file nén / tài liệu chỉ băm một lần cho mọi phiếu bên trong)
+        self._bam_da_tinh = {}
+        
+        if os.path.exists(duong_dan):
+            with open(duong_dan, 'r', encoding='utf-8') as f:
+                for dong in f:
+                    try:
+                        muc = json.loads(dong)
+                    except json.JSONDecodeError:
+                        continue  # Dòng ghi dở khi bị dừng
+                    self._dong_theo_khoa[muc['khoa']] = muc
+                    self._bam_theo_file[muc['file']] = (muc['kich_thuoc'], muc['mtime_ns'], muc['bam'])
+    
+    def bam_dau_vao(self, duong_dan: str):
+        """
+        Mã băm của file đầu vào (ảnh, file nén hoặc tài liệu nhiều trang)
+        
+        Returns:
+            (mã băm, kích thước, mtime_ns), mã băm None nếu không đọc được file
+        """
+        if duong_dan in self._bam_da_tinh:
+            return self._bam_da_tinh[duong_dan]
+        try:
+            st = os.stat(duong_dan)
+            da_co = self._bam_theo_file.get(duong_dan)
+            if da_co and da_co[:2] == (st.st_size, st.st_mtime_ns):
+                bam = da_co[2]
+            else:
+                bam = bam_file(duong_dan)
+            ket_qua = (bam, st.st_size, st.st_mtime_ns)
+        except OSError:
+            ket_qua = (None, 0, 0)
+        self._bam_da_tinh[duong_dan] = ket_qua
+        return ket_qua
+    
+    def ket_qua_da_xong(self, viec: dict):
+        """
+        Kết quả của phiếu nếu đã xử lý xong với cùng nội dung đầu vào và cùng cấu hình
+        
+        Args:
+            viec: Dict việc có 'duong_dan_anh', 'file_ket_qua', 'bam'
+        
+        Returns:
+            Kết quả phiếu đọc từ file kết quả, None nếu cần xử lý (lại)
+        """
+        muc = self._dong_theo_khoa.get(viec['duong_dan_anh'])
+        if (muc is None or muc['trang_thai'] != XONG or viec.get('bam') is None
+                or muc['bam'] != viec['bam'] or muc['cau_hinh'] != self.van_tay_cau_hinh
+                or muc['file_ket_qua'] != viec['file_ket_qua']):
+            return None
+        try:
+            with open(viec['file_ket_qua'], 'r', encoding='utf-8') as f:
+                ket_qua = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        return ket_qua or None
+    
+    def ghi(self, viec: dict, thanh_cong: bool):
+        """
+        Thêm dòng của một phiếu vào bản kê (sau khi file kết quả của phiếu đã được ghi)
+        
+        Args:
+            viec: Dict việc có 'duong_dan_anh', 'file_ket_qua', 'bam', 'file', 'kich_thuoc', 'mtime_ns'
+            thanh_cong: Phiếu có kết quả (False: phiếu lỗi, được xử lý lại ở lần chạy sau)
+        """
+        muc = {
+            'khoa': viec['duong_dan_anh'],
+            'file': viec['file'],
+            'kich_thuoc': viec['kich_thuoc'],
+            'mtime_ns': viec['mtime_ns'],
+            'bam': viec['bam'],
+            'cau_hinh': self.van_tay_cau_hinh,
+            'trang_thai': XONG if thanh_cong else LOI,
+            'file_ket_qua': viec['file_ket_qua']
+        }
+        dong = json.dumps(muc, ensure_ascii=False) + "\n"
+        with self._khoa:
+            # Một lần write trên file mở O_APPEND: dòng của các tiến trình không xen vào nhau
+            with open(self.duong_dan, 'a', encoding='utf-8') as f:
+                f.write(dong)
+            self._dong_theo_khoa[muc['khoa']] = muc
@@ -0,0 +1,197 @@
+# bo_nho_chung.py - Bộ đệm vòng trên shared memory giữa tiến trình tiền xử lý và tiến trình suy luận
+import os
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from core.tien_xu_ly import tien_xu_ly_phieu_bau
+from core.loc_muc import tinh_ti_le_muc
+from core.trung_lap import van_tay_phieu, vung_o_danh_dau
+from core.ke_hoach_luong import ap_dung_ke_hoach
+
+# Kích thước ảnh ô sau tiền xử lý (cat_phieu_bau)
+KICH_THUOC_O_TEN = (384, 384, 3)
+KICH_THUOC_O_DAU = (640, 640, 3)
+
+class BoDemVong:
+    """
+    Bộ đệm vòng gồm các slot cố định trên một vùng shared memory. Mỗi slot chứa toàn bộ ô
+    họ tên (384x384) và ô đồng ý/không đồng ý (640x640) của một phiếu. Tiến trình tiền xử lý
+    ghi ảnh trực tiếp vào slot, chỉ gửi mô tả slot (vài trăm byte) qua hàng đợi; tiến trình
+    suy luận đọc ảnh bằng view numpy, không copy, rồi trả slot về khi xử lý xong.
+    
+    Số slot giới hạn số phiếu đang nằm trong bộ nhớ: khi hết slot trống, tiến trình tiền xử lý
+    bị chặn cho đến khi tiến trình suy luận trả slot.
+    """
+    
+    def __init__(self, so_slot: int = 8, so_o_ten: int = 10, so_o_dau: int = 20, ctx=None):
+        """
+        Args:
+            so_slot: Số phiếu tối đa nằm trong bộ đệm cùng lúc
+            so_o_ten: Số ô họ tên tối đa của một phiếu
+            so_o_dau: Số ô đồng ý/không đồng ý tối đa của một phiếu
+            ctx: Multiprocessing context dùng để tạo hàng đợi
+        """
+        if so_slot < 1:
+            raise ValueError("Bộ đệm vòng cần ít nhất một slot")
+        
+        ctx = ctx or multiprocessing.get_context()
+        
+        self.so_slot = so_slot
+        self.so_o_ten = so_o_ten
+        self.so_o_dau = so_o_dau
+        self._byte_o_ten = so_o_ten * int(np.prod(KICH_THUOC_O_TEN))
+        self._byte_slot = self._byte_o_ten + so_o_dau * int(np.prod(KICH_THUOC_O_DAU))
+        
+        self._shm = shared_memory.SharedMemory(create=True, size=so_slot * self._byte_slot)
+        # Chỉ tiến trình tạo vùng nhớ được giải phóng nó (tiến trình fork cũng mang bản sao object này)
+        self._pid_chu_so_huu = os.getpid()
+        
+        # Slot trống và mô tả phiếu đã sẵn sàng
+        self.slot_trong = ctx.Queue()
+        self.san_sang = ctx.Queue()
+        for slot in range(so_slot):
+            self.slot_trong.put(slot)
+    
+    def __getstate__(self):
+        # Chỉ truyền tên vùng nhớ sang tiến trình con (chế độ spawn), không truyền dữ liệu
+        trang_thai = self.__dict__.copy()
+        trang_thai['_shm'] = self._shm.name
+        return trang_thai
+    
+    def __setstate__(self, trang_thai):
+        self.__dict__.update(trang_thai)
+        self._shm = shared_memory.SharedMemory(name=trang_thai['_shm'])
+    
+    def _view_slot(self, slot):
+        """View numpy (không copy) của các ô họ tên và ô đánh dấu trong một slot"""
+        bat_dau = slot * self._byte_slot
+        o_ten = np.ndarray((self.so_o_ten,) + KICH_THUOC_O_TEN, dtype=np.uint8,
+                           buffer=self._shm.buf, offset=bat_dau)
+        o_dau = np.ndarray((self.so_o_dau,) + KICH_THUOC_O_DAU, dtype=np.uint8,
+                           buffer=self._shm.buf, offset=bat_dau + self._byte_o_ten)
+        return o_ten, o_dau
+    
+    def ghi_phieu(self, ma_tran_anh, thong_tin=None):
+        """
+        Ghi ma trận ảnh (kết quả của xu_ly_phieu_bau) vào một slot trống và công bố mô tả slot.
+        Bị chặn khi không còn slot trống.
+        
+        Args:
+            ma_tran_anh: Ma trận ô đã cắt
+            thong_tin: Dict thông tin thêm gửi kèm mô tả (ví dụ đường dẫn ảnh, tỉ lệ mực)
+        """
+        so_o_ten = sum(1 for dong in ma_tran_anh for o in dong if o['loai'] == 'hoten')
+        so_o_dau = sum(1 for dong in ma_tran_anh for o in dong if o['loai'] in ('dongy', 'khongdongy'))
+        if so_o_ten > self.so_o_ten or so_o_dau > self.so_o_dau:
+            raise ValueError(f"Phiếu có {so_o_ten} ô họ tên, {so_o_dau} ô đánh dấu, "
+                             f"vượt quá kích thước slot ({self.so_o_ten}, {self.so_o_dau})")
+        
+        slot = self.slot_trong.get()
+        o_ten, o_dau = self._view_slot(slot)
+        
+        cac_dong = []
+        dem_ten = dem_dau = 0
+        try:
+            for dong_anh in ma_tran_anh:
+                dong = []
+                for o in dong_anh:
+                    mo_ta = {'loai': o['loai'], 'vung': o['vung'], 'kho': None, 'chi_so': None}
+                    if o['loai'] == 'hoten':
+                        o_ten[dem_ten] = o['anh']
+                        mo_ta['kho'], mo_ta['chi_so'] = 'ten', dem_ten
+                        dem_ten += 1
+                    elif o['loai'] in ('dongy', 'khongdongy'):
+                        o_dau[dem_dau] = o['anh']
+                        mo_ta['kho'], mo_ta['chi_so'] = 'dau', dem_dau
+                        dem_dau += 1
+                    dong.append(mo_ta)
+                cac_dong.append(dong)
+        except Exception:
+            self.slot_trong.put(slot)
+            raise
+        
+        self.san_sang.put(dict(thong_tin or {}, slot=slot, cac_dong=cac_dong, loi=None))
+    
+    def bao_loi(self, thong_tin, loi):
+        """Công bố một phiếu không tiền xử lý được (không chiếm slot)"""
+        self.san_sang.put(dict(thong_tin or {}, slot=None, cac_dong=[], loi=loi))
+    
+    def doc_phieu(self, mo_ta):
+        """
+        Dựng lại ma trận ảnh từ mô tả slot, ảnh là view trên shared memory.
+        View chỉ hợp lệ đến khi gọi tra_slot.
+        
+        Returns:
+            List[List[Dict]]: Cùng cấu trúc với xu_ly_phieu_bau ('duong_dan' là None)
+        """
+        o_ten, o_dau = self._view_slot(mo_ta['slot'])
+        kho = {'ten': o_ten, 'dau': o_dau}
+        
+        ma_tran_anh = []
+        for dong in mo_ta['cac_dong']:
+            ma_tran_anh.append([{
+                'anh': kho[o['kho']][o['chi_so']] if o['kho'] else None,
+                'duong_dan': None,
+                'loai': o['loai'],
+                'vung': tuple(o['vung'])
+            } for o in dong])
+        return ma_tran_anh
+    
+    def tra_slot(self, slot):
+        """Trả slot về bộ đệm sau khi không còn dùng view của nó"""
+        if slot is not None:
+            self.slot_trong.put(slot)
+    
+    def dong(self):
+        """Đóng vùng nhớ; tiến trình tạo bộ đệm đồng thời giải phóng nó"""
+        self._shm.close()
+        if os.getpid() == self._pid_chu_so_huu:
+            self._shm.unlink()
+
+def worker_tien_xu_ly(bo_dem: BoDemVong, hang_doi_viec, tinh_muc: bool = False, ke_hoach_luong: dict = None,
+                      tinh_van_tay: bool = False):
+    """
+    Vòng lặp của tiến trình tiền xử lý: làm phẳng, cắt phiếu rồi ghi các ô vào bộ đệm vòng
+    
+    Args:
+        bo_dem: Bộ đệm vòng dùng chung
+        hang_doi_viec: Hàng đợi đường dẫn ảnh, None là tín hiệu dừng
+        tinh_muc: Tính sẵn tỉ lệ mực của ô đồng ý/không đồng ý cho bước lọc mực
+        ke_hoach_luong: Kế hoạch luồng (OpenCV một luồng, ghim vào lõi tiền xử lý)
+        tinh_van_tay: Tính vân tay phiếu trên ảnh phẳng (ảnh phẳng không đi qua bộ đệm vòng)
+    """
+    ap_dung_ke_hoach(ke_hoach_luong, vai_tro="tien_xu_ly")
+    
+    while True:
+        duong_dan_anh = hang_doi_viec.get()
+        if duong_dan_anh is None:
+            break
+        
+        thong_tin = {'duong_dan_anh': duong_dan_anh, 'ti_le_muc': None}
+        bat_dau = time.perf_counter()
+        try:
+            # Không ghi ảnh cắt ra đĩa, ảnh đi thẳng vào shared memory
+            phieu = tien_xu_ly_phieu_bau(duong_dan_anh, None)
+            # Thời gian gửi về để tiến trình suy luận kiểm tra giới hạn của giai đoạn tiền xử lý
+            thong_tin['thoi_gian_tien_xu_ly'] = time.perf_counter() - bat_dau
+            if not phieu or not phieu['ma_tran_anh']:
+                bo_dem.bao_loi(thong_tin, "Không thể tiền xử lý ảnh")
+                continue
+            
+            if tinh_muc:
+                vung = [o['vung'] for dong in phieu['ma_tran_anh'] for o in dong
+                        if o['loai'] in ('dongy', 'khongdongy')]
+                thong_tin['ti_le_muc'] = tinh_ti_le_muc(phieu['anh_phang'], vung).tolist()
+            
+            if tinh_van_tay:
+                thong_tin['van_tay'] = van_tay_phieu(phieu['anh_phang'], vung_o_danh_dau(phieu['ma_tran_anh']))
+            
+            bo_dem.ghi_phieu(phieu['ma_tran_anh'], thong_tin)
+        except Exception as e:
+            thong_tin.setdefault('thoi_gian_tien_xu_ly', time.perf_counter() - bat_dau)
+            bo_dem.bao_loi(thong_tin, str(e))
+    
+    bo_dem.dong()
@@ -0,0 +1,170 @@
+# bo_nho_dem.py - Bộ nhớ đệm kết quả từng giai đoạn xử lý phiếu trên đĩa cục bộ
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+from core.ban_ke import bam_file, bam_cau_hinh
+
+# Các giai đoạn được lưu đệm, theo thứ tự xử lý
+LAM_PHANG = 'lam_phang'
+OCR = 'ocr'
+PHAT_HIEN = 'phat_hien'
+KET_QUA = 'ket_qua'
+CAC_GIAI_DOAN = (LAM_PHANG, OCR, PHAT_HIEN, KET_QUA)
+
+# File tạm của tiến trình bị dừng khi đang ghi được xóa sau chừng này giây
+_TUOI_FILE_TAM = 3600
+
+def bam_anh_dau_vao(duong_dan_anh: str, anh=None) -> str:
+    """Mã băm đầu vào của phiếu: nội dung file ảnh, hoặc điểm ảnh khi ảnh đã decode trong bộ nhớ"""
+    if anh is None:
+        return bam_file(duong_dan_anh)
+    bam = hashlib.blake2b(digest_size=16)
+    bam.update(repr((anh.shape, str(anh.dtype))).encode('ascii'))
+    bam.update(np.ascontiguousarray(anh))
+    return bam.hexdigest()
+
+def tao_khoa(giai_doan: str, *thanh_phan) -> str:
+    """Khóa của một giai đoạn: băm tên giai đoạn, khóa các giai đoạn trước và cấu hình của giai đoạn này"""
+    return bam_cau_hinh([giai_doan, *thanh_phan])
+
+class BoNhoDemGiaiDoan:
+    """
+    Bộ nhớ đệm trên đĩa cục bộ cho đầu ra của từng giai đoạn (làm phẳng, OCR họ tên, phát hiện dấu X,
+    ghép kết quả phiếu). Mỗi mục là một file <thư mục>/<giai đoạn>/<2 ký tự đầu khóa>/<khóa>.json.
+    Khóa một giai đoạn băm khóa giai đoạn trước cùng cấu hình / phiên bản mô hình của giai đoạn đó
+    (tao_khoa), nên đổi weights YOLO chỉ làm mất hiệu lực phát hiện dấu X và ghép kết quả; làm phẳng
+    và OCR vẫn được dùng lại.
+    
+    Tổng dung lượng bị giới hạn: khi vượt dung_luong_toi_da, các mục lâu không được dùng nhất (theo
+    mtime, cập nhật mỗi lần đọc trúng) bị xóa đến khi còn ti_le_sau_don_dep. Mục được ghi vào file tạm
+    rồi đổi tên nên nhiều tiến trình dùng chung một thư mục được; mục hỏng được coi như không có.
+    """
+    
+    def __init__(self, thu_muc: str, dung_luong_toi_da: int = 2 << 30, ti_le_sau_don_dep: float = 0.8,
+                 chu_ky_quet: int = 256):
+        """
+        Args:
+            thu_muc: Thư mục bộ nhớ đệm (tạo mới nếu chưa có)
+            dung_luong_toi_da: Tổng kích thước tối đa (byte) các mục
+            ti_le_sau_don_dep: Phần dung lượng còn lại sau khi dọn
+            chu_ky_quet: Số lần ghi giữa hai lần quét lại thư mục (thấy phần các tiến trình khác đã ghi)
+        """
+        self.thu_muc = thu_muc
+        self.dung_luong_toi_da = dung_luong_toi_da
+        self.ti_le_sau_don_dep = ti_le_sau_don_dep
+        self.chu_ky_quet = chu_ky_quet
+        self._khoa = threading.Lock()
+        self._khoa_don_dep = threading.Lock()
+        
+        os.makedirs(thu_muc, exist_ok=True)
+        self._dung_luong = sum(kich_thuoc for _, kich_thuoc, _ in self._quet())
+        self._so_lan_ghi = 0
+        self.dat_lai_thong_ke()
+    
+    def _duong_dan(self, giai_doan: str, khoa: str) -> str:
+        return os.path.join(self.thu_muc, giai_doan, khoa[:2], f"{khoa}.json")
+    
+    def _quet(self):
+        """List (mtime, kích thước, đường dẫn) mọi mục; xóa file tạm bị bỏ lại"""
+        cac_muc = []
+        bay_gio = time.time()
+        for thu_muc_cha, _, cac_file in os.walk(self.thu_muc):
+            for ten in cac_file:
+                duong_dan = os.path.join(thu_muc_cha, ten)
+                try:
+                    st = os.stat(duong_dan)
+                    if ten.endswith('.tmp'):
+                        if bay_gio - st.st_mtime > _TUOI_FILE_TAM:
+                            os.remove(duong_dan)
+                        continue
+                except OSError:
+                    continue  # Tiến trình khác vừa xóa
+                cac_muc.append((st.st_mtime, st.st_size, duong_dan))
+        return cac_muc
+    
+    def _dem(self, giai_doan: str, loai: str):
+        with self._khoa:
+            self.thong_ke.setdefault(giai_doan, {'trung': 0, 'truot': 0})[loai] += 1
+    
+    def lay(self, giai_doan: str, khoa: str):
+        """Giá trị đã lưu của giai đoạn, None nếu chưa có"""
+        duong_dan = self._duong_dan(giai_doan, khoa)
+        try:
+            with open(duong_dan, 'r', encoding='utf-8') as f:
+                gia_tri = json.load(f)
+        except (OSError, ValueError):
+            gia_tri = None
+        
+        if gia_tri is None:
+            self._dem(giai_doan, 'truot')
+            return None
+        
+        try:
+            os.utime(duong_dan)  # Vừa được dùng: bị dọn sau cùng
+        except OSError:
+            pass
+        self._dem(giai_doan, 'trung')
+        return gia_tri
+    
+    def luu(self, giai_doan: str, khoa: str, gia_tri):
+        """Lưu giá trị (dữ liệu JSON) của giai đoạn; lỗi ghi chỉ được cảnh báo"""
+        duong_dan = self._duong_dan(giai_doan, khoa)
+        file_tam = f"{duong_dan}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            du_lieu = json.dumps(gia_tri, ensure_ascii=False).encode('utf-8')
+            os.makedirs(os.path.dirname(duong_dan), exist_ok=True)
+            with open(file_tam, 'wb') as f:
+                f.write(du_lieu)
+            os.replace(file_tam, duong_dan)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[WARNING] Không lưu được bộ nhớ đệm {giai_doan}: {e}")
+            try:
+                os.remove(file_tam)
+            except OSError:
+                pass
+            return
+        
+        with self._khoa:
+            self._dung_luong += len(du_lieu)
+            self._so_lan_ghi += 1
+            can_don_dep = self._dung_luong > self.dung_luong_toi_da or self._so_lan_ghi % self.chu_ky_quet == 0
+        if can_don_dep:
+            self.don_dep()
+    
+    def don_dep(self):
+        """Quét lại thư mục, xóa các mục lâu không dùng nhất nếu tổng dung lượng vượt giới hạn"""
+        if not self._khoa_don_dep.acquire(blocking=False):
+            return  # Luồng khác đang dọn
+        try:
+            cac_muc = self._quet()
+            tong = sum(kich_thuoc for _, kich_thuoc, _ in cac_muc)
+            if tong > self.dung_luong_toi_da:
+                muc_tieu = self.dung_luong_toi_da * self.ti_le_sau_don_dep
+                for _, kich_thuoc, duong_dan in sorted(cac_muc):
+                    if tong <= muc_tieu:
+                        break
+                    try:
+                        os.remove(duong_dan)
+                    except OSError:
+                        pass
+                    tong -= kich_thuoc
+            with self._khoa:
+                self._dung_luong = tong
+        finally:
+            self._khoa_don_dep.release()
+    
+    def dat_lai_thong_ke(self):
+        self.thong_ke = {giai_doan: {'trung': 0, 'truot': 0} for giai_doan in CAC_GIAI_DOAN}
+    
+    def gop_thong_ke(self, thong_ke: dict):
+        """Cộng thống kê trúng/trượt của tiến trình khác (--processes) vào thống kê này"""
+        with self._khoa:
+            for giai_doan, dem in thong_ke.items():
+                cua_giai_doan = self.thong_ke.setdefault(giai_doan, {'trung': 0, 'truot': 0})
+                for loai, so in dem.items():
+                    cua_giai_doan[loai] += so
@@ -0,0 +1,131 @@
+# cach_ly.py - Thư mục cách ly (dead-letter) các phiếu không xử lý được trong batch
+import os
+import json
+import shutil
+import hashlib
+import traceback
+from datetime import datetime
+
+import cv2
+
+from core.nguon_anh import ten_co_so, doc_anh_theo_khoa
+from core.han_chot import HetThoiGian
+
+# File mô tả lỗi trong thư mục của từng phiếu
+FILE_LOI = "loi.json"
+
+class ThuMucCachLy:
+    """
+    Mỗi phiếu lỗi (ngoại lệ, quá hạn thời gian, không tiền xử lý được) có một thư mục con gồm bản
+    sao đầu vào (file ảnh gốc, hoặc ảnh PNG đã decode với ảnh trong file nén / trang tài liệu) và
+    loi.json: việc của phiếu, lỗi, giai đoạn gây lỗi, traceback, thời gian từng giai đoạn và số lần
+    đã thử. Phiếu xử lý lại thành công được xóa khỏi thư mục cách ly.
+    
+    Mỗi phiếu chỉ ghi thư mục của chính nó nên nhiều tiến trình (--processes) dùng chung được.
+    """
+    
+    def __init__(self, thu_muc: str):
+        """
+        Args:
+            thu_muc: Thư mục cách ly (tạo khi có phiếu lỗi đầu tiên)
+        """
+        self.thu_muc = thu_muc
+    
+    def _thu_muc_phieu(self, khoa: str) -> str:
+        # Tên phiếu để dễ tìm, thêm mã băm khóa để hai phiếu cùng tên ở hai nguồn không đè nhau
+        ma = hashlib.blake2b(khoa.encode('utf-8'), digest_size=4).hexdigest()
+        return os.path.join(self.thu_muc, f"{ten_co_so(khoa).replace(os.sep, '_')}_{ma}")
+    
+    def ghi(self, viec: dict, loi, han_chot=None, anh=None, giai_doan: str = None) -> str:
+        """
+        Cách ly một phiếu lỗi
+        
+        Args:
+            viec: Dict việc của phiếu ('duong_dan_anh', 'file_ket_qua', ...)
+            loi: Exception hoặc thông báo lỗi
+            han_chot: HanChotPhieu của lần xử lý (thời gian từng giai đoạn, giai đoạn gây lỗi)
+            anh: Ảnh đã decode (ảnh trong file nén / trang tài liệu), None để đọc lại theo khóa
+            giai_doan: Giai đoạn gây lỗi khi han_chot không biết (ví dụ lỗi báo từ tiến trình khác)
+        
+        Returns:
+            Thư mục cách ly của phiếu
+        """
+        khoa = viec['duong_dan_anh']
+        thu_muc = self._thu_muc_phieu(khoa)
+        os.makedirs(thu_muc, exist_ok=True)
+        
+        ban_ghi_cu = self._doc_ban_ghi(thu_muc) or {}
+        ban_sao = self._sao_dau_vao(khoa, thu_muc, anh)
+        
+        if han_chot is not None and isinstance(loi, str) and han_chot.loi is not None:
+            loi = han_chot.loi  # Lỗi đã thành chuỗi (dây chuyền): lấy lại ngoại lệ gốc để có traceback
+        
+        ban_ghi = {
+            'viec': {khoa_viec: gia_tri for khoa_viec, gia_tri in viec.items()
+                     if isinstance(gia_tri, (str, int, float, type(None)))},
+            'loi': str(loi),
+            'loai_loi': type(loi).__name__ if isinstance(loi, BaseException) else None,
+            'giai_doan': (han_chot.giai_doan_loi if han_chot is not None else None) or giai_doan,
+            'het_thoi_gian': isinstance(loi, HetThoiGian),
+            'traceback': ''.join(traceback.format_exception(type(loi), loi, loi.__traceback__))
+                         if isinstance(loi, BaseException) else None,
+            'thoi_gian_giai_doan': dict(han_chot.thoi_gian_giai_doan) if han_chot is not None else {},
+            'thoi_gian_phieu': round(han_chot.thoi_gian_phieu(), 3) if han_chot is not None else None,
+            'ban_sao_dau_vao': ban_sao,
+            'so_lan_thu': ban_ghi_cu.get('so_lan_thu', 0) + 1,
+            'lan_dau': ban_ghi_cu.get('lan_dau') or datetime.now().isoformat(timespec='seconds'),
+            'lan_cuoi': datetime.now().isoformat(timespec='seconds')
+        }
+        
+        file_tam = os.path.join(thu_muc, f"{FILE_LOI}.{os.getpid()}.tmp")
+        with open(file_tam, 'w', encoding='utf-8') as f:
+            json.dump(ban_ghi, f, ensure_ascii=False, indent=2)
+        os.replace(file_tam, os.path.join(thu_muc, FILE_LOI))
+        return thu_muc
+    
+    def _sao_dau_vao(self, khoa: str, thu_muc: str, anh=None):
+        """Chép đầu vào của phiếu vào thư mục cách ly, trả về tên file (None nếu không đọc được đầu vào)"""
+        try:
+            if os.path.isfile(khoa):
+                ten = os.path.basename(khoa)
+                shutil.copy2(khoa, os.path.join(thu_muc, ten))
+                return ten
+            if anh is None:
+                anh = doc_anh_theo_khoa(khoa)
+            if anh is not None:
+                ten = "dau_vao.png"
+                cv2.imwrite(os.path.join(thu_muc, ten), anh)
+                return ten
+        except Exception as e:
+            print(f"[WARNING] Không chép được đầu vào {khoa} vào thư mục cách ly: {e}")
+        return None
+    
+    def _doc_ban_ghi(self, thu_muc: str):
+        try:
+            with open(os.path.join(thu_muc, FILE_LOI), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def xoa(self, khoa: str) -> bool:
+        """Xóa phiếu khỏi thư mục cách ly (sau khi xử lý lại thành công)"""
+        thu_muc = self._thu_muc_phieu(khoa)
+        if not os.path.isdir(thu_muc):
+            return False
+        shutil.rmtree(thu_muc, ignore_errors=True)
+        return True
+    
+    def danh_sach(self) -> list:
+        """Bản ghi loi.json của các phiếu đang bị cách ly"""
+        if not os.path.isdir(self.thu_muc):
+            return []
+        cac_ban_ghi = []
+        for ten in sorted(os.listdir(self.thu_muc)):
+            ban_ghi = self._doc_ban_ghi(os.path.join(self.thu_muc, ten))
+            if ban_ghi is not None:
+                cac_ban_ghi.append(ban_ghi)
+        return cac_ban_ghi
+    
+    def cac_khoa(self) -> set:
+        """Khóa (đường dẫn ảnh / nguồn#thành_viên) của các phiếu đang bị cách ly"""
+        return {ban_ghi['viec']['duong_dan_anh'] for ban_ghi in self.danh_sach()}
@@ -0,0 +1,211 @@
+# day_chuyen.py - Bộ thực thi dây chuyền nhiều giai đoạn nối với nhau bằng hàng đợi có giới hạn
+import queue
+import threading
+import time
+
+# Đánh dấu kết thúc luồng dữ liệu trong hàng đợi
+_KET_THUC = object()
+
+class GiaiDoan:
+    """
+    Một giai đoạn của dây chuyền: hàm xử lý một phần tử và số worker chạy hàm đó
+    """
+    
+    def __init__(self, ten: str, ham, so_worker: int = 1, kich_thuoc_hang_doi: int = 4):
+        """
+        Args:
+            ten: Tên giai đoạn (dùng khi in thống kê)
+            ham: Hàm nhận một phần tử, trả về phần tử cho giai đoạn sau
+            so_worker: Số luồng chạy giai đoạn này
+            kich_thuoc_hang_doi: Số phần tử tối đa chờ trước giai đoạn (giới hạn bộ nhớ)
+        """
+        if so_worker < 1:
+            raise ValueError(f"Số worker của giai đoạn {ten} phải >= 1")
+        if kich_thuoc_hang_doi < 1:
+            raise ValueError(f"Kích thước hàng đợi của giai đoạn {ten} phải >= 1")
+        
+        self.ten = ten
+        self.ham = ham
+        self.so_worker = so_worker
+        self.kich_thuoc_hang_doi = kich_thuoc_hang_doi
+
+class DayChuyen:
+    """
+    Chạy các giai đoạn song song theo kiểu dây chuyền: phần tử N+1 được tiền xử lý
+    trong khi phần tử N đang ở giai đoạn suy luận. Mỗi giai đoạn có hàng đợi đầu vào
+    có giới hạn, giai đoạn trước bị chặn khi giai đoạn sau chưa kịp xử lý (backpressure).
+    
+    Lỗi ở một giai đoạn không dừng dây chuyền: phần tử lỗi bỏ qua các giai đoạn còn lại
+    và được trả về cùng thông báo lỗi.
+    """
+    
+    def __init__(self, cac_giai_doan, chu_ky_theo_doi: float = 0.5):
+        """
+        Args:
+            cac_giai_doan: List GiaiDoan theo thứ tự
+            chu_ky_theo_doi: Chu kỳ (giây) lấy mẫu độ sâu các hàng đợi
+        """
+        if not cac_giai_doan:
+            raise ValueError("Dây chuyền cần ít nhất một giai đoạn")
+        
+        self.cac_giai_doan = list(cac_giai_doan)
+        self.chu_ky_theo_doi = chu_ky_theo_doi
+        self._hang_doi = []
+        self._dau_ra = None
+        self._thong_ke = {}
+        self._khoa_thong_ke = threading.Lock()
+    
+    def do_sau_hang_doi(self):
+        """Độ sâu hiện tại của hàng đợi trước từng giai đoạn"""
+        return {gd.ten: hd.qsize() for gd, hd in zip(self.cac_giai_doan, self._hang_doi)}
+    
+    def thong_ke(self):
+        """
+        Thống kê từng giai đoạn sau (hoặc trong khi) chạy
+        
+        Returns:
+            Dict: {tên giai đoạn: {so_worker, kich_thuoc_hang_doi, so_phan_tu, so_loi,
+                   thoi_gian_xu_ly, do_sau_toi_da, do_sau_trung_binh}}
+        """
+        ket_qua = {}
+        with self._khoa_thong_ke:
+            for gd in self.cac_giai_doan:
+                tk = self._thong_ke.get(gd.ten)
+                if tk is None:
+                    continue
+                so_mau = len(tk['mau_do_sau'])
+                ket_qua[gd.ten] = {
+                    'so_worker': gd.so_worker,
+                    'kich_thuoc_hang_doi': gd.kich_thuoc_hang_doi,
+                    'so_phan_tu': tk['so_phan_tu'],
+                    'so_loi': tk['so_loi'],
+                    'thoi_gian_xu_ly': round(tk['thoi_gian_xu_ly'], 3),
+                    'do_sau_toi_da': max(tk['mau_do_sau'], default=0),
+                    'do_sau_trung_binh': round(sum(tk['mau_do_sau']) / so_mau, 2) if so_mau else 0
+                }
+        return ket_qua
+    
+    def _lay_mau_do_sau(self):
+        with self._khoa_thong_ke:
+            for ten, do_sau in self.do_sau_hang_doi().items():
+                self._thong_ke[ten]['mau_do_sau'].append(do_sau)
+    
+    def _worker(self, chi_so):
+        giai_doan = self.cac_giai_doan[chi_so]
+        vao = self._hang_doi[chi_so]
+        ra = self._hang_doi[chi_so + 1] if chi_so + 1 < len(self._hang_doi) else self._dau_ra
+        
+        while True:
+            muc = vao.get()
+            if muc is _KET_THUC:
+                break
+            
+            thu_tu, phan_tu, loi = muc
+            if loi is None:
+                bat_dau = time.perf_counter()
+                try:
+                    phan_tu = giai_doan.ham(phan_tu)
+                except Exception as e:
+                    loi = f"{giai_doan.ten}: {e}"
+                thoi_gian = time.perf_counter() - bat_dau
+                
+                with self._khoa_thong_ke:
+                    tk = self._thong_ke[giai_doan.ten]
+                    tk['so_phan_tu'] += 1
+                    tk['thoi_gian_xu_ly'] += thoi_gian
+                    if loi is not None:
+                        tk['so_loi'] += 1
+            
+            ra.put((thu_tu, phan_tu, loi))
+    
+    def chay(self, cac_dau_vao):
+        """
+        Đưa tất cả phần tử qua dây chuyền
+        
+        Args:
+            cac_dau_vao: Iterable các phần tử đầu vào của giai đoạn đầu tiên
+        
+        Returns:
+            List (theo thứ tự đầu vào) các dict {'dau_vao', 'ket_qua', 'loi'}
+        """
+        cac_dau_vao = list(cac_dau_vao)
+        
+        self._hang_doi = [queue.Queue(maxsize=gd.kich_thuoc_hang_doi) for gd in self.cac_giai_doan]
+        self._dau_ra = queue.Queue()
+        self._thong_ke = {gd.ten: {'so_phan_tu': 0, 'so_loi': 0, 'thoi_gian_xu_ly': 0.0, 'mau_do_sau': []}
+                          for gd in self.cac_giai_doan}
+        
+        cac_nhom_worker = []
+        for chi_so, gd in enumerate(self.cac_giai_doan):
+            nhom = [threading.Thread(target=self._worker, args=(chi_so,), daemon=True,
+                                     name=f"day_chuyen_{gd.ten}_{i}")
+                    for i in range(gd.so_worker)]
+            for t in nhom:
+                t.start()
+            cac_nhom_worker.append(nhom)
+        
+        # Luồng lấy mẫu độ sâu hàng đợi
+        dung_theo_doi = threading.Event()
+        
+        def theo_doi():
+            while not dung_theo_doi.wait(self.chu_ky_theo_doi):
+                self._lay_mau_do_sau()
+        
+        luong_theo_doi = threading.Thread(target=theo_doi, daemon=True, name="day_chuyen_theo_doi")
+        luong_theo_doi.start()
+        
+        # Luồng nạp dữ liệu bị chặn khi hàng đợi đầu tiên đầy
+        def nap_du_lieu():
+            for thu_tu, phan_tu in enumerate(cac_dau_vao):
+                self._hang_doi[0].put((thu_tu, phan_tu, None))
+            for _ in range(self.cac_giai_doan[0].so_worker):
+                self._hang_doi[0].put(_KET_THUC)
+        
+        luong_nap = threading.Thread(target=nap_du_lieu, daemon=True, name="day_chuyen_nap")
+        luong_nap.start()
+        
+        # Khi toàn bộ worker của một giai đoạn dừng, báo kết thúc cho giai đoạn sau
+        for chi_so, nhom in enumerate(cac_nhom_worker):
+            for t in nhom:
+                t.join()
+            if chi_so + 1 < len(self.cac_giai_doan):
+                for _ in range(self.cac_giai_doan[chi_so + 1].so_worker):
+                    self._hang_doi[chi_so + 1].put(_KET_THUC)
+        
+        luong_nap.join()
+        dung_theo_doi.set()
+        luong_theo_doi.join()
+        self._lay_mau_do_sau()
+        
+        ket_qua = [None] * len(cac_dau_vao)
+        while not self._dau_ra.empty():
+            thu_tu, phan_tu, loi = self._dau_ra.get()
+            ket_qua[thu_tu] = {
+                'dau_vao': cac_dau_vao[thu_tu],
+                'ket_qua': phan_tu if loi is None else None,
+                'loi': loi
+            }
+        
+        return ket_qua
+
+def gop_thong_ke_day_chuyen(danh_sach_thong_ke):
+    """Gộp thống kê của nhiều dây chuyền giống nhau (ví dụ từ nhiều tiến trình) thành một"""
+    ket_qua = {}
+    for thong_ke in danh_sach_thong_ke:
+        for ten, tk in thong_ke.items():
+            if ten not in ket_qua:
+                ket_qua[ten] = dict(tk, do_sau_trung_binh=[])
+                ket_qua[ten]['do_sau_trung_binh'].append(tk['do_sau_trung_binh'])
+                continue
+            gop = ket_qua[ten]
+            gop['so_worker'] += tk['so_worker']
+            gop['so_phan_tu'] += tk['so_phan_tu']
+            gop['so_loi'] += tk['so_loi']
+            gop['thoi_gian_xu_ly'] = round(gop['thoi_gian_xu_ly'] + tk['thoi_gian_xu_ly'], 3)
+            gop['do_sau_toi_da'] = max(gop['do_sau_toi_da'], tk['do_sau_toi_da'])
+            gop['do_sau_trung_binh'].append(tk['do_sau_trung_binh'])
+    
+    for gop in ket_qua.values():
+        gop['do_sau_trung_binh'] = round(sum(gop['do_sau_trung_binh']) / len(gop['do_sau_trung_binh']), 2)
+    
+    return ket_qua
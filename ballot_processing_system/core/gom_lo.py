@@ -0,0 +1,132 @@
+# gom_lo.py - Gom yêu cầu suy luận từ nhiều phiếu đang xử lý thành lô lớn cho mô hình
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+# Đánh dấu dừng luồng gom lô
+_DUNG = object()
+
+class BoGomLo:
+    """
+    Nhận từng yêu cầu (một ô) từ nhiều luồng, gom thành lô và gọi hàm xử lý lô một lần.
+    Lô được gửi đi khi đủ kich_thuoc_lo_toi_da phần tử hoặc khi phần tử đầu tiên của lô
+    đã chờ quá thoi_gian_cho_toi_da giây. Kết quả được trả về từng yêu cầu qua Future.
+    """
+    
+    def __init__(self, ten: str, ham_xu_ly_lo, kich_thuoc_lo_toi_da: int = 32,
+                 thoi_gian_cho_toi_da: float = 0.02):
+        """
+        Args:
+            ten: Tên bộ gom lô (dùng khi in thống kê)
+            ham_xu_ly_lo: Hàm nhận list đầu vào, trả về list kết quả cùng thứ tự
+            kich_thuoc_lo_toi_da: Số phần tử tối đa trong một lô
+            thoi_gian_cho_toi_da: Thời gian (giây) tối đa giữ phần tử đầu tiên trước khi gửi lô
+        """
+        if kich_thuoc_lo_toi_da < 1:
+            raise ValueError(f"Kích thước lô của {ten} phải >= 1")
+        
+        self.ten = ten
+        self.ham_xu_ly_lo = ham_xu_ly_lo
+        self.kich_thuoc_lo_toi_da = kich_thuoc_lo_toi_da
+        self.thoi_gian_cho_toi_da = thoi_gian_cho_toi_da
+        
+        self._hang_doi = queue.Queue()
+        self._khoa_thong_ke = threading.Lock()
+        self._phan_bo_kich_thuoc_lo = Counter()
+        self._thoi_gian_xu_ly = 0.0
+        
+        self._luong = threading.Thread(target=self._vong_lap, daemon=True, name=f"gom_lo_{ten}")
+        self._luong.start()
+    
+    def gui(self, dau_vao) -> Future:
+        """Gửi một yêu cầu, trả về Future chứa kết quả"""
+        future = Future()
+        self._hang_doi.put((dau_vao, future))
+        return future
+    
+    def xu_ly(self, danh_sach_dau_vao) -> list:
+        """Gửi nhiều yêu cầu cùng lúc rồi chờ kết quả, giữ nguyên thứ tự"""
+        futures = [self.gui(dau_vao) for dau_vao in danh_sach_dau_vao]
+        return [future.result() for future in futures]
+    
+    def _vong_lap(self):
+        dung = False
+        while not dung:
+            muc = self._hang_doi.get()
+            if muc is _DUNG:
+                break
+            
+            lo = [muc]
+            han_chot = time.monotonic() + self.thoi_gian_cho_toi_da
+            while len(lo) < self.kich_thuoc_lo_toi_da:
+                con_lai = han_chot - time.monotonic()
+                try:
+                    # Lấy ngay các yêu cầu đã có sẵn, chỉ chờ khi hàng đợi rỗng
+                    muc = self._hang_doi.get_nowait() if con_lai <= 0 else self._hang_doi.get(timeout=con_lai)
+                except queue.Empty:
+                    break
+                if muc is _DUNG:
+                    dung = True
+                    break
+                lo.append(muc)
+            
+            self._gui_lo(lo)
+    
+    def _gui_lo(self, lo):
+        bat_dau = time.perf_counter()
+        try:
+            ket_qua = list(self.ham_xu_ly_lo([dau_vao for dau_vao, _ in lo]))
+            if len(ket_qua) != len(lo):
+                raise RuntimeError(f"{self.ten}: nhận {len(ket_qua)} kết quả cho lô {len(lo)} phần tử")
+        except Exception as e:
+            for _, future in lo:
+                future.set_exception(e)
+        else:
+            for (_, future), kq in zip(lo, ket_qua):
+                future.set_result(kq)
+        
+        with self._khoa_thong_ke:
+            self._phan_bo_kich_thuoc_lo[len(lo)] += 1
+            self._thoi_gian_xu_ly += time.perf_counter() - bat_dau
+    
+    def thong_ke(self):
+        """
+        Returns:
+            Dict: {so_lo, so_phan_tu, kich_thuoc_lo_trung_binh, thoi_gian_xu_ly,
+                   phan_bo_kich_thuoc_lo: {kích thước: số lô}}
+        """
+        with self._khoa_thong_ke:
+            so_lo = sum(self._phan_bo_kich_thuoc_lo.values())
+            so_phan_tu = sum(k * v for k, v in self._phan_bo_kich_thuoc_lo.items())
+            return {
+                'so_lo': so_lo,
+                'so_phan_tu': so_phan_tu,
+                'kich_thuoc_lo_trung_binh': round(so_phan_tu / so_lo, 2) if so_lo else 0,
+                'thoi_gian_xu_ly': round(self._thoi_gian_xu_ly, 3),
+                'phan_bo_kich_thuoc_lo': {str(k): v for k, v in sorted(self._phan_bo_kich_thuoc_lo.items())}
+            }
+    
+    def dong(self):
+        """Dừng luồng gom lô sau khi xử lý hết các yêu cầu đã gửi"""
+        self._hang_doi.put(_DUNG)
+        self._luong.join()
+
+def gop_thong_ke_gom_lo(danh_sach_thong_ke):
+    """Gộp thống kê của nhiều bộ gom lô cùng loại (ví dụ từ nhiều tiến trình) thành một"""
+    phan_bo = Counter()
+    thoi_gian_xu_ly = 0.0
+    for tk in danh_sach_thong_ke:
+        phan_bo.update({int(k): v for k, v in tk['phan_bo_kich_thuoc_lo'].items()})
+        thoi_gian_xu_ly += tk['thoi_gian_xu_ly']
+    
+    so_lo = sum(phan_bo.values())
+    so_phan_tu = sum(k * v for k, v in phan_bo.items())
+    return {
+        'so_lo': so_lo,
+        'so_phan_tu': so_phan_tu,
+        'kich_thuoc_lo_trung_binh': round(so_phan_tu / so_lo, 2) if so_lo else 0,
+        'thoi_gian_xu_ly': round(thoi_gian_xu_ly, 3),
+        'phan_bo_kich_thuoc_lo': {str(k): v for k, v in sorted(phan_bo.items())}
+    }
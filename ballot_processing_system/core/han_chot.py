@@ -0,0 +1,129 @@
+# han_chot.py - Giới hạn thời gian xử lý từng phiếu và từng giai đoạn, hủy phiếu chạy quá hạn
+import time
+import threading
+from contextlib import contextmanager
+
+# Các giai đoạn có thể đặt giới hạn riêng (trùng tên giai đoạn dây chuyền)
+CAC_GIAI_DOAN_GIOI_HAN = ('tien_xu_ly', 'ocr', 'phat_hien')
+
+class HetThoiGian(Exception):
+    """Phiếu bị hủy vì vượt giới hạn thời gian của cả phiếu hoặc của một giai đoạn"""
+    
+    def __init__(self, giai_doan: str, da_chay: float, gioi_han: float, ca_phieu: bool):
+        pham_vi = "cả phiếu" if ca_phieu else f"giai đoạn {giai_doan}"
+        super().__init__(f"Vượt thời gian {pham_vi}: {da_chay:.1f}s > {gioi_han:g}s (hủy ở {giai_doan})")
+        self.giai_doan = giai_doan
+        self.da_chay = da_chay
+        self.gioi_han = gioi_han
+        self.ca_phieu = ca_phieu
+
+def phan_tich_gioi_han_giai_doan(chuoi: str) -> dict:
+    """Chuỗi 'tien_xu_ly=10,ocr=30' -> {'tien_xu_ly': 10.0, 'ocr': 30.0}"""
+    gioi_han = {}
+    for cap in chuoi.split(','):
+        ten, so_giay = cap.split('=')
+        ten = ten.strip()
+        if ten not in CAC_GIAI_DOAN_GIOI_HAN:
+            raise ValueError(f"Giai đoạn không hợp lệ: {ten} (hỗ trợ: {', '.join(CAC_GIAI_DOAN_GIOI_HAN)})")
+        gioi_han[ten] = float(so_giay)
+    return gioi_han
+
+class HanChotPhieu:
+    """
+    Thời gian cho phép của một phiếu: tổng thời gian chạy của cả phiếu và của từng giai đoạn. Thời
+    gian cả phiếu chỉ tính lúc có giai đoạn đang chạy (thời gian chờ trong hàng đợi dây chuyền không
+    tính), các giai đoạn chạy đồng thời (--row-parallel) không bị cộng hai lần.
+    
+    Việc hủy là hợp tác: kiem_tra() được gọi khi bắt đầu / kết thúc mỗi giai đoạn và giữa các dòng
+    OCR, các lô YOLO. Một lời gọi OpenCV / mô hình đang chạy không bị ngắt giữa chừng, nhưng phiếu
+    quá hạn không chạy thêm bước nào, kể cả kết quả của giai đoạn vừa xong quá hạn cũng bị bỏ.
+    
+    Đồng thời ghi lại thời gian từng giai đoạn và giai đoạn gây lỗi (cho bản ghi cách ly).
+    """
+    
+    def __init__(self, gioi_han_phieu: float = None, gioi_han_giai_doan: dict = None):
+        """
+        Args:
+            gioi_han_phieu: Số giây tối đa của cả phiếu (None: không giới hạn)
+            gioi_han_giai_doan: Dict {giai đoạn: số giây tối đa}
+        """
+        self.gioi_han_phieu = gioi_han_phieu
+        self.gioi_han_giai_doan = gioi_han_giai_doan or {}
+        self.thoi_gian_giai_doan = {}
+        self.giai_doan_loi = None
+        self.loi = None
+        self._khoa = threading.Lock()
+        
+        # Giai đoạn đang chạy -> thời điểm bắt đầu; thời gian đã chạy của các khoảng có giai đoạn chạy
+        self._dang_chay = {}
+        self._da_chay = 0.0
+        self._bat_dau_khoang = None
+    
+    def thoi_gian_phieu(self, bay_gio: float = None) -> float:
+        """Tổng thời gian có ít nhất một giai đoạn của phiếu đang chạy"""
+        with self._khoa:
+            if self._bat_dau_khoang is None:
+                return self._da_chay
+            return self._da_chay + (bay_gio or time.monotonic()) - self._bat_dau_khoang
+    
+    def kiem_tra(self, giai_doan: str = None):
+        """
+        Raise HetThoiGian nếu phiếu hoặc một giai đoạn đang chạy đã quá hạn
+        
+        Args:
+            giai_doan: Giai đoạn đang gọi kiểm tra (chỉ dùng trong thông báo lỗi)
+        """
+        bay_gio = time.monotonic()
+        da_chay = self.thoi_gian_phieu(bay_gio)
+        with self._khoa:
+            cac_giai_doan = dict(self._dang_chay)
+        giai_doan = giai_doan or next(iter(cac_giai_doan), None) or 'phieu'
+        
+        if self.gioi_han_phieu and da_chay > self.gioi_han_phieu:
+            raise HetThoiGian(giai_doan, da_chay, self.gioi_han_phieu, ca_phieu=True)
+        for ten, bat_dau in cac_giai_doan.items():
+            gioi_han = self.gioi_han_giai_doan.get(ten)
+            if gioi_han and bay_gio - bat_dau > gioi_han:
+                raise HetThoiGian(ten, bay_gio - bat_dau, gioi_han, ca_phieu=False)
+    
+    @contextmanager
+    def giai_doan(self, ten: str):
+        """Chạy một giai đoạn của phiếu: đo thời gian, kiểm tra hạn khi bắt đầu và khi kết thúc"""
+        with self._khoa:
+            bat_dau = time.monotonic()
+            if not self._dang_chay:
+                self._bat_dau_khoang = bat_dau
+            self._dang_chay[ten] = bat_dau
+        
+        try:
+            self.kiem_tra(ten)
+            yield self
+            self.kiem_tra(ten)
+        except BaseException as e:
+            if self.loi is None:
+                self.loi, self.giai_doan_loi = e, ten
+            raise
+        finally:
+            with self._khoa:
+                bay_gio = time.monotonic()
+                del self._dang_chay[ten]
+                self.thoi_gian_giai_doan[ten] = round(self.thoi_gian_giai_doan.get(ten, 0) + bay_gio - bat_dau, 3)
+                if not self._dang_chay:
+                    self._da_chay += bay_gio - self._bat_dau_khoang
+                    self._bat_dau_khoang = None
+    
+    def ghi_giai_doan(self, ten: str, thoi_gian: float):
+        """Ghi nhận giai đoạn đã chạy ở nơi khác (tiến trình tiền xử lý) rồi kiểm tra hạn của nó"""
+        with self._khoa:
+            self.thoi_gian_giai_doan[ten] = round(thoi_gian, 3)
+            self._da_chay += thoi_gian
+        
+        gioi_han = self.gioi_han_giai_doan.get(ten)
+        if gioi_han and thoi_gian > gioi_han:
+            loi = HetThoiGian(ten, thoi_gian, gioi_han, ca_phieu=False)
+        elif self.gioi_han_phieu and self.thoi_gian_phieu() > self.gioi_han_phieu:
+            loi = HetThoiGian(ten, self.thoi_gian_phieu(), self.gioi_han_phieu, ca_phieu=True)
+        else:
+            return
+        self.loi, self.giai_doan_loi = loi, ten
+        raise loi
@@ -0,0 +1,209 @@
+# hang_doi_cong_viec.py - Hàng đợi phiếu trên một file SQLite dùng chung, cho nhiều máy / nhiều tiến trình
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Trạng thái của một việc
+CHO = 'cho'
+DANG_XU_LY = 'dang_xu_ly'
+XONG = 'xong'
+LOI = 'loi'
+
+_LUOC_DO = """
+CREATE TABLE IF NOT EXISTS viec (
+    id INTEGER PRIMARY KEY,
+    khoa TEXT UNIQUE NOT NULL,
+    file_ket_qua TEXT NOT NULL,
+    trang_thai TEXT NOT NULL DEFAULT 'cho',
+    nguoi_xu_ly TEXT,
+    het_han_thue REAL,
+    ma_thue INTEGER NOT NULL DEFAULT 0,
+    so_lan_thu INTEGER NOT NULL DEFAULT 0,
+    ket_qua TEXT,
+    loi TEXT,
+    thoi_gian_xong REAL
+);
+CREATE INDEX IF NOT EXISTS viec_trang_thai ON viec (trang_thai, het_han_thue);
+"""
+
+def ten_worker_mac_dinh() -> str:
+    """Tên worker: máy + pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class HangDoiCongViec:
+    """
+    Hàng đợi phiếu trên một file SQLite đặt trên ổ dùng chung (NFS). Worker nhận việc kèm một lượt
+    thuê (lease) có hạn, gia hạn định kỳ bằng nhịp tim; worker chết thì lượt thuê hết hạn và việc
+    được worker khác nhận lại. Mỗi lần nhận việc tăng ma_thue, và kết quả chỉ được ghi khi ma_thue
+    còn khớp, nên một phiếu chỉ có đúng một kết quả được ghi nhận dù worker cũ chạy xong muộn.
+    
+    SQLite dựa vào khóa file của hệ điều hành: NFS phải hỗ trợ khóa POSIX (NFSv4, hoặc NFSv3 có lockd).
+    Không dùng chế độ WAL vì WAL cần bộ nhớ chung, không hoạt động qua mạng. Đồng hồ các máy dùng để
+    tính hạn thuê, nên thoi_gian_thue phải lớn hơn nhiều so với độ lệch đồng hồ giữa các máy.
+    """
+    
+    def __init__(self, duong_dan: str, thoi_gian_thue: float = 120.0, so_lan_thu_toi_da: int = 3):
+        """
+        Args:
+            duong_dan: File SQLite (tạo mới nếu chưa có)
+            thoi_gian_thue: Số giây một lượt thuê có hiệu lực nếu không được gia hạn
+            so_lan_thu_toi_da: Số lần nhận một việc tối đa trước khi đánh dấu lỗi
+        """
+        self.duong_dan = duong_dan
+        self.thoi_gian_thue = thoi_gian_thue
+        self.so_lan_thu_toi_da = so_lan_thu_toi_da
+        # Mỗi luồng (và mỗi tiến trình sau fork) dùng kết nối riêng
+        self._cuc_bo = threading.local()
+        # executescript tự commit nên không chạy trong _giao_dich; CREATE ... IF NOT EXISTS chạy lại không sao
+        self._ket_noi().executescript(_LUOC_DO)
+    
+    def _ket_noi(self):
+        ket_noi = getattr(self._cuc_bo, 'ket_noi', None)
+        if ket_noi is None or self._cuc_bo.pid != os.getpid():
+            ket_noi = sqlite3.connect(self.duong_dan, timeout=60, isolation_level=None)
+            ket_noi.row_factory = sqlite3.Row
+            ket_noi.execute("PRAGMA journal_mode=DELETE")
+            self._cuc_bo.ket_noi = ket_noi
+            self._cuc_bo.pid = os.getpid()
+        return ket_noi
+    
+    @contextmanager
+    def _giao_dich(self):
+        """Giao dịch ghi: khóa ghi được lấy ngay khi bắt đầu để hai worker không nhận cùng một việc"""
+        ket_noi = self._ket_noi()
+        ket_noi.execute("BEGIN IMMEDIATE")
+        try:
+            yield ket_noi
+        except BaseException:
+            ket_noi.execute("ROLLBACK")
+            raise
+        ket_noi.execute("COMMIT")
+    
+    def them_viec(self, danh_sach_viec) -> int:
+        """
+        Thêm phiếu vào hàng đợi; phiếu đã có (cùng khóa) được bỏ qua nên thêm lại nhiều lần không sao
+        
+        Args:
+            danh_sach_viec: List dict {'duong_dan_anh', 'file_ket_qua'}
+        
+        Returns:
+            Số phiếu mới được thêm
+        """
+        with self._giao_dich() as ket_noi:
+            truoc = ket_noi.total_changes
+            ket_noi.executemany("INSERT OR IGNORE INTO viec (khoa, file_ket_qua) VALUES (?, ?)",
+                                [(viec['duong_dan_anh'], viec['file_ket_qua']) for viec in danh_sach_viec])
+            return ket_noi.total_changes - truoc
+    
+    def nhan_viec(self, nguoi_xu_ly: str, so_luong: int = 1):
+        """
+        Nhận việc đang chờ hoặc việc có lượt thuê đã hết hạn (worker cũ đã chết)
+        
+        Returns:
+            List dict {'id', 'khoa', 'file_ket_qua', 'ma_thue', 'so_lan_thu'}
+        """
+        bay_gio = time.time()
+        with self._giao_dich() as ket_noi:
+            # Việc hết hạn đã nhận đủ số lần thì coi là lỗi (thường là phiếu làm worker chết)
+            ket_noi.execute("UPDATE viec SET trang_thai = ?, loi = 'Hết hạn thuê sau ' || so_lan_thu || ' lần thử' "
+                            "WHERE trang_thai = ? AND het_han_thue < ? AND so_lan_thu >= ?",
+                            (LOI, DANG_XU_LY, bay_gio, self.so_lan_thu_toi_da))
+            cac_dong = ket_noi.execute(
+                "SELECT id FROM viec WHERE trang_thai = ? OR (trang_thai = ? AND het_han_thue < ?) "
+                "ORDER BY id LIMIT ?", (CHO, DANG_XU_LY, bay_gio, so_luong)).fetchall()
+            cac_id = [dong['id'] for dong in cac_dong]
+            ket_noi.executemany(
+                "UPDATE viec SET trang_thai = ?, nguoi_xu_ly = ?, het_han_thue = ?, "
+                "ma_thue = ma_thue + 1, so_lan_thu = so_lan_thu + 1 WHERE id = ?",
+                [(DANG_XU_LY, nguoi_xu_ly, bay_gio + self.thoi_gian_thue, id_viec) for id_viec in cac_id])
+            if not cac_id:
+                return []
+            cho = ','.join('?' * len(cac_id))
+            return [dict(dong) for dong in ket_noi.execute(
+                f"SELECT id, khoa, file_ket_qua, ma_thue, so_lan_thu FROM viec WHERE id IN ({cho}) ORDER BY id",
+                cac_id)]
+    
+    def gia_han(self, viec: dict) -> bool:
+        """Gia hạn lượt thuê; False nếu lượt thuê đã mất (hết hạn và worker khác đã nhận)"""
+        with self._giao_dich() as ket_noi:
+            return ket_noi.execute(
+                "UPDATE viec SET het_han_thue = ? WHERE id = ? AND ma_thue = ? AND trang_thai = ?",
+                (time.time() + self.thoi_gian_thue, viec['id'], viec['ma_thue'], DANG_XU_LY)).rowcount == 1
+    
+    def hoan_thanh(self, viec: dict, ket_qua) -> bool:
+        """
+        Ghi nhận kết quả nếu lượt thuê vẫn còn hiệu lực (đúng ma_thue)
+        
+        Returns:
+            True nếu kết quả này là kết quả duy nhất được ghi nhận của phiếu
+        """
+        with self._giao_dich() as ket_noi:
+            return ket_noi.execute(
+                "UPDATE viec SET trang_thai = ?, ket_qua = ?, loi = NULL, thoi_gian_xong = ?, het_han_thue = NULL "
+                "WHERE id = ? AND ma_thue = ? AND trang_thai = ?",
+                (XONG, json.dumps(ket_qua, ensure_ascii=False), time.time(),
+                 viec['id'], viec['ma_thue'], DANG_XU_LY)).rowcount == 1
+    
+    def bao_loi(self, viec: dict, loi: str) -> bool:
+        """Trả việc về hàng đợi để thử lại, hoặc đánh dấu lỗi khi đã thử đủ số lần"""
+        with self._giao_dich() as ket_noi:
+            return ket_noi.execute(
+                "UPDATE viec SET trang_thai = CASE WHEN so_lan_thu >= ? THEN ? ELSE ? END, loi = ?, "
+                "het_han_thue = NULL WHERE id = ? AND ma_thue = ? AND trang_thai = ?",
+                (self.so_lan_thu_toi_da, LOI, CHO, loi, viec['id'], viec['ma_thue'], DANG_XU_LY)).rowcount == 1
+    
+    @contextmanager
+    def giu_thue(self, viec: dict, chu_ky: float = None):
+        """
+        Gia hạn lượt thuê định kỳ trên một luồng nền trong lúc xử lý việc
+        
+        Yields:
+            threading.Event được set khi lượt thuê bị mất
+        """
+        chu_ky = chu_ky or self.thoi_gian_thue / 3
+        dung = threading.Event()
+        mat_thue = threading.Event()
+        
+        def nhip_tim():
+            while not dung.wait(chu_ky):
+                try:
+                    if not self.gia_han(viec):
+                        mat_thue.set()
+                        return
+                except sqlite3.Error as e:
+                    # Lỗi tạm thời của ổ mạng - thử lại ở nhịp sau, lượt thuê còn thời gian
+                    print(f"[WARNING] Không gia hạn được việc {viec['id']}: {e}")
+        
+        luong = threading.Thread(target=nhip_tim, name=f"nhip_tim_{viec['id']}", daemon=True)
+        luong.start()
+        try:
+            yield mat_thue
+        finally:
+            dung.set()
+            luong.join()
+    
+    def thong_ke(self) -> dict:
+        """Số việc theo trạng thái"""
+        dem = {CHO: 0, DANG_XU_LY: 0, XONG: 0, LOI: 0}
+        for dong in self._ket_noi().execute("SELECT trang_thai, COUNT(*) AS so FROM viec GROUP BY trang_thai"):
+            dem[dong['trang_thai']] = dong['so']
+        return dem
+    
+    def ket_qua(self):
+        """
+        Returns:
+            List dict {'khoa', 'file_ket_qua', 'trang_thai', 'ket_qua', 'loi'} của các việc đã xong hoặc lỗi
+        """
+        return [{
+            'khoa': dong['khoa'],
+            'file_ket_qua': dong['file_ket_qua'],
+            'trang_thai': dong['trang_thai'],
+            'ket_qua': json.loads(dong['ket_qua']) if dong['ket_qua'] else [],
+            'loi': dong['loi']
+        } for dong in self._ket_noi().execute(
+            "SELECT khoa, file_ket_qua, trang_thai, ket_qua, loi FROM viec WHERE trang_thai IN (?, ?) ORDER BY id",
+            (XONG, LOI))]
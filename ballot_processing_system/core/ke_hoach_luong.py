@@ -0,0 +1,129 @@
+# ke_hoach_luong.py - Chia lõi CPU giữa tiến trình, tiền xử lý OpenCV và suy luận mô hình
+import os
+
+import cv2
+
+# Import torch (không bắt buộc với processor chỉ dùng OpenCV)
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Biến môi trường giới hạn luồng của các thư viện BLAS/OpenMP. Chỉ có hiệu lực với thư viện
+# được load sau khi đặt (ví dụ trong tiến trình con), torch và OpenCV được đặt trực tiếp qua API.
+BIEN_MOI_TRUONG_LUONG = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+def lay_danh_sach_loi():
+    """Danh sách lõi CPU tiến trình hiện tại được phép dùng"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def lap_ke_hoach(so_loi: int = None,
+                 so_tien_trinh: int = 1,
+                 so_worker_tien_xu_ly: int = 0,
+                 so_worker_mo_hinh: int = 1,
+                 ghim_cpu: bool = False) -> dict:
+    """
+    Lập kế hoạch luồng cho toàn bộ lần chạy
+    
+    Mỗi tiến trình (shard) nhận một khối lõi riêng. Trong một tiến trình, mỗi worker tiền xử lý
+    chạy OpenCV một luồng trên một lõi riêng (song song theo phiếu), phần lõi còn lại chia đều
+    cho các worker mô hình chạy đồng thời. Khi không có worker tiền xử lý riêng, OpenCV và mô hình
+    chạy lần lượt nên cả hai dùng toàn bộ khối lõi.
+    
+    Args:
+        so_loi: Số lõi được dùng (None: tất cả lõi tiến trình được phép dùng)
+        so_tien_trinh: Số tiến trình xử lý batch (--processes)
+        so_worker_tien_xu_ly: Số worker tiền xử lý chạy song song với mô hình trong mỗi tiến trình
+        so_worker_mo_hinh: Số worker gọi mô hình đồng thời trong mỗi tiến trình (ví dụ OCR + YOLO = 2)
+        ghim_cpu: Ghim từng tiến trình / worker tiền xử lý vào khối lõi của nó
+    
+    Returns:
+        Dict kế hoạch, dùng với ap_dung_ke_hoach
+    """
+    danh_sach_loi = lay_danh_sach_loi()
+    if so_loi:
+        danh_sach_loi = danh_sach_loi[:so_loi]
+    
+    so_tien_trinh = max(1, so_tien_trinh)
+    so_worker_mo_hinh = max(1, so_worker_mo_hinh)
+    loi_moi_tien_trinh = max(1, len(danh_sach_loi) // so_tien_trinh)
+    
+    cac_tien_trinh = []
+    for chi_so in range(so_tien_trinh):
+        khoi = danh_sach_loi[chi_so * loi_moi_tien_trinh:(chi_so + 1) * loi_moi_tien_trinh]
+        if not khoi:
+            # Nhiều tiến trình hơn số lõi - dùng chung lõi theo vòng
+            khoi = [danh_sach_loi[chi_so % len(danh_sach_loi)]]
+        
+        # Luôn giữ ít nhất một lõi cho mô hình
+        so_loi_tien_xu_ly = min(so_worker_tien_xu_ly, len(khoi) - 1)
+        cac_tien_trinh.append({
+            'loi_tien_xu_ly': khoi[:so_loi_tien_xu_ly],
+            'loi_mo_hinh': khoi[so_loi_tien_xu_ly:]
+        })
+    
+    so_loi_mo_hinh = len(cac_tien_trinh[0]['loi_mo_hinh'])
+    
+    return {
+        'so_loi': len(danh_sach_loi),
+        'so_tien_trinh': so_tien_trinh,
+        'so_worker_tien_xu_ly': so_worker_tien_xu_ly,
+        'so_worker_mo_hinh': so_worker_mo_hinh,
+        'torch_threads': max(1, so_loi_mo_hinh // so_worker_mo_hinh),
+        'torch_interop_threads': 1,
+        # Tiền xử lý song song theo phiếu thì OpenCV chạy một luồng, tránh tranh lõi với mô hình
+        'cv2_threads': 1 if so_worker_tien_xu_ly else loi_moi_tien_trinh,
+        'ghim_cpu': ghim_cpu,
+        'cac_tien_trinh': cac_tien_trinh
+    }
+
+def ap_dung_ke_hoach(ke_hoach: dict, vai_tro: str = "mo_hinh", chi_so_tien_trinh: int = 0):
+    """
+    Áp dụng kế hoạch cho tiến trình hiện tại
+    
+    Args:
+        ke_hoach: Kết quả của lap_ke_hoach
+        vai_tro: "mo_hinh" - tiến trình chạy mô hình (tiến trình chính hoặc shard),
+                 "tien_xu_ly" - tiến trình chỉ chạy tiền xử lý OpenCV
+        chi_so_tien_trinh: Chỉ số shard của tiến trình hiện tại
+    """
+    if not ke_hoach:
+        return
+    
+    tien_trinh = ke_hoach['cac_tien_trinh'][chi_so_tien_trinh % len(ke_hoach['cac_tien_trinh'])]
+    
+    if vai_tro == "tien_xu_ly":
+        cv2.setNumThreads(1)
+        so_luong_blas = 1
+        loi = tien_trinh['loi_tien_xu_ly'] or tien_trinh['loi_mo_hinh']
+    else:
+        cv2.setNumThreads(ke_hoach['cv2_threads'])
+        so_luong_blas = ke_hoach['torch_threads']
+        loi = tien_trinh['loi_mo_hinh'] + tien_trinh['loi_tien_xu_ly']
+        
+        if torch is not None:
+            torch.set_num_threads(ke_hoach['torch_threads'])
+            try:
+                torch.set_num_interop_threads(ke_hoach['torch_interop_threads'])
+            except RuntimeError:
+                # Chỉ đặt được trước khi torch chạy tác vụ song song đầu tiên
+                pass
+    
+    for bien in BIEN_MOI_TRUONG_LUONG:
+        os.environ[bien] = str(so_luong_blas)
+    
+    if ke_hoach['ghim_cpu'] and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, loi)
+
+def in_ke_hoach(ke_hoach: dict):
+    """In kế hoạch luồng"""
+    print(f"[INFO] Kế hoạch luồng: {ke_hoach['so_loi']} lõi, {ke_hoach['so_tien_trinh']} tiến trình, "
+          f"{ke_hoach['so_worker_tien_xu_ly']} worker tiền xử lý + {ke_hoach['so_worker_mo_hinh']} worker mô hình "
+          f"mỗi tiến trình")
+    print(f"[INFO]   torch: {ke_hoach['torch_threads']} luồng (interop {ke_hoach['torch_interop_threads']}), "
+          f"OpenCV: {ke_hoach['cv2_threads']} luồng, ghim CPU: {'có' if ke_hoach['ghim_cpu'] else 'không'}")
+    for chi_so, tien_trinh in enumerate(ke_hoach['cac_tien_trinh']):
+        print(f"[INFO]   Tiến trình {chi_so}: lõi mô hình {tien_trinh['loi_mo_hinh']}, "
+              f"lõi tiền xử lý {tien_trinh['loi_tien_xu_ly']}")
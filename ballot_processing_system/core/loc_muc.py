@@ -0,0 +1,117 @@
+import cv2
+import numpy as np
+
+# Tỉ lệ lề bỏ đi ở mỗi cạnh ô để không tính đường kẻ bảng vào lượng mực
+LE_TRONG_MAC_DINH = 0.15
+
+def nhi_phan_hoa(image):
+    """Chuyển ảnh sang nhị phân (1 = mực, 0 = nền) bằng Otsu"""
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return binary
+
+def tinh_ti_le_muc(anh_phang, danh_sach_vung, le_trong=LE_TRONG_MAC_DINH, binary=None):
+    """
+    Tính tỉ lệ điểm mực bên trong nhiều ô cùng lúc bằng ảnh tích phân
+    
+    Args:
+        anh_phang: Ảnh phiếu bầu đã làm phẳng
+        danh_sach_vung: List (x1, y1, x2, y2) các ô trên ảnh phẳng
+        le_trong: Tỉ lệ lề bỏ đi ở mỗi cạnh ô
+        binary: Ảnh nhị phân của cả phiếu nếu đã tính sẵn (None để tự nhị phân hóa)
+    
+    Returns:
+        np.ndarray: Tỉ lệ mực (0-1) của từng ô, cùng thứ tự với danh_sach_vung
+    """
+    vung = np.asarray(danh_sach_vung, dtype=np.float64).reshape(-1, 4)
+    
+    if len(vung) == 0:
+        return np.zeros(0, dtype=np.float64)
+    
+    h, w = anh_phang.shape[:2]
+    if binary is not None:
+        x0, y0, x1, y1 = 0, 0, w, h
+    else:
+        # Chỉ nhị phân hóa dải bao các ô để Otsu không bị ảnh hưởng bởi phần còn lại của phiếu
+        x0 = int(np.clip(vung[:, 0].min(), 0, w))
+        y0 = int(np.clip(vung[:, 1].min(), 0, h))
+        x1 = int(np.clip(vung[:, 2].max(), 0, w))
+        y1 = int(np.clip(vung[:, 3].max(), 0, h))
+        binary = nhi_phan_hoa(anh_phang[y0:y1, x0:x1])
+    
+    # Ảnh tích phân: ii[y, x] = tổng mực trong binary[:y, :x]
+    ii = cv2.integral(binary)
+    
+    # Thu nhỏ từng ô theo lề rồi đổi sang tọa độ của dải
+    rong = vung[:, 2] - vung[:, 0]
+    cao = vung[:, 3] - vung[:, 1]
+    tx1 = np.clip(np.round(vung[:, 0] + rong * le_trong) - x0, 0, x1 - x0).astype(np.int64)
+    ty1 = np.clip(np.round(vung[:, 1] + cao * le_trong) - y0, 0, y1 - y0).astype(np.int64)
+    tx2 = np.clip(np.round(vung[:, 2] - rong * le_trong) - x0, 0, x1 - x0).astype(np.int64)
+    ty2 = np.clip(np.round(vung[:, 3] - cao * le_trong) - y0, 0, y1 - y0).astype(np.int64)
+    tx2 = np.maximum(tx2, tx1)
+    ty2 = np.maximum(ty2, ty1)
+    
+    tong_muc = ii[ty2, tx2] - ii[ty1, tx2] - ii[ty2, tx1] + ii[ty1, tx1]
+    dien_tich = np.maximum((tx2 - tx1) * (ty2 - ty1), 1)
+    
+    return tong_muc / dien_tich
+
+def cat_vung_trong(binary, vung, le_trong=LE_TRONG_MAC_DINH):
+    """Cắt phần bên trong một ô (đã bỏ lề) từ ảnh nhị phân của cả phiếu"""
+    x1, y1, x2, y2 = vung
+    le_x = int(round((x2 - x1) * le_trong))
+    le_y = int(round((y2 - y1) * le_trong))
+    return binary[y1 + le_y:y2 - le_y, x1 + le_x:x2 - le_x]
+
+def phan_tich_net_but(o_nhi_phan, ti_le_do_dai_toi_thieu=0.3):
+    """
+    Phát hiện các nét thẳng trong một ô nhị phân bằng biến đổi Hough
+    
+    Một nét bút dày cho ra nhiều đoạn thẳng song song, vì vậy kết quả là tổng độ dài
+    các đoạn theo từng hướng, chia cho đường chéo của ô
+    
+    Args:
+        o_nhi_phan: Ảnh nhị phân của ô (1 = mực)
+        ti_le_do_dai_toi_thieu: Độ dài đoạn tối thiểu so với cạnh ngắn của ô
+    
+    Returns:
+        Dict: Độ dài tương đối các nét chéo xuôi (\\), chéo ngược (/), ngang, dọc
+    """
+    ket_qua = {
+        'cheo_xuoi': 0.0,
+        'cheo_nguoc': 0.0,
+        'ngang': 0.0,
+        'doc': 0.0
+    }
+    
+    h, w = o_nhi_phan.shape[:2]
+    if h == 0 or w == 0:
+        return ket_qua
+    
+    do_dai_toi_thieu = max(5, int(min(h, w) * ti_le_do_dai_toi_thieu))
+    lines = cv2.HoughLinesP(o_nhi_phan.astype(np.uint8) * 255, 1, np.pi / 180, threshold=20,
+                            minLineLength=do_dai_toi_thieu, maxLineGap=5)
+    
+    if lines is None:
+        return ket_qua
+    
+    duong_cheo = float(np.hypot(h, w))
+    for x1, y1, x2, y2 in lines.reshape(-1, 4):
+        do_dai = float(np.hypot(x2 - x1, y2 - y1)) / duong_cheo
+        # Góc trong khoảng [0, 180), trục y hướng xuống
+        goc = np.degrees(np.arctan2(y2 - y1, x2 - x1)) % 180
+        if goc < 20 or goc >= 160:
+            ket_qua['ngang'] += do_dai
+        elif 70 <= goc < 110:
+            ket_qua['doc'] += do_dai
+        elif goc < 90:
+            ket_qua['cheo_xuoi'] += do_dai
+        else:
+            ket_qua['cheo_nguoc'] += do_dai
+    
+    return ket_qua
@@ -0,0 +1,139 @@
+# luong_stdin.py - Đọc phiếu bầu từ stdin, ghi kết quả từng phiếu ra stdout dạng JSON Lines
+import json
+import time
+
+import cv2
+import numpy as np
+
+from core.tien_xu_ly import CAC_LAYOUT
+
+def doc_duong_dan(nguon):
+    """
+    Đọc danh sách phiếu dạng văn bản: mỗi dòng một đường dẫn ảnh,
+    hoặc một object JSON {"duong_dan", "ten", "layout"}
+    
+    Args:
+        nguon: File văn bản (ví dụ sys.stdin)
+    
+    Yields:
+        Dict {'ten', 'duong_dan', 'du_lieu_anh', 'layout', 'loi'}
+    """
+    for dong in nguon:
+        dong = dong.strip()
+        if not dong:
+            continue
+        
+        if dong.startswith('{'):
+            try:
+                muc = json.loads(dong)
+            except ValueError as e:
+                yield {'ten': dong, 'duong_dan': None, 'du_lieu_anh': None, 'layout': None,
+                       'loi': f"JSON không hợp lệ: {e}"}
+                continue
+        else:
+            muc = {'duong_dan': dong}
+        
+        duong_dan = muc.get('duong_dan')
+        yield {
+            'ten': muc.get('ten', duong_dan),
+            'duong_dan': duong_dan,
+            'du_lieu_anh': None,
+            'layout': muc.get('layout'),
+            'loi': None if duong_dan else "Thiếu khóa 'duong_dan'"
+        }
+
+def doc_khung_anh(nguon):
+    """
+    Đọc ảnh đã mã hóa (JPEG/PNG...) theo khung có độ dài: mỗi khung gồm dòng tiêu đề
+    "<số byte> [tên]\\n" rồi đúng số byte đó. Chỉ giữ một ảnh trong bộ nhớ mỗi lúc.
+    
+    Args:
+        nguon: File nhị phân (ví dụ sys.stdin.buffer)
+    
+    Yields:
+        Dict {'ten', 'duong_dan', 'du_lieu_anh', 'layout', 'loi'}
+    """
+    so_thu_tu = 0
+    while True:
+        tieu_de = nguon.readline()
+        if not tieu_de:
+            break
+        tieu_de = tieu_de.decode('utf-8').strip()
+        if not tieu_de:
+            continue
+        
+        so_byte, _, ten = tieu_de.partition(' ')
+        try:
+            so_byte = int(so_byte)
+        except ValueError:
+            # Không biết ảnh kết thúc ở đâu nên không thể đọc tiếp các khung sau
+            raise ValueError(f"Tiêu đề khung không hợp lệ: {tieu_de[:80]!r}")
+        
+        du_lieu = nguon.read(so_byte)
+        if len(du_lieu) < so_byte:
+            raise EOFError(f"Khung '{ten}' thiếu dữ liệu: cần {so_byte} byte, nhận {len(du_lieu)} byte")
+        
+        so_thu_tu += 1
+        yield {
+            'ten': ten or f"stdin_{so_thu_tu}",
+            'duong_dan': None,
+            'du_lieu_anh': du_lieu,
+            'layout': None,
+            'loi': None
+        }
+
+def chay_luong(cac_muc, ham_xu_ly, dau_ra, layout_mac_dinh: str = None) -> dict:
+    """
+    Xử lý từng phiếu ngay khi đọc được và ghi một dòng JSON kết quả, flush sau mỗi phiếu.
+    Không giữ kết quả các phiếu đã xong nên bộ nhớ không tăng theo số phiếu.
+    
+    Args:
+        cac_muc: Iterable từ doc_duong_dan hoặc doc_khung_anh
+        ham_xu_ly: Hàm (ten, anh, layout) -> list kết quả dòng; anh là ảnh BGR đã decode
+                   hoặc None (đọc từ ten là đường dẫn), layout là dict layout hoặc None
+        dau_ra: File văn bản nhận các dòng JSON (stdout thật)
+        layout_mac_dinh: Tên layout dùng khi phiếu không chỉ định
+    
+    Returns:
+        Dict {so_phieu, thanh_cong, loi, thoi_gian}
+    """
+    thong_ke = {'so_phieu': 0, 'thanh_cong': 0, 'loi': 0}
+    bat_dau_luong = time.perf_counter()
+    
+    for muc in cac_muc:
+        bat_dau = time.perf_counter()
+        ket_qua = []
+        loi = muc['loi']
+        
+        if loi is None:
+            try:
+                ten_layout = muc['layout'] or layout_mac_dinh
+                if ten_layout is not None and ten_layout not in CAC_LAYOUT:
+                    raise ValueError(f"Layout không hợp lệ: {ten_layout}")
+                layout = CAC_LAYOUT[ten_layout]() if ten_layout else None
+                
+                anh = None
+                if muc['du_lieu_anh'] is not None:
+                    anh = cv2.imdecode(np.frombuffer(muc['du_lieu_anh'], dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if anh is None:
+                        raise ValueError("Không decode được ảnh")
+                
+                ket_qua = ham_xu_ly(muc['duong_dan'] or muc['ten'], anh, layout)
+                if not ket_qua:
+                    loi = "Không thể tiền xử lý ảnh"
+            except Exception as e:
+                loi = str(e)
+        
+        thong_ke['so_phieu'] += 1
+        thong_ke['loi' if loi else 'thanh_cong'] += 1
+        
+        dau_ra.write(json.dumps({
+            'ten': muc['ten'],
+            'ket_qua': ket_qua,
+            'loi': loi,
+            'thoi_gian_xu_ly': round(time.perf_counter() - bat_dau, 3)
+        }, ensure_ascii=False, separators=(',', ':')) + '\n')
+        dau_ra.flush()
+    
+    thong_ke['thoi_gian'] = round(time.perf_counter() - bat_dau_luong, 3)
+    return thong_ke
@@ -0,0 +1,318 @@
+# nguon_anh.py - Đọc ảnh phiếu bầu thẳng từ file nén (zip/tar) hoặc tài liệu nhiều trang (TIFF/PDF)
+# mà không giải nén / tách trang ra đĩa
+import os
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Import thư viện render PDF (không bắt buộc, chỉ cần khi đầu vào có PDF)
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+DUOI_ANH = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+DUOI_FILE_NEN = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+DUOI_TAI_LIEU = ('.pdf', '.tif', '.tiff')
+
+# Phân cách nguồn và ảnh bên trong trong khóa của phiếu,
+# ví dụ "ballot/data1.zip#ballot_1.jpg" hoặc "scan/khay_01.pdf#3" (trang đánh số từ 1)
+PHAN_CACH = '#'
+
+# Phiếu sau khi làm phẳng rộng 1654 px (A4 ở 200 DPI, xem straighten_ballot),
+# trang tài liệu được decode ở độ phân giải vừa đủ cho kích thước này
+CHIEU_RONG_PHANG = 1654
+
+def la_file_nen(duong_dan: str) -> bool:
+    """File zip/tar (kể cả tar nén gzip/bz2/xz)"""
+    return os.path.isfile(duong_dan) and duong_dan.lower().endswith(DUOI_FILE_NEN)
+
+def la_tar_nen(duong_dan: str) -> bool:
+    """Tar nén gzip/bz2/xz: chỉ giải nén tuần tự được, đọc một ảnh bên trong phải giải nén mọi thứ trước nó"""
+    if not la_file_nen(duong_dan) or zipfile.is_zipfile(duong_dan):
+        return False
+    try:
+        with tarfile.open(duong_dan, 'r:'):
+            return False
+    except tarfile.ReadError:
+        return True
+
+def la_tai_lieu_nhieu_trang(duong_dan: str) -> bool:
+    """PDF, hoặc TIFF có nhiều trang (TIFF một trang vẫn được đọc như ảnh thường)"""
+    if not os.path.isfile(duong_dan) or not duong_dan.lower().endswith(DUOI_TAI_LIEU):
+        return False
+    if duong_dan.lower().endswith('.pdf'):
+        return True
+    try:
+        # Chỉ đọc phần đầu file, không decode điểm ảnh
+        with Image.open(duong_dan) as anh:
+            return getattr(anh, 'n_frames', 1) > 1
+    except Exception:
+        return False
+
+def la_nguon_nhieu_anh(duong_dan: str) -> bool:
+    """Một file chứa nhiều phiếu: file nén hoặc tài liệu nhiều trang"""
+    return la_file_nen(duong_dan) or la_tai_lieu_nhieu_trang(duong_dan)
+
+def ten_nguon(duong_dan: str) -> str:
+    """Tên thư mục hoặc file nén / tài liệu bỏ đuôi, dùng đặt tên thư mục kết quả (data1.tar.gz -> data1)"""
+    ten = os.path.basename(os.path.normpath(duong_dan))
+    for duoi in sorted(DUOI_FILE_NEN + DUOI_TAI_LIEU, key=len, reverse=True):
+        if ten.lower().endswith(duoi):
+            return ten[:-len(duoi)]
+    return ten
+
+def khoa_anh(nguon: str, thanh_vien: str) -> str:
+    """Khóa của ảnh trong file nén hoặc trang trong tài liệu"""
+    return f"{nguon}{PHAN_CACH}{thanh_vien}"
+
+def tach_khoa_anh(khoa: str):
+    """
+    Tách khóa ảnh thành (nguồn, tên trong file nén hoặc số trang); đường dẫn ảnh thường trả về (None, khoa)
+    """
+    vi_tri = khoa.find(PHAN_CACH)
+    while vi_tri != -1:
+        nguon = khoa[:vi_tri]
+        if nguon.lower().endswith(DUOI_FILE_NEN + DUOI_TAI_LIEU) and os.path.isfile(nguon):
+            return nguon, khoa[vi_tri + 1:]
+        vi_tri = khoa.find(PHAN_CACH, vi_tri + 1)
+    return None, khoa
+
+def ten_anh(khoa: str) -> str:
+    """
+    Tên phiếu của đường dẫn hoặc khóa ảnh: tên file ảnh (kể cả ảnh trong file nén),
+    hoặc "tên_tài_liệu#trang" với trang tài liệu
+    """
+    nguon, thanh_vien = tach_khoa_anh(khoa)
+    if nguon is not None and nguon.lower().endswith(DUOI_TAI_LIEU):
+        return f"{os.path.basename(nguon)}{PHAN_CACH}{thanh_vien}"
+    return os.path.basename(thanh_vien)
+
+def ten_co_so(khoa: str) -> str:
+    """Tên phiếu bỏ đuôi file, dùng đặt tên file kết quả (khay_01.pdf#3 -> khay_01#3)"""
+    nguon, thanh_vien = tach_khoa_anh(khoa)
+    if nguon is not None and nguon.lower().endswith(DUOI_TAI_LIEU):
+        return f"{ten_nguon(nguon)}{PHAN_CACH}{thanh_vien}"
+    return os.path.splitext(os.path.basename(thanh_vien))[0]
+
+def liet_ke_anh_trong_file_nen(file_nen: str):
+    """
+    Liệt kê ảnh trong file nén (bỏ file ẩn, thư mục và file không phải ảnh)
+    
+    Returns:
+        List tên thành viên theo thứ tự trong file nén
+    """
+    def la_anh(ten):
+        return ten.lower().endswith(DUOI_ANH) and not os.path.basename(ten).startswith('.')
+    
+    if zipfile.is_zipfile(file_nen):
+        with zipfile.ZipFile(file_nen) as zf:
+            return [ten for ten in zf.namelist() if not ten.endswith('/') and la_anh(ten)]
+    
+    # Tar nén phải giải nén tuần tự để đọc danh sách, nhưng không ghi gì ra đĩa
+    with tarfile.open(file_nen, 'r:*') as tf:
+        return [tv.name for tv in tf if tv.isfile() and la_anh(tv.name)]
+
+def so_trang_tai_lieu(tai_lieu: str) -> int:
+    """Số trang của PDF/TIFF, không decode trang nào"""
+    if not tai_lieu.lower().endswith('.pdf'):
+        with Image.open(tai_lieu) as anh:
+            return getattr(anh, 'n_frames', 1)
+    
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(tai_lieu)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    if fitz is not None:
+        with fitz.open(tai_lieu) as pdf:
+            return pdf.page_count
+    raise ImportError("Cần cài pypdfium2 hoặc PyMuPDF để đọc PDF")
+
+def liet_ke_anh_trong_nguon(nguon: str):
+    """Tên các ảnh trong file nén, hoặc số trang ("1", "2", ...) của tài liệu"""
+    if la_file_nen(nguon):
+        return liet_ke_anh_trong_file_nen(nguon)
+    return [str(trang) for trang in range(1, so_trang_tai_lieu(nguon) + 1)]
+
+def giai_ma_anh(du_lieu: bytes):
+    """Decode ảnh đã mã hóa thành ảnh BGR (None nếu không decode được)"""
+    return cv2.imdecode(np.frombuffer(du_lieu, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def doc_anh_tu_file_nen(file_nen: str, cac_thanh_vien=None, so_luong: int = 4):
+    """
+    Đọc và decode ảnh trong file nén song song trên nhóm luồng (zlib và OpenCV nhả GIL),
+    trả về theo thứ tự. Chỉ giữ tối đa 2 * so_luong ảnh đọc trước trong bộ nhớ.
+    
+    Zip được đọc ngẫu nhiên theo tên nên cả giải nén và decode đều song song; tar (nhất là tar.gz)
+    chỉ đọc tuần tự được nên luồng gọi đọc byte, nhóm luồng decode. Việc đọc tar dừng ngay khi đã
+    gặp mọi ảnh cần đọc; tar không nén chỉ đọc header của các thành viên bỏ qua (nhảy qua dữ liệu).
+    
+    Args:
+        file_nen: Đường dẫn file zip/tar
+        cac_thanh_vien: Tên các ảnh cần đọc (None: tất cả ảnh)
+        so_luong: Số luồng đọc/decode
+    
+    Yields:
+        (tên thành viên, ảnh BGR hoặc None, thông báo lỗi hoặc None)
+    """
+    if cac_thanh_vien is None:
+        cac_thanh_vien = liet_ke_anh_trong_file_nen(file_nen)
+    can_doc = set(cac_thanh_vien)
+    
+    def ket_qua(thanh_vien, du_lieu):
+        anh = giai_ma_anh(du_lieu)
+        return thanh_vien, anh, None if anh is not None else "Không decode được ảnh"
+    
+    dang_doc = deque()
+    with ThreadPoolExecutor(so_luong, thread_name_prefix="doc_anh") as nhom_luong:
+        if zipfile.is_zipfile(file_nen):
+            with zipfile.ZipFile(file_nen) as zf:
+                def doc_zip(thanh_vien):
+                    try:
+                        return ket_qua(thanh_vien, zf.read(thanh_vien))
+                    except Exception as e:
+                        return thanh_vien, None, str(e)
+                
+                for thanh_vien in cac_thanh_vien:
+                    dang_doc.append(nhom_luong.submit(doc_zip, thanh_vien))
+                    if len(dang_doc) >= 2 * so_luong:
+                        yield dang_doc.popleft().result()
+                while dang_doc:
+                    yield dang_doc.popleft().result()
+        else:
+            con_lai = set(can_doc)
+            with tarfile.open(file_nen, 'r:*') as tf:
+                for tv in tf:
+                    if tv.name not in con_lai or not tv.isfile():
+                        continue
+                    con_lai.discard(tv.name)
+                    dang_doc.append(nhom_luong.submit(ket_qua, tv.name, tf.extractfile(tv).read()))
+                    if len(dang_doc) >= 2 * so_luong:
+                        yield dang_doc.popleft().result()
+                    if not con_lai:
+                        break
+            while dang_doc:
+                yield dang_doc.popleft().result()
+
+def _mo_tai_lieu(tai_lieu: str):
+    """
+    Mở tài liệu, trả về (hàm decode trang thứ i tính từ 0 thành ảnh BGR, hàm đóng tài liệu).
+    Mỗi lần chỉ đọc trang được yêu cầu, không load cả tài liệu vào bộ nhớ.
+    """
+    if not tai_lieu.lower().endswith('.pdf'):
+        anh_tiff = Image.open(tai_lieu)
+        
+        def doc_trang_tiff(i):
+            anh_tiff.seek(i)
+            # Trang quét độ phân giải cao được thu nhỏ theo hệ số nguyên (nhanh, không nhỏ hơn
+            # chiều rộng phiếu đã làm phẳng)
+            he_so = max(1, min(anh_tiff.size) // CHIEU_RONG_PHANG)
+            trang = anh_tiff.reduce(he_so) if he_so > 1 else anh_tiff
+            return cv2.cvtColor(np.asarray(trang.convert('RGB')), cv2.COLOR_RGB2BGR)
+        
+        return doc_trang_tiff, anh_tiff.close
+    
+    if pdfium is not None:
+        pdf = pdfium.PdfDocument(tai_lieu)
+        
+        def doc_trang_pdfium(i):
+            trang = pdf[i]
+            try:
+                # Render để cạnh ngắn của trang bằng chiều rộng phiếu đã làm phẳng
+                ti_le = CHIEU_RONG_PHANG / min(trang.get_size())
+                anh = trang.render(scale=ti_le).to_pil().convert('RGB')
+            finally:
+                trang.close()
+            return cv2.cvtColor(np.asarray(anh), cv2.COLOR_RGB2BGR)
+        
+        return doc_trang_pdfium, pdf.close
+    
+    if fitz is not None:
+        pdf = fitz.open(tai_lieu)
+        
+        def doc_trang_fitz(i):
+            trang = pdf.load_page(i)
+            ti_le = CHIEU_RONG_PHANG / min(trang.rect.width, trang.rect.height)
+            pix = trang.get_pixmap(matrix=fitz.Matrix(ti_le, ti_le), colorspace=fitz.csRGB, alpha=False)
+            anh = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+            return cv2.cvtColor(anh, cv2.COLOR_RGB2BGR)
+        
+        return doc_trang_fitz, pdf.close
+    
+    raise ImportError("Cần cài pypdfium2 hoặc PyMuPDF để đọc PDF")
+
+def doc_trang_tai_lieu(tai_lieu: str, cac_trang=None, so_trang_doc_truoc: int = 2):
+    """
+    Decode lần lượt các trang của TIFF/PDF nhiều trang, mỗi trang là một phiếu. Một luồng nền
+    decode trước tối đa so_trang_doc_truoc trang trong lúc trang hiện tại được xử lý; thư viện
+    đọc TIFF/PDF không an toàn đa luồng trên cùng tài liệu nên chỉ dùng một luồng.
+    
+    Args:
+        tai_lieu: Đường dẫn file PDF/TIFF
+        cac_trang: Số trang cần đọc dạng chuỗi, tính từ 1 (None: tất cả trang)
+        so_trang_doc_truoc: Số trang decode trước tối đa
+    
+    Yields:
+        (số trang dạng chuỗi, ảnh BGR hoặc None, thông báo lỗi hoặc None)
+    """
+    if cac_trang is None:
+        cac_trang = liet_ke_anh_trong_nguon(tai_lieu)
+    
+    doc_trang, dong = _mo_tai_lieu(tai_lieu)
+    
+    def ket_qua(trang):
+        try:
+            return trang, doc_trang(int(trang) - 1), None
+        except Exception as e:
+            return trang, None, str(e)
+    
+    dang_doc = deque()
+    try:
+        with ThreadPoolExecutor(1, thread_name_prefix="doc_trang") as luong_doc:
+            for trang in cac_trang:
+                dang_doc.append(luong_doc.submit(ket_qua, trang))
+                if len(dang_doc) > so_trang_doc_truoc:
+                    yield dang_doc.popleft().result()
+            while dang_doc:
+                yield dang_doc.popleft().result()
+    finally:
+        dong()
+
+def doc_anh_tu_nguon(nguon: str, cac_thanh_vien=None, so_luong: int = 4):
+    """
+    Đọc ảnh từ file nén (doc_anh_tu_file_nen) hoặc trang từ tài liệu nhiều trang (doc_trang_tai_lieu)
+    
+    Yields:
+        (tên thành viên hoặc số trang, ảnh BGR hoặc None, thông báo lỗi hoặc None)
+    """
+    if la_file_nen(nguon):
+        return doc_anh_tu_file_nen(nguon, cac_thanh_vien, so_luong)
+    return doc_trang_tai_lieu(nguon, cac_thanh_vien)
+
+def doc_anh_theo_khoa(khoa: str):
+    """
+    Đọc riêng một ảnh theo khóa (dùng khi các phiếu được xử lý rời rạc, ví dụ từ hàng đợi)
+    
+    Returns:
+        Ảnh BGR của ảnh trong file nén / trang tài liệu, None nếu khóa là đường dẫn ảnh thường
+    """
+    nguon, thanh_vien = tach_khoa_anh(khoa)
+    if nguon is None:
+        return None
+    for _, anh, loi in doc_anh_tu_nguon(nguon, [thanh_vien], 1):
+        if anh is None:
+            raise ValueError(loi)
+        return anh
+    raise ValueError(f"Không tìm thấy {thanh_vien} trong {nguon}")
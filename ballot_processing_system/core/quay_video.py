@@ -0,0 +1,245 @@
+# quay_video.py - Chọn khung hình rõ nhất của từng phiếu trong video / luồng camera
+import os
+import time
+
+import cv2
+import numpy as np
+
+from core.tien_xu_ly import tao_detector_aruco, estimate_missing_marker, KICH_THUOC_PHANG
+from core.trung_lap import van_tay_phieu, khoang_cach_van_tay, TI_LE_THU_NHO
+
+class ChonKhungPhieu:
+    """
+    Đọc video hoặc camera đặt cố định, coi phiếu đang nằm trong khung hình khi thấy đủ marker ArUco
+    góc phiếu, và trả về một khung hình rõ nhất (phương sai Laplacian cao nhất) cho mỗi lần phiếu
+    xuất hiện. Các khung liên tiếp của cùng một phiếu chỉ cho một kết quả; marker bị che trong thời
+    gian ngắn hơn thoi_gian_vang (tay thao tác, lóa) không tách phiếu thành hai.
+    
+    Phiếu sau đặt chồng lên phiếu trước có thể che marker ngắn hơn thoi_gian_vang, nên lần xuất hiện
+    còn được tách khi phiếu trong khung đổi: vân tay mực trong các ô (van_tay_phieu trên khung đã làm
+    phẳng, cần vung_o) khác phiếu đang mở quá nguong_van_tay, hoặc - khi không có vân tay / phiếu
+    không đủ mực - vị trí marker nhảy quá ti_le_nhay. Phiếu chỉ bị xê dịch có cùng vân tay nên không
+    bị tách. Thay đổi phải kéo dài ít nhất thoi_gian_toi_thieu (tay che các ô không tách phiếu).
+    
+    Để theo kịp 30 fps trên CPU, chỉ một phần khung được phân tích, trên ảnh thu nhỏ: khi không có
+    phiếu, mỗi khoang_cho giây một khung; khi có phiếu, mỗi khoang_co_phieu giây một khung. Các khung
+    bỏ qua chỉ được grab() (không chuyển màu, không phân tích).
+    """
+    
+    def __init__(self, nguon,
+                 so_marker_toi_thieu: int = 4,
+                 chieu_rong_phan_tich: int = 960,
+                 thoi_gian_vang: float = 0.5,
+                 thoi_gian_toi_thieu: float = 0.2,
+                 khoang_cho: float = 0.2,
+                 khoang_co_phieu: float = 0.066,
+                 vung_o=None,
+                 nguong_van_tay: float = 0.35,
+                 ti_le_nhay: float = 0.05):
+        """
+        Args:
+            nguon: Đường dẫn file video, URL luồng (rtsp://...) hoặc chỉ số camera (0, "0")
+            so_marker_toi_thieu: Số marker góc (id 0-3) phải thấy để coi là phiếu nằm trọn trong khung
+            chieu_rong_phan_tich: Chiều rộng ảnh thu nhỏ dùng phát hiện marker và đo độ nét
+            thoi_gian_vang: Số giây không thấy marker thì coi là phiếu đã được lấy ra
+            thoi_gian_toi_thieu: Bỏ lần xuất hiện ngắn hơn số giây này (phiếu đang được đưa qua)
+            khoang_cho: Khoảng thời gian (giây) giữa hai khung được phân tích khi chưa có phiếu
+            khoang_co_phieu: Khoảng thời gian giữa hai khung được phân tích khi có phiếu
+            vung_o: List (x1, y1, x2, y2) các ô đồng ý/không đồng ý trên ảnh phẳng theo layout
+                    (None: chỉ tách phiếu theo vị trí marker)
+            nguong_van_tay: Khoảng cách vân tay lớn hơn giá trị này là phiếu khác
+            ti_le_nhay: Độ dịch tâm marker (theo đường chéo khung marker) lớn hơn giá trị này là phiếu khác
+        """
+        if isinstance(nguon, str) and nguon.isdigit():
+            nguon = int(nguon)
+        self.nguon = nguon
+        # File video dùng thời gian trong video (chạy nhanh hơn thời gian thực), camera dùng đồng hồ
+        self.la_file = isinstance(nguon, str) and os.path.isfile(nguon)
+        
+        self._cap = cv2.VideoCapture(nguon)
+        if not self._cap.isOpened():
+            raise ValueError(f"Không mở được nguồn video: {nguon}")
+        fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+        
+        self.so_marker_toi_thieu = so_marker_toi_thieu
+        self.chieu_rong_phan_tich = chieu_rong_phan_tich
+        self.thoi_gian_vang = thoi_gian_vang
+        self.thoi_gian_toi_thieu = thoi_gian_toi_thieu
+        self.khoang_cho = khoang_cho
+        self.khoang_co_phieu = khoang_co_phieu
+        self.nguong_van_tay = nguong_van_tay
+        self.ti_le_nhay = ti_le_nhay
+        # Vân tay lấy trên ảnh phẳng đã ở tỉ lệ TI_LE_THU_NHO (làm phẳng thẳng từ ảnh phân tích)
+        self._vung_o_nho = None if vung_o is None else np.asarray(vung_o, dtype=np.float64) * TI_LE_THU_NHO
+        self._detector = tao_detector_aruco()
+        self._dung = False
+        
+        self.thong_ke = {
+            'so_khung': 0,
+            'so_khung_phan_tich': 0,
+            'so_phieu': 0,
+            'bo_qua_ngan': 0,
+            'tach_doi_phieu': 0,
+            'thoi_gian_phan_tich': 0.0
+        }
+    
+    def _phan_tich(self, khung):
+        """
+        Phát hiện marker và đo độ nét trên ảnh thu nhỏ
+        
+        Returns:
+            Dict {'do_net' (phương sai Laplacian trong vùng giữa các marker), 'tam' (tâm marker theo id
+            trên ảnh thu nhỏ), 'van_tay' (None nếu không lấy được)}, None nếu không đủ marker
+        """
+        h, w = khung.shape[:2]
+        ti_le = min(1.0, self.chieu_rong_phan_tich / w)
+        xam = cv2.cvtColor(khung, cv2.COLOR_BGR2GRAY)
+        if ti_le < 1.0:
+            xam = cv2.resize(xam, (int(w * ti_le), int(h * ti_le)), interpolation=cv2.INTER_AREA)
+        
+        corners, ids, _ = self._detector.detectMarkers(xam)
+        if ids is None:
+            return None
+        
+        tam = {int(id): np.mean(corner[0], axis=0) for corner, id in zip(corners, ids.flatten()) if id < 4}
+        if len(tam) < self.so_marker_toi_thieu:
+            return None
+        
+        # Đo độ nét trong hình chữ nhật bao các marker (bỏ nền bàn quanh phiếu)
+        diem = np.array(list(tam.values()))
+        x1, y1 = diem.min(axis=0).astype(int)
+        x2, y2 = diem.max(axis=0).astype(int)
+        vung = xam[max(0, y1):y2 + 1, max(0, x1):x2 + 1]
+        if vung.size == 0:
+            return None
+        return {'do_net': float(cv2.Laplacian(vung, cv2.CV_64F).var()), 'tam': tam, 'van_tay': self._van_tay(xam, tam)}
+    
+    def _van_tay(self, xam, tam):
+        """Vân tay mực trong các ô của phiếu trong khung, làm phẳng ảnh phân tích theo tâm marker"""
+        if self._vung_o_nho is None:
+            return None
+        diem = dict(tam)
+        for id_thieu in set(range(4)) - set(diem):
+            diem[id_thieu] = estimate_missing_marker(diem, id_thieu)
+            if diem[id_thieu] is None:
+                return None
+        
+        rong, cao = int(KICH_THUOC_PHANG[0] * TI_LE_THU_NHO), int(KICH_THUOC_PHANG[1] * TI_LE_THU_NHO)
+        goc_phieu = np.array([[0, 0], [rong - 1, 0], [rong - 1, cao - 1], [0, cao - 1]], dtype="float32")
+        ma_tran = cv2.getPerspectiveTransform(np.array([diem[i] for i in range(4)], dtype="float32"), goc_phieu)
+        return van_tay_phieu(cv2.warpPerspective(xam, ma_tran, (rong, cao)), self._vung_o_nho, ti_le=1.0)
+    
+    def _la_phieu_khac(self, mau, mau_phieu):
+        """Khung phân tích (mau) có phải phiếu khác phiếu đang mở (mau_phieu: khung rõ nhất của phiếu)"""
+        if mau['van_tay'] is not None and mau_phieu['van_tay'] is not None:
+            khoang_cach = khoang_cach_van_tay(mau['van_tay'], mau_phieu['van_tay'])
+            if khoang_cach is not None:
+                return khoang_cach > self.nguong_van_tay
+        
+        # Không so được vân tay: so vị trí các marker thấy ở cả hai khung
+        chung = set(mau['tam']) & set(mau_phieu['tam'])
+        if not chung:
+            return False
+        duong_cheo = np.linalg.norm(np.ptp(np.array(list(mau_phieu['tam'].values())), axis=0))
+        do_dich = max(np.linalg.norm(mau['tam'][i] - mau_phieu['tam'][i]) for i in chung)
+        return do_dich > self.ti_le_nhay * max(duong_cheo, 1.0)
+    
+    def cac_phieu(self):
+        """
+        Yields:
+            Dict {'so_thu_tu', 'anh' (khung BGR độ phân giải gốc), 'thoi_diem' (giây từ đầu nguồn),
+                  'do_net', 'so_khung_co_phieu' (số khung đã phân tích thấy phiếu)}
+        """
+        chi_so = -1
+        bat_dau = time.monotonic()
+        lan_phan_tich_sau = 0.0
+        
+        # Lần xuất hiện đang mở: khung rõ nhất và kết quả phân tích của nó, thời điểm đầu/cuối thấy phiếu,
+        # số khung thấy phiếu, lần xuất hiện của phiếu khác đang chờ đủ thoi_gian_toi_thieu để tách
+        dang_mo = None
+        
+        def mo_lan_xuat_hien(khung, mau, thoi_diem):
+            return {'anh': khung, 'mau': mau, 'do_net': mau['do_net'], 'thoi_diem_anh': thoi_diem,
+                    'lan_dau': thoi_diem, 'lan_cuoi': thoi_diem, 'so_khung': 0, 'phieu_khac': None}
+        
+        def them_khung(lan_xuat_hien, khung, mau, thoi_diem):
+            if mau['do_net'] > lan_xuat_hien['do_net']:
+                lan_xuat_hien.update(anh=khung, mau=mau, do_net=mau['do_net'], thoi_diem_anh=thoi_diem)
+            lan_xuat_hien['lan_cuoi'] = thoi_diem
+            lan_xuat_hien['so_khung'] += 1
+        
+        def du_dai(lan_xuat_hien):
+            # Lần phân tích cuối thấy phiếu đại diện cho cả khoảng khoang_co_phieu sau nó
+            return lan_xuat_hien['lan_cuoi'] - lan_xuat_hien['lan_dau'] + self.khoang_co_phieu >= self.thoi_gian_toi_thieu
+        
+        def dong_lan_xuat_hien():
+            if not du_dai(dang_mo):
+                self.thong_ke['bo_qua_ngan'] += 1
+                return None
+            self.thong_ke['so_phieu'] += 1
+            return {
+                'so_thu_tu': self.thong_ke['so_phieu'],
+                'anh': dang_mo['anh'],
+                'thoi_diem': round(dang_mo['thoi_diem_anh'], 3),
+                'do_net': round(dang_mo['do_net'], 1),
+                'so_khung_co_phieu': dang_mo['so_khung']
+            }
+        
+        while not self._dung and self._cap.grab():
+            chi_so += 1
+            self.thong_ke['so_khung'] += 1
+            thoi_diem = chi_so / self.fps if self.la_file else time.monotonic() - bat_dau
+            if thoi_diem < lan_phan_tich_sau:
+                continue
+            
+            ok, khung = self._cap.retrieve()
+            if not ok:
+                continue
+            
+            bat_dau_phan_tich = time.perf_counter()
+            mau = self._phan_tich(khung)
+            self.thong_ke['so_khung_phan_tich'] += 1
+            self.thong_ke['thoi_gian_phan_tich'] += time.perf_counter() - bat_dau_phan_tich
+            
+            if mau is not None:
+                if dang_mo is None:
+                    dang_mo = mo_lan_xuat_hien(khung, mau, thoi_diem)
+                    them_khung(dang_mo, khung, mau, thoi_diem)
+                elif not self._la_phieu_khac(mau, dang_mo['mau']):
+                    # Thay đổi chỉ thoáng qua (tay che các ô, lóa): vẫn là phiếu đang mở
+                    dang_mo['phieu_khac'] = None
+                    them_khung(dang_mo, khung, mau, thoi_diem)
+                else:
+                    if dang_mo['phieu_khac'] is None:
+                        dang_mo['phieu_khac'] = mo_lan_xuat_hien(khung, mau, thoi_diem)
+                    them_khung(dang_mo['phieu_khac'], khung, mau, thoi_diem)
+                    
+                    if du_dai(dang_mo['phieu_khac']):
+                        # Phiếu mới được đặt chồng lên phiếu cũ mà marker không bị che đủ lâu
+                        phieu_khac = dang_mo['phieu_khac']
+                        phieu = dong_lan_xuat_hien()
+                        self.thong_ke['tach_doi_phieu'] += 1
+                        dang_mo = phieu_khac
+                        if phieu:
+                            yield phieu
+            elif dang_mo is not None and thoi_diem - (dang_mo['phieu_khac'] or dang_mo)['lan_cuoi'] >= self.thoi_gian_vang:
+                phieu = dong_lan_xuat_hien()
+                dang_mo = None
+                if phieu:
+                    yield phieu
+            
+            lan_phan_tich_sau = thoi_diem + (self.khoang_co_phieu if dang_mo else self.khoang_cho)
+        
+        # Hết video: phiếu cuối còn trong khung
+        if dang_mo is not None:
+            phieu = dong_lan_xuat_hien()
+            if phieu:
+                yield phieu
+    
+    def dung(self):
+        """Yêu cầu cac_phieu dừng đọc (gọi được từ luồng khác)"""
+        self._dung = True
+    
+    def dong(self):
+        self._cap.release()
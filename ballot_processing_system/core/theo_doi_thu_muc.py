@@ -0,0 +1,184 @@
+# theo_doi_thu_muc.py - Theo dõi thư mục máy quét, trả về ảnh phiếu mới khi đã ghi xong
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Các cờ inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Tiêu đề của một sự kiện: wd, mask, cookie, độ dài tên
+_SU_KIEN = struct.Struct("iIII")
+
+class _Inotify:
+    """Bọc inotify của libc qua ctypes (chỉ Linux)"""
+    
+    def __init__(self, thu_muc: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            loi = ctypes.get_errno()
+            raise OSError(loi, os.strerror(loi))
+        
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(thu_muc),
+                                    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            loi = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(loi, os.strerror(loi))
+    
+    def cho(self, thoi_gian_cho: float):
+        """
+        Chờ sự kiện tối đa thoi_gian_cho giây
+        
+        Returns:
+            List (tên file, mask)
+        """
+        san_sang, _, _ = select.select([self._fd], [], [], thoi_gian_cho)
+        if not san_sang:
+            return []
+        
+        try:
+            du_lieu = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        
+        cac_su_kien = []
+        vi_tri = 0
+        while vi_tri + _SU_KIEN.size <= len(du_lieu):
+            _, mask, _, do_dai = _SU_KIEN.unpack_from(du_lieu, vi_tri)
+            vi_tri += _SU_KIEN.size
+            ten = du_lieu[vi_tri:vi_tri + do_dai].rstrip(b"\0")
+            vi_tri += do_dai
+            if ten:
+                cac_su_kien.append((os.fsdecode(ten), mask))
+        return cac_su_kien
+    
+    def dong(self):
+        os.close(self._fd)
+
+class TheoDoiThuMuc:
+    """
+    Phát hiện ảnh mới trong một thư mục (không xét thư mục con). Ảnh chỉ được trả về khi kích thước
+    và thời gian sửa đổi không đổi trong thoi_gian_on_dinh giây, tránh đọc file máy quét đang ghi dở.
+    
+    inotify đánh thức ngay khi có file mới hoặc file đang ghi thay đổi; IN_CLOSE_WRITE không được coi
+    là ghi xong vì có máy quét mở/đóng file nhiều lần khi ghi. Thư mục vẫn được quét lại định kỳ vì
+    inotify không thấy file do máy khác ghi vào thư mục mạng (NFS/SMB). Không có inotify thì chỉ quét định kỳ.
+    """
+    
+    def __init__(self, thu_muc: str, cac_duoi=('.jpg', '.jpeg', '.png'),
+                 thoi_gian_on_dinh: float = 1.0, chu_ky_quet: float = 2.0, dung_inotify: bool = True):
+        """
+        Args:
+            thu_muc: Thư mục theo dõi
+            cac_duoi: Đuôi file ảnh được nhận
+            thoi_gian_on_dinh: Số giây kích thước file phải giữ nguyên trước khi xử lý
+            chu_ky_quet: Chu kỳ (giây) quét lại toàn bộ thư mục
+            dung_inotify: Dùng inotify nếu hệ điều hành hỗ trợ
+        """
+        self.thu_muc = thu_muc
+        self.cac_duoi = tuple(d.lower() for d in cac_duoi)
+        self.thoi_gian_on_dinh = thoi_gian_on_dinh
+        self.chu_ky_quet = chu_ky_quet
+        
+        # Đường dẫn -> (kích thước, mtime, thời điểm bắt đầu giữ nguyên kích thước đó)
+        self._ung_vien = {}
+        self._lan_quet_sau = 0.0
+        
+        self._inotify = None
+        if dung_inotify:
+            try:
+                self._inotify = _Inotify(thu_muc)
+            except (OSError, AttributeError) as e:
+                # AttributeError: libc không có inotify (không phải Linux)
+                print(f"[WARNING] Không dùng được inotify ({e}), chuyển sang quét định kỳ")
+        
+        self.che_do = "inotify" if self._inotify else "polling"
+    
+    def _la_anh(self, ten: str) -> bool:
+        return ten.lower().endswith(self.cac_duoi) and not ten.startswith('.')
+    
+    def _them_ung_vien(self, duong_dan: str, bay_gio: float):
+        if duong_dan in self._ung_vien:
+            return
+        try:
+            st = os.stat(duong_dan)
+        except FileNotFoundError:
+            return
+        self._ung_vien[duong_dan] = (st.st_size, st.st_mtime_ns, bay_gio)
+    
+    def _quet(self, bay_gio: float):
+        with os.scandir(self.thu_muc) as cac_muc:
+            for muc in cac_muc:
+                if muc.is_file() and self._la_anh(muc.name):
+                    self._them_ung_vien(muc.path, bay_gio)
+    
+    def _lay_file_on_dinh(self, bay_gio: float):
+        san_sang = []
+        for duong_dan, (kich_thuoc, mtime, bat_dau) in list(self._ung_vien.items()):
+            try:
+                st = os.stat(duong_dan)
+            except FileNotFoundError:
+                del self._ung_vien[duong_dan]
+                continue
+            
+            if (st.st_size, st.st_mtime_ns) != (kich_thuoc, mtime):
+                # Vẫn đang được ghi - tính lại từ đầu
+                self._ung_vien[duong_dan] = (st.st_size, st.st_mtime_ns, bay_gio)
+            elif st.st_size > 0 and bay_gio - bat_dau >= self.thoi_gian_on_dinh:
+                san_sang.append(duong_dan)
+                del self._ung_vien[duong_dan]
+        
+        return sorted(san_sang)
+    
+    def cho_file_san_sang(self, thoi_gian_cho: float = None):
+        """
+        Chờ đến khi có ảnh đã ghi xong
+        
+        Args:
+            thoi_gian_cho: Số giây chờ tối đa (None: chờ đến khi có ảnh)
+        
+        Returns:
+            List đường dẫn ảnh sẵn sàng (rỗng nếu hết thời gian chờ)
+        """
+        han_chot = None if thoi_gian_cho is None else time.monotonic() + thoi_gian_cho
+        
+        while True:
+            bay_gio = time.monotonic()
+            if bay_gio >= self._lan_quet_sau:
+                self._quet(bay_gio)
+                self._lan_quet_sau = bay_gio + self.chu_ky_quet
+            
+            san_sang = self._lay_file_on_dinh(bay_gio)
+            if san_sang:
+                return san_sang
+            if han_chot is not None and bay_gio >= han_chot:
+                return []
+            
+            # Có file đang ghi thì kiểm tra lại sớm, không thì chờ đến lần quét sau
+            cho = self._lan_quet_sau - bay_gio
+            if self._ung_vien:
+                cho = min(cho, max(0.05, self.thoi_gian_on_dinh / 4))
+            if han_chot is not None:
+                cho = min(cho, han_chot - bay_gio)
+            cho = max(0.0, cho)
+            
+            if self._inotify:
+                for ten, _ in self._inotify.cho(cho):
+                    if self._la_anh(ten):
+                        self._them_ung_vien(os.path.join(self.thu_muc, ten), time.monotonic())
+            else:
+                time.sleep(cho)
+    
+    def dong(self):
+        if self._inotify:
+            self._inotify.dong()
+            self._inotify = None
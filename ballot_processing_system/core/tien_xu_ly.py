@@ -3,6 +3,9 @@ import numpy as np
 import os
 import glob
 
+# Kích thước phiếu sau khi làm phẳng (rộng, cao)
+KICH_THUOC_PHANG = (1654, 2339)
+
 # Biến toàn cục cho layout của các thư mục khác nhau
 # Layout cho data1
 Y_MIN1, Y_MAX1 = 208, 2225
@@ -163,15 +166,35 @@ def estimate_missing_marker(known_points, missing_id):
     
     return None
 
-def straighten_ballot(image_path):
-    """Làm phẳng ảnh phiếu bầu dựa trên ArUco markers (hỗ trợ 3-4 markers)"""
-    img = cv2.imread(image_path)
+def tao_detector_aruco():
+    """Detector ArUco (DICT_4X4_50) của 4 marker góc phiếu: id 0-3 theo thứ tự trên trái, trên phải, dưới phải, dưới trái"""
+    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    parameters = cv2.aruco.DetectorParameters()
+    return cv2.aruco.ArucoDetector(aruco_dict, parameters)
+
+def doc_anh_phieu(image_path):
+    """Ảnh BGR của phiếu từ đường dẫn hoặc ảnh đã decode"""
+    img = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
+    if img is None:
+        raise ValueError(f"Không thể đọc ảnh: {image_path}")
+    return img
+
+def straighten_ballot(image_path, ma_tran=None):
+    """
+    Làm phẳng ảnh phiếu bầu dựa trên ArUco markers (hỗ trợ 3-4 markers), nhận đường dẫn hoặc ảnh BGR đã decode.
+    ma_tran: Ma trận phối cảnh đã tìm trước đó cho cùng ảnh (bỏ qua bước tìm marker)
+    """
+    img = doc_anh_phieu(image_path)
+    if ma_tran is None:
+        ma_tran = tim_ma_tran_lam_phang(img)
+    return cv2.warpPerspective(img, np.asarray(ma_tran, dtype=np.float64), KICH_THUOC_PHANG)
+
+def tim_ma_tran_lam_phang(img):
+    """Ma trận phối cảnh đưa 4 marker góc (marker thứ 4 được ước lượng nếu chỉ thấy 3) về góc phiếu chuẩn"""
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
     # Tạo detector cho ArUco markers
-    aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
-    parameters = cv2.aruco.DetectorParameters()
-    detector = cv2.aruco.ArucoDetector(aruco_dict, parameters)
+    detector = tao_detector_aruco()
 
     # Phát hiện markers
     corners, ids, _ = detector.detectMarkers(gray)
@@ -210,14 +233,13 @@ def straighten_ballot(image_path):
         ordered_pts = np.array([pts[0], pts[1], pts[2], pts[3]], dtype="float32")
 
     # Kích thước phiếu chuẩn
-    width, height = 1654, 2339
+    width, height = KICH_THUOC_PHANG
     dst_pts = np.array([[0, 0], [width-1, 0], [width-1, height-1], [0, height-1]], dtype="float32")
 
     # Biến đổi perspective
     M = cv2.getPerspectiveTransform(ordered_pts, dst_pts)
-    warped = cv2.warpPerspective(img, M, (width, height))
 
-    return warped
+    return M
 
 def get_layout1():
     """Trả về layout cho data1 - chỉ lấy 3 cột: tên, đồng ý, không đồng ý"""
@@ -281,6 +303,12 @@ def get_layout2():
     
     return layout2
 
+# Layout theo tên, dùng khi không suy ra được từ đường dẫn (ví dụ ảnh tải lên dịch vụ)
+CAC_LAYOUT = {
+    'data1': get_layout1,
+    'data2': get_layout2
+}
+
 def crop_regions(img, layout, base_filename, output_dir):
     """Cắt các vùng theo layout và lưu ảnh với xử lý khác nhau cho từng loại ô"""
     for row_idx, row_data in layout.items():
@@ -403,20 +431,103 @@ def process_all_ballots(input_dirs=None, output_dir=None):
         
     return all_results
 
-def xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None):
+def chon_layout(duong_dan_anh):
     """
-    Xử lý một phiếu bầu cụ thể với ArUco markers và layout tùy chọn
+    Chọn layout phù hợp dựa trên đường dẫn ảnh (data1 hoặc data2)
     
     Args:
         duong_dan_anh: Đường dẫn tới ảnh phiếu bầu
-        thu_muc_luu: Thư mục lưu kết quả
-        layout: Layout cụ thể (None để auto-detect)
+        
+    Returns:
+        Dict: Layout tương ứng
+    """
+    path_lower = duong_dan_anh.lower()
+    if "data1" in path_lower:
+        return get_layout1()
+    elif "data2" in path_lower:
+        return get_layout2()
+    raise ValueError("Không thể xác định layout. Chỉ hỗ trợ ballot/data1 và ballot/data2. Vui lòng truyền layout cụ thể.")
+
+def cat_phieu_bau(straightened_img, layout, base_name, thu_muc_luu):
+    """
+    Cắt ảnh phiếu đã làm phẳng theo layout thành ma trận các ô
+    
+    Args:
+        straightened_img: Ảnh phiếu bầu đã làm phẳng
+        layout: Layout dùng để cắt
+        base_name: Tên gốc của file (dùng để đặt tên ảnh cắt)
+        thu_muc_luu: Thư mục lưu ảnh cắt (None: chỉ giữ ảnh trong bộ nhớ, 'duong_dan' là None)
         
     Returns:
         List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt
     """
+    ket_qua_cat_anh = []
+    
+    for row_idx, row_data in layout.items():
+        danh_sach_o_trong_dong = []
+        
+        for field, (x1, y1, x2, y2) in row_data.items():
+            # Cắt vùng từ ảnh gốc
+            cropped = straightened_img[y1:y2, x1:x2]
+            
+            if cropped.size == 0:
+                continue
+            
+            # Xử lý theo từng loại ô
+            if field == "name":
+                processed = resize_with_padding_high_quality(cropped, (384, 384))
+                filename_part = f"{base_name}_row{row_idx:02d}_hoten.jpg"
+                loai = "hoten"
+            elif field == "agree":
+                processed = add_padding_only(cropped, (640, 640))
+                filename_part = f"{base_name}_row{row_idx:02d}_dongy.jpg"
+                loai = "dongy"
+            elif field == "disagree":
+                processed = add_padding_only(cropped, (640, 640))
+                filename_part = f"{base_name}_row{row_idx:02d}_khongdongy.jpg"
+                loai = "khongdongy"
+            else:
+                processed = cropped
+                filename_part = f"{base_name}_row{row_idx:02d}_{field}.jpg"
+                loai = field
+            
+            # Lưu ảnh
+            filepath = None
+            if thu_muc_luu is not None:
+                filepath = os.path.join(thu_muc_luu, filename_part)
+                cv2.imwrite(filepath, processed)
+            
+            danh_sach_o_trong_dong.append({
+                'anh': processed,
+                'duong_dan': filepath,
+                'loai': loai,
+                'vung': (x1, y1, x2, y2)  # Tọa độ ô trên ảnh đã làm phẳng
+            })
+            
+            print(f"  → Đã cắt: {filename_part}")
+        
+        if danh_sach_o_trong_dong:
+            ket_qua_cat_anh.append(danh_sach_o_trong_dong)
+    
+    return ket_qua_cat_anh
+
+def tien_xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None, anh=None,
+                         ma_tran_lam_phang=None):
+    """
+    Làm phẳng và cắt một phiếu bầu, giữ lại cả ảnh đã làm phẳng và layout đã dùng
+    
+    Args:
+        duong_dan_anh: Đường dẫn tới ảnh phiếu bầu (khi có anh: chỉ dùng làm tên phiếu)
+        thu_muc_luu: Thư mục lưu kết quả (None: không ghi ảnh ra đĩa)
+        layout: Layout cụ thể (None để auto-detect)
+        anh: Ảnh phiếu BGR đã decode trong bộ nhớ (None: đọc từ duong_dan_anh)
+        ma_tran_lam_phang: Ma trận phối cảnh đã tìm ở lần xử lý trước của cùng ảnh (None: tìm marker)
+        
+    Returns:
+        Dict: {'ma_tran_anh', 'anh_phang', 'layout', 'ma_tran_lam_phang'} hoặc None nếu lỗi
+    """
     # Tạo thư mục lưu kết quả nếu chưa có
-    if not os.path.exists(thu_muc_luu):
+    if thu_muc_luu is not None and not os.path.exists(thu_muc_luu):
         os.makedirs(thu_muc_luu)
     
     try:
@@ -424,75 +535,53 @@ def xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", lay
         base_name = os.path.splitext(filename)[0]
         
         # Bước 1: Làm phẳng ảnh
-        straightened_img = straighten_ballot(duong_dan_anh)
+        img = doc_anh_phieu(anh if anh is not None else duong_dan_anh)
+        if ma_tran_lam_phang is None:
+            ma_tran_lam_phang = tim_ma_tran_lam_phang(img)
+        straightened_img = straighten_ballot(img, ma_tran_lam_phang)
         
         # Lưu ảnh đã làm phẳng
-        straightened_path = os.path.join(thu_muc_luu, f"{base_name}_straightened.jpg")
-        cv2.imwrite(straightened_path, straightened_img)
+        if thu_muc_luu is not None:
+            straightened_path = os.path.join(thu_muc_luu, f"{base_name}_straightened.jpg")
+            cv2.imwrite(straightened_path, straightened_img)
         
-        # Bước 2: Chọn layout phù hợp
+        # Bước 2: Chọn layout phù hợp (auto-detect dựa trên đường dẫn)
         if layout is None:
-            # Auto-detect layout dựa trên đường dẫn
-            path_lower = duong_dan_anh.lower()
-            if "data1" in path_lower:
-                layout = get_layout1()
-            elif "data2" in path_lower:
-                layout = get_layout2()
-            else:
-                raise ValueError("Không thể xác định layout. Chỉ hỗ trợ ballot/data1 và ballot/data2. Vui lòng truyền layout cụ thể.")
+            layout = chon_layout(duong_dan_anh)
         
         # Bước 3: Cắt theo layout đã chọn
-        ket_qua_cat_anh = []
-        
-        for row_idx, row_data in layout.items():
-            danh_sach_o_trong_dong = []
-            
-            for field, (x1, y1, x2, y2) in row_data.items():
-                # Cắt vùng từ ảnh gốc
-                cropped = straightened_img[y1:y2, x1:x2]
-                
-                if cropped.size == 0:
-                    continue
-                
-                # Xử lý theo từng loại ô
-                if field == "name":
-                    processed = resize_with_padding_high_quality(cropped, (384, 384))
-                    filename_part = f"{base_name}_row{row_idx:02d}_hoten.jpg"
-                    loai = "hoten"
-                elif field == "agree":
-                    processed = add_padding_only(cropped, (640, 640))
-                    filename_part = f"{base_name}_row{row_idx:02d}_dongy.jpg"
-                    loai = "dongy"
-                elif field == "disagree":
-                    processed = add_padding_only(cropped, (640, 640))
-                    filename_part = f"{base_name}_row{row_idx:02d}_khongdongy.jpg"
-                    loai = "khongdongy"
-                else:
-                    processed = cropped
-                    filename_part = f"{base_name}_row{row_idx:02d}_{field}.jpg"
-                    loai = field
-                
-                # Lưu ảnh
-                filepath = os.path.join(thu_muc_luu, filename_part)
-                cv2.imwrite(filepath, processed)
-                
-                danh_sach_o_trong_dong.append({
-                    'anh': processed,
-                    'duong_dan': filepath,
-                    'loai': loai
-                })
-                
-                print(f"  → Đã cắt: {filename_part}")
-            
-            if danh_sach_o_trong_dong:
-                ket_qua_cat_anh.append(danh_sach_o_trong_dong)
+        ket_qua_cat_anh = cat_phieu_bau(straightened_img, layout, base_name, thu_muc_luu)
         
         print(f"✅ Hoàn thành: {filename} - Cắt được {len(ket_qua_cat_anh)} dòng")
-        return ket_qua_cat_anh
+        return {
+            'ma_tran_anh': ket_qua_cat_anh,
+            'anh_phang': straightened_img,
+            'layout': layout,
+            'ma_tran_lam_phang': np.asarray(ma_tran_lam_phang).tolist()
+        }
         
     except Exception as e:
         print(f"❌ Lỗi xử lý {duong_dan_anh}: {e}")
         return None
 
+def xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu="results/ket_qua_tien_xu_ly", layout=None):
+    """
+    Xử lý một phiếu bầu cụ thể với ArUco markers và layout tùy chọn
+    
+    Args:
+        duong_dan_anh: Đường dẫn tới ảnh phiếu bầu
+        thu_muc_luu: Thư mục lưu kết quả
+        layout: Layout cụ thể (None để auto-detect)
+        
+    Returns:
+        List[List[Dict]]: Ma trận 2D chứa thông tin các ảnh đã cắt
+    """
+    phieu = tien_xu_ly_phieu_bau(duong_dan_anh, thu_muc_luu, layout)
+    
+    if phieu is None:
+        return None
+    
+    return phieu['ma_tran_anh']
+
 if __name__ == "__main__":
     process_all_ballots()
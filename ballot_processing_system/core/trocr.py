@@ -10,6 +10,13 @@ import re
 # Tắt warning về deprecated class
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+# Mô hình TrOCR dùng để đọc họ tên
+TEN_MO_HINH_TROCR = "microsoft/trocr-base-printed"
+
+# Số ảnh từ tối đa cắt từ một ô họ tên. Ô nhiễu / độ phân giải rất lớn có thể cho hàng trăm contour,
+# mỗi contour một lượt TrOCR; vượt ngưỡng thì gộp contour thành từ, rồi cả dòng nếu vẫn quá nhiều
+SO_TU_TOI_DA = 32
+
 # Khởi tạo pipeline global để tái sử dụng
 _pipe = None
 
@@ -22,7 +29,7 @@ def get_pipeline():
         device = 0 if torch.cuda.is_available() else -1
         _pipe = pipeline(
             "image-to-text", 
-            model="microsoft/trocr-base-printed", 
+            model=TEN_MO_HINH_TROCR, 
             framework="pt",
             device=device
         )
@@ -59,9 +66,22 @@ def tien_xu_ly_anh_ocr(pil_img):
     # Chuyển về PIL Image
     return Image.fromarray(cleaned)
 
-def cat_tu_rieng_biet(pil_img):
+def gop_hop_theo_khoang_cach(word_boxes, khoang_cach):
+    """Gộp các box (x, y, w, h) đã sắp theo x khi khoảng trống ngang giữa chúng không quá khoang_cach"""
+    ket_qua = []
+    for x, y, w, h in word_boxes:
+        if ket_qua and x - (ket_qua[-1][0] + ket_qua[-1][2]) <= khoang_cach:
+            gx, gy, gw, gh = ket_qua[-1]
+            x2, y2 = max(gx + gw, x + w), max(gy + gh, y + h)
+            gx, gy = min(gx, x), min(gy, y)
+            ket_qua[-1] = (gx, gy, x2 - gx, y2 - gy)
+        else:
+            ket_qua.append((x, y, w, h))
+    return ket_qua
+
+def cat_tu_rieng_biet(pil_img, so_tu_toi_da=SO_TU_TOI_DA):
     """
-    Cắt từng từ riêng biệt để OCR
+    Cắt từng từ riêng biệt để OCR (tối đa so_tu_toi_da ảnh)
     """
     # Chuyển sang numpy array
     img_array = np.array(pil_img)
@@ -89,6 +109,13 @@ def cat_tu_rieng_biet(pil_img):
     # Sắp xếp từ trái sang phải
     word_boxes.sort(key=lambda box: box[0])
     
+    # Quá nhiều contour: gộp các contour sát nhau (ký tự của cùng một từ), vẫn quá thì lấy cả dòng
+    if len(word_boxes) > so_tu_toi_da:
+        chieu_cao = sorted(h for _, _, _, h in word_boxes)[len(word_boxes) // 2]
+        word_boxes = gop_hop_theo_khoang_cach(word_boxes, chieu_cao // 2)
+    if len(word_boxes) > so_tu_toi_da:
+        word_boxes = gop_hop_theo_khoang_cach(word_boxes, pil_img.width)
+    
     # Cắt từng từ
     words = []
     for x, y, w, h in word_boxes:
@@ -138,6 +165,28 @@ def hau_xu_ly_text(text):
     
     return processed_text.strip()
 
+def mo_anh_ten(anh):
+    """
+    Mở ảnh ô họ tên thành PIL RGB
+    
+    Args:
+        anh: Đường dẫn ảnh, ảnh PIL hoặc ảnh numpy (BGR như OpenCV)
+    """
+    if isinstance(anh, np.ndarray):
+        if len(anh.shape) == 3:
+            anh = cv2.cvtColor(anh, cv2.COLOR_BGR2RGB)
+        pil_img = Image.fromarray(anh)
+    elif isinstance(anh, Image.Image):
+        pil_img = anh
+    else:
+        pil_img = Image.open(anh)
+    
+    # Chuyển sang RGB nếu cần
+    if pil_img.mode != 'RGB':
+        pil_img = pil_img.convert('RGB')
+    
+    return pil_img
+
 def doc_ten_tu_anh(duong_dan_anh):
     """
     Đọc tên từ ảnh bằng phương pháp cắt từng từ
@@ -146,11 +195,7 @@ def doc_ten_tu_anh(duong_dan_anh):
         # Lấy pipeline
         pipe = get_pipeline()
         
-        pil_img = Image.open(duong_dan_anh)
-        
-        # Chuyển sang RGB nếu cần
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
+        pil_img = mo_anh_ten(duong_dan_anh)
         
         # Cắt từng từ riêng biệt
         words = cat_tu_rieng_biet(pil_img)
@@ -176,6 +221,50 @@ def doc_ten_tu_anh(duong_dan_anh):
         print(f"Lỗi khi xử lý ảnh {duong_dan_anh}: {str(e)}")
         return None
 
+def doc_ten_theo_lo(danh_sach_anh, batch_size=16):
+    """
+    Đọc tên từ nhiều ảnh ô họ tên (có thể thuộc nhiều phiếu), gom tất cả từ
+    của mọi ô vào một lần gọi TrOCR theo lô
+    
+    Args:
+        danh_sach_anh: List đường dẫn / ảnh PIL / ảnh numpy của ô họ tên
+        batch_size: Số ảnh từ trong một lượt suy luận của TrOCR
+        
+    Returns:
+        List tên đã hậu xử lý, cùng thứ tự đầu vào (None nếu ô đó lỗi)
+    """
+    pipe = get_pipeline()
+    
+    # Cắt từ của từng ô, ghi nhớ ô sở hữu mỗi từ
+    tat_ca_tu = []
+    o_cua_tu = []
+    ket_qua = [''] * len(danh_sach_anh)
+    
+    for chi_so, anh in enumerate(danh_sach_anh):
+        try:
+            for word_img in cat_tu_rieng_biet(mo_anh_ten(anh)):
+                tat_ca_tu.append(tien_xu_ly_anh_ocr(word_img))
+                o_cua_tu.append(chi_so)
+        except Exception as e:
+            print(f"Lỗi khi xử lý ảnh {anh if isinstance(anh, str) else chi_so}: {str(e)}")
+            ket_qua[chi_so] = None
+    
+    if not tat_ca_tu:
+        return ket_qua
+    
+    results = pipe(tat_ca_tu, batch_size=batch_size)
+    
+    word_texts = [[] for _ in danh_sach_anh]
+    for chi_so, result in zip(o_cua_tu, results):
+        if result:
+            word_texts[chi_so].append(result[0]['generated_text'])
+    
+    for chi_so, texts in enumerate(word_texts):
+        if ket_qua[chi_so] is not None:
+            ket_qua[chi_so] = hau_xu_ly_text(' '.join(texts))
+    
+    return ket_qua
+
 if __name__ == "__main__":
     import os
     
@@ -0,0 +1,214 @@
+# trung_lap.py - Phát hiện phiếu quét trùng (đưa lại vào máy quét, quét hai lần) bằng vân tay cảm nhận
+import os
+import json
+import threading
+
+import cv2
+import numpy as np
+
+from core.loc_muc import nhi_phan_hoa, cat_vung_trong
+
+try:
+    import fcntl
+except ImportError:  # Không phải POSIX: chỉ khóa giữa các luồng trong một tiến trình
+    fcntl = None
+
+# Ảnh phẳng được thu nhỏ theo tỉ lệ này trước khi lấy vân tay
+TI_LE_THU_NHO = 0.25
+# Mỗi ô đồng ý/không đồng ý cho một lưới KICH_THUOC_LUOI x KICH_THUOC_LUOI bit mực
+KICH_THUOC_LUOI = 16
+# Nét mực được làm dày (trên ảnh đã thu nhỏ) trước khi lấy mẫu lưới để hai lần quét lệch nhau vài
+# pixel sau khi làm phẳng (sai số vị trí marker) vẫn phủ lên nhau: 5x5 ~ 20px ở ảnh phẳng 1654px
+KICH_THUOC_GIAN_NO = 5
+# Đổi khi cách lấy vân tay thay đổi: vân tay khác phiên bản trong chỉ mục không được so với nhau
+PHIEN_BAN_VAN_TAY = 2
+
+# Số bit của mỗi byte, để đếm bit khác nhau giữa nhiều vân tay cùng lúc (numpy < 2.0 không có bitwise_count)
+_SO_BIT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _dem_bit(mang):
+    """Số bit 1 trên mỗi hàng (hoặc cả mảng 1 chiều) của mảng uint8"""
+    if hasattr(np, 'bitwise_count'):
+        if mang.shape[-1] % 8 == 0 and mang.flags.c_contiguous:
+            mang = mang.view(np.uint64)  # Đếm theo từng 8 byte
+        return np.bitwise_count(mang).sum(axis=-1, dtype=np.int64)
+    return _SO_BIT[mang].sum(axis=-1, dtype=np.int64)
+
+def van_tay_phieu(anh_phang, danh_sach_vung, ti_le=TI_LE_THU_NHO, kich_thuoc_luoi=KICH_THUOC_LUOI,
+                  gian_no=KICH_THUOC_GIAN_NO):
+    """
+    Vân tay cảm nhận của một phiếu: mực bên trong các ô đồng ý/không đồng ý trên ảnh phẳng thu nhỏ.
+    Phần in sẵn (bảng, họ tên) giống nhau ở mọi phiếu nên không đưa vào; hai lần quét của cùng một
+    tờ phiếu cho dấu X gần như trùng khít sau khi làm phẳng theo marker, còn hai phiếu khác nhau
+    dù chọn giống nhau vẫn khác ở vị trí và hình nét bút.
+    
+    Args:
+        anh_phang: Ảnh phiếu đã làm phẳng
+        danh_sach_vung: List (x1, y1, x2, y2) các ô đồng ý/không đồng ý trên ảnh phẳng
+        ti_le: Tỉ lệ thu nhỏ ảnh phẳng
+        kich_thuoc_luoi: Số ô lưới mỗi chiều lấy mẫu trong mỗi ô
+        gian_no: Kích thước nhân giãn nở nét mực trên ảnh thu nhỏ (1: không giãn nở)
+    
+    Returns:
+        np.ndarray uint8: Các bit mực đã đóng gói (packbits), cùng thứ tự với danh_sach_vung
+    """
+    nho = cv2.resize(anh_phang, None, fx=ti_le, fy=ti_le, interpolation=cv2.INTER_AREA)
+    vung = np.round(np.asarray(danh_sach_vung, dtype=np.float64).reshape(-1, 4) * ti_le).astype(np.int64)
+    
+    # Nhị phân hóa dải bao các ô (như tinh_ti_le_muc) để Otsu không bị phần họ tên ảnh hưởng
+    h, w = nho.shape[:2]
+    x0, y0 = max(0, int(vung[:, 0].min())), max(0, int(vung[:, 1].min()))
+    x1, y1 = min(w, int(vung[:, 2].max())), min(h, int(vung[:, 3].max()))
+    binary = nhi_phan_hoa(nho[y0:y1, x0:x1])
+    if gian_no > 1:
+        binary = cv2.dilate(binary, np.ones((gian_no, gian_no), dtype=np.uint8))
+    binary = binary.astype(np.float32)
+    
+    cac_bit = []
+    for vx1, vy1, vx2, vy2 in vung:
+        trong = cat_vung_trong(binary, (vx1 - x0, vy1 - y0, vx2 - x0, vy2 - y0))
+        if trong.size == 0:
+            cac_bit.append(np.zeros(kich_thuoc_luoi * kich_thuoc_luoi, dtype=bool))
+            continue
+        luoi = cv2.resize(trong, (kich_thuoc_luoi, kich_thuoc_luoi), interpolation=cv2.INTER_AREA)
+        cac_bit.append((luoi > 0.25).ravel())
+    return np.packbits(np.concatenate(cac_bit))
+
+def khoang_cach_van_tay(van_tay_1, van_tay_2, so_bit_muc_toi_thieu: int = 24):
+    """
+    Khoảng cách giữa hai vân tay (như ChiMucTrungLap): tỉ lệ bit khác nhau trên số bit có mực ở một
+    trong hai phiếu. None nếu một trong hai phiếu không đủ mực để so sánh.
+    """
+    if min(_dem_bit(van_tay_1), _dem_bit(van_tay_2)) < so_bit_muc_toi_thieu:
+        return None
+    return float(_dem_bit(van_tay_1 ^ van_tay_2) / _dem_bit(van_tay_1 | van_tay_2))
+
+def vung_o_danh_dau(ma_tran_anh):
+    """Tọa độ các ô đồng ý/không đồng ý của phiếu đã cắt, theo thứ tự dòng"""
+    return [o['vung'] for dong in ma_tran_anh for o in dong if o['loai'] in ('dongy', 'khongdongy')]
+
+class ChiMucTrungLap:
+    """
+    Chỉ mục vân tay các phiếu đã gặp, lưu dạng JSON Lines trong thư mục kết quả. Phiếu mới được so
+    với mọi phiếu gốc cùng độ dài vân tay; khoảng cách là tỉ lệ bit khác nhau trên số bit có mực ở
+    một trong hai phiếu. Phiếu không đủ mực (phiếu trắng) không bao giờ bị coi là trùng.
+    
+    Nhiều tiến trình (--processes) dùng chung file: trước mỗi lần tra cứu, các dòng tiến trình khác
+    vừa thêm được đọc tiếp, và tra cứu + thêm dòng nằm trong khóa file (flock) nên hai bản quét của
+    cùng một phiếu xử lý cùng lúc ở hai tiến trình vẫn chỉ có một bản gốc.
+    """
+    
+    def __init__(self, duong_dan: str, nguong: float = 0.2, so_bit_muc_toi_thieu: int = 24):
+        """
+        Args:
+            duong_dan: File chỉ mục (.jsonl), tạo mới nếu chưa có
+            nguong: Khoảng cách tối đa để coi hai phiếu là trùng
+            so_bit_muc_toi_thieu: Số bit mực tối thiểu của một phiếu để được so sánh
+        """
+        self.duong_dan = duong_dan
+        self.nguong = nguong
+        self.so_bit_muc_toi_thieu = so_bit_muc_toi_thieu
+        self._khoa = threading.Lock()
+        self._vi_tri_doc = 0
+        
+        # Phiếu gốc: khóa và ma trận vân tay theo độ dài vân tay; phiếu trùng: khóa -> thông tin bản gốc
+        self._khoa_goc = {}
+        self._van_tay_goc = {}
+        self._so_bit_muc_goc = {}
+        self._da_gap = set()
+        self.phieu_trung_lap = {}
+    
+    def _doc_tiep(self):
+        """Đọc các dòng được thêm từ lần đọc trước (của tiến trình này hoặc tiến trình khác)"""
+        if not os.path.exists(self.duong_dan):
+            return
+        with open(self.duong_dan, 'rb') as f:
+            f.seek(self._vi_tri_doc)
+            for dong in f:
+                if not dong.endswith(b"\n"):
+                    break  # Dòng đang ghi dở: đọc lại ở lần sau
+                self._vi_tri_doc += len(dong)
+                try:
+                    muc = json.loads(dong)
+                except json.JSONDecodeError:
+                    continue
+                self._ghi_nho(muc)
+    
+    def _ghi_nho(self, muc: dict):
+        self._da_gap.add(muc['khoa'])
+        if muc.get('trung_voi'):
+            self.phieu_trung_lap[muc['khoa']] = {'trung_voi': muc['trung_voi'], 'khoang_cach': muc['khoang_cach']}
+            return
+        if muc.get('phien_ban', 1) != PHIEN_BAN_VAN_TAY:
+            return  # Vân tay lấy theo cách cũ (chỉ mục của phiên bản trước): không so được với vân tay mới
+        van_tay = np.frombuffer(bytes.fromhex(muc['van_tay']), dtype=np.uint8)
+        cac_khoa = self._khoa_goc.setdefault(len(van_tay), [])
+        # Ma trận vân tay tăng dung lượng gấp đôi khi đầy, không chép lại mỗi lần thêm phiếu
+        ma_tran = self._van_tay_goc.get(len(van_tay))
+        if ma_tran is None or len(cac_khoa) == len(ma_tran):
+            moi = np.zeros((max(64, 2 * len(cac_khoa)), len(van_tay)), dtype=np.uint8)
+            so_bit_moi = np.zeros(len(moi), dtype=np.int64)
+            if ma_tran is not None:
+                moi[:len(cac_khoa)] = ma_tran
+                so_bit_moi[:len(cac_khoa)] = self._so_bit_muc_goc[len(van_tay)][:len(cac_khoa)]
+            ma_tran = self._van_tay_goc[len(van_tay)] = moi
+            self._so_bit_muc_goc[len(van_tay)] = so_bit_moi
+        ma_tran[len(cac_khoa)] = van_tay
+        self._so_bit_muc_goc[len(van_tay)][len(cac_khoa)] = _dem_bit(van_tay)
+        cac_khoa.append(muc['khoa'])
+    
+    def _tim_gan_nhat(self, van_tay):
+        """(khóa phiếu gốc gần nhất, khoảng cách) hoặc (None, None)"""
+        so_bit_muc = int(_dem_bit(van_tay))
+        cac_khoa = self._khoa_goc.get(len(van_tay))
+        if not cac_khoa or so_bit_muc < self.so_bit_muc_toi_thieu:
+            return None, None
+        cac_van_tay = self._van_tay_goc[len(van_tay)][:len(cac_khoa)]
+        so_bit_muc_goc = self._so_bit_muc_goc[len(van_tay)][:len(cac_khoa)]
+        
+        # |A ∪ B| = (|A| + |B| + |A xor B|) / 2
+        khac = _dem_bit(cac_van_tay ^ van_tay)
+        hop = (so_bit_muc_goc + so_bit_muc + khac) // 2
+        khoang_cach = np.where(so_bit_muc_goc >= self.so_bit_muc_toi_thieu, khac / np.maximum(hop, 1), np.inf)
+        
+        chi_so = int(np.argmin(khoang_cach))
+        return cac_khoa[chi_so], float(khoang_cach[chi_so])
+    
+    def kiem_tra(self, khoa: str, van_tay):
+        """
+        Tra cứu rồi thêm phiếu vào chỉ mục
+        
+        Args:
+            khoa: Khóa phiếu (đường dẫn ảnh hoặc nguồn#thành_viên)
+            van_tay: Kết quả van_tay_phieu
+        
+        Returns:
+            Dict {'trung_voi', 'khoang_cach'} nếu phiếu trùng với một phiếu gốc, None nếu không
+        """
+        with self._khoa, open(self.duong_dan, 'a', encoding='utf-8') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self._doc_tiep()
+                if khoa in self._da_gap:
+                    # Phiếu đã có trong chỉ mục (chạy lại batch): giữ kết luận cũ
+                    return self.phieu_trung_lap.get(khoa)
+                
+                khoa_goc, khoang_cach = self._tim_gan_nhat(van_tay)
+                muc = {'khoa': khoa, 'van_tay': van_tay.tobytes().hex(), 'phien_ban': PHIEN_BAN_VAN_TAY}
+                if khoa_goc is not None and khoang_cach <= self.nguong:
+                    muc.update(trung_voi=khoa_goc, khoang_cach=round(khoang_cach, 4))
+                f.write(json.dumps(muc, ensure_ascii=False) + "\n")
+                f.flush()
+                self._doc_tiep()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        
+        return self.phieu_trung_lap.get(khoa)
+    
+    def cac_phieu_trung_lap(self) -> dict:
+        """Khóa phiếu trùng -> {'trung_voi', 'khoang_cach'}, gồm cả phiếu do tiến trình khác phát hiện"""
+        with self._khoa:
+            self._doc_tiep()
+            return dict(self.phieu_trung_lap)
@@ -0,0 +1,113 @@
+# xuat_yolo.py - Xuất weights YOLO sang ONNX/OpenVINO để chạy nhanh hơn trên CPU
+import os
+import json
+import shutil
+
+# Import YOLO
+try:
+    from ultralytics import YOLO
+except ImportError:
+    YOLO = None
+
+CAC_BACKEND = ("pt", "onnx", "openvino")
+
+def duong_dan_mo_hinh_xuat(yolo_weights_path, backend, int8=False):
+    """
+    Đường dẫn của mô hình đã xuất tương ứng với weights .pt
+    
+    Args:
+        yolo_weights_path: Đường dẫn weights .pt
+        backend: "onnx" hoặc "openvino"
+        int8: Mô hình đã lượng tử hóa int8 hay không
+    
+    Returns:
+        str: File .onnx hoặc thư mục OpenVINO IR
+    """
+    goc = os.path.splitext(yolo_weights_path)[0]
+    if backend == "onnx":
+        return f"{goc}.onnx"
+    if backend == "openvino":
+        return f"{goc}_int8_openvino_model" if int8 else f"{goc}_openvino_model"
+    raise ValueError(f"Backend không hỗ trợ xuất: {backend}")
+
+def tao_yaml_hieu_chinh(thu_muc_anh, names, thu_muc_luu):
+    """
+    Tạo file cấu hình dataset cho bước hiệu chỉnh int8 từ một thư mục ảnh ô đồng ý/không đồng ý
+    
+    Args:
+        thu_muc_anh: Thư mục chứa ảnh ô đã cắt (ví dụ *_dongy.jpg, *_khongdongy.jpg)
+        names: Dict tên class của mô hình ({0: 'x_mark', 1: 'x_cancelled'})
+        thu_muc_luu: Thư mục lưu file cấu hình
+    
+    Returns:
+        str: Đường dẫn file .yaml
+    """
+    if not os.path.isdir(thu_muc_anh):
+        raise ValueError(f"Thư mục ảnh hiệu chỉnh không tồn tại: {thu_muc_anh}")
+    
+    os.makedirs(thu_muc_luu, exist_ok=True)
+    cau_hinh = {
+        'path': os.path.abspath(thu_muc_anh),
+        'train': '.',
+        'val': '.',
+        'names': {int(k): v for k, v in names.items()}
+    }
+    
+    # JSON là YAML hợp lệ - không cần thêm thư viện yaml
+    duong_dan_yaml = os.path.join(thu_muc_luu, "hieu_chinh_int8.yaml")
+    with open(duong_dan_yaml, 'w', encoding='utf-8') as f:
+        json.dump(cau_hinh, f, ensure_ascii=False, indent=2)
+    
+    return duong_dan_yaml
+
+def xuat_mo_hinh_yolo(yolo_weights_path, backend, int8=False, du_lieu_int8=None):
+    """
+    Xuất weights .pt sang ONNX/OpenVINO (chỉ xuất một lần, dùng lại nếu đã có bản mới hơn weights)
+    
+    Args:
+        yolo_weights_path: Đường dẫn weights .pt
+        backend: "onnx" hoặc "openvino"
+        int8: Lượng tử hóa int8 (chỉ hỗ trợ OpenVINO)
+        du_lieu_int8: Thư mục ảnh ô đã cắt dùng để hiệu chỉnh int8
+    
+    Returns:
+        str: Đường dẫn mô hình đã xuất
+    """
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"Backend không hỗ trợ xuất: {backend}")
+    if int8 and backend != "openvino":
+        raise ValueError("Lượng tử hóa int8 chỉ hỗ trợ backend openvino")
+    if YOLO is None:
+        raise ImportError("Chưa cài ultralytics, không thể xuất mô hình")
+    
+    dich = duong_dan_mo_hinh_xuat(yolo_weights_path, backend, int8)
+    
+    # Dùng lại bản đã xuất nếu còn mới hơn weights gốc
+    if os.path.exists(dich) and os.path.getmtime(dich) >= os.path.getmtime(yolo_weights_path):
+        return dich
+    
+    model = YOLO(yolo_weights_path)
+    tham_so = {
+        'format': backend,
+        'dynamic': True  # Cho phép predict theo lô và đổi imgsz
+    }
+    
+    if int8:
+        if not du_lieu_int8:
+            raise ValueError("Cần thư mục ảnh ô đã cắt (--int8-data) để hiệu chỉnh int8")
+        tham_so['int8'] = True
+        tham_so['data'] = tao_yaml_hieu_chinh(du_lieu_int8, model.names, os.path.dirname(dich) or ".")
+    
+    print(f"[INFO] Đang xuất YOLO sang {backend}{' int8' if int8 else ''}...")
+    ket_qua = str(model.export(**tham_so))
+    
+    # Đưa về đúng tên quy ước để lần sau dùng lại
+    if os.path.abspath(ket_qua) != os.path.abspath(dich):
+        if os.path.isdir(dich):
+            shutil.rmtree(dich)
+        elif os.path.exists(dich):
+            os.remove(dich)
+        shutil.move(ket_qua, dich)
+    
+    print(f"[INFO] Đã xuất YOLO: {dich}")
+    return dich
@@ -0,0 +1,249 @@
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from evaluation.precision_recall import tinh_chi_so
+
+# =============================
+# 1. Cấu hình datasets
+# =============================
+DATASETS = [
+    {
+        'name': 'Data1',
+        'label_file': 'lable_ballot/lable_ballot_data1.json',
+        'result_subdir': 'ket_qua_data1'
+    },
+    {
+        'name': 'Data2',
+        'label_file': 'lable_ballot/lable_ballot_data2.json',
+        'result_subdir': 'ket_qua_data2'
+    }
+]
+
+# Thứ tự cột của ô trong mảng
+CAC_COT = [('dong_y', 'dong_y_yolo'), ('khong_dong_y', 'khong_dong_y_yolo')]
+MA_CLASS = {'x_mark': 0, 'x_cancelled': 1}
+
+# =============================
+# 2. Nạp detection đã lưu thành mảng
+# =============================
+def nap_detection(thu_muc_ket_qua, datasets):
+    """
+    Đọc chi_tiet_detection trong tất cả file *_result.json thành các mảng phẳng
+    
+    Returns:
+        dict: {
+            'nhan': (C,) bool - nhãn từng ô,
+            'o_cua_det': (D,) int - ô chứa detection,
+            'class_det': (D,) int - 0 = x_mark, 1 = x_cancelled,
+            'conf_det': (D,) float,
+            'vi_tri_o': list (dataset, ballot, stt, cột) cho từng ô
+        }
+    """
+    nhan = []
+    o_cua_det = []
+    class_det = []
+    conf_det = []
+    vi_tri_o = []
+    
+    for dataset in datasets:
+        result_dir = os.path.join(thu_muc_ket_qua, dataset['result_subdir'])
+        if not os.path.exists(dataset['label_file']) or not os.path.exists(result_dir):
+            print(f"⚠️ Bỏ qua {dataset['name']}: thiếu file nhãn hoặc thư mục kết quả")
+            continue
+        
+        with open(dataset['label_file'], "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        
+        result_files = sorted(glob.glob(os.path.join(result_dir, "*_result.json")))
+        print(f"🔍 {dataset['name']}: {len(result_files)} file kết quả trong {result_dir}")
+        
+        for file_path in result_files:
+            ballot_name = os.path.basename(file_path).replace("_result.json", "")
+            if ballot_name not in labels:
+                continue
+            
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            except Exception as e:
+                print(f"   ❌ Lỗi đọc file {file_path}: {e}")
+                continue
+            
+            ground_truth = labels[ballot_name]
+            for res in result:
+                stt = res["stt"]
+                if stt - 1 >= len(ground_truth):
+                    continue
+                gt = ground_truth[stt - 1]
+                
+                for khoa_nhan, khoa_yolo in CAC_COT:
+                    chi_so_o = len(nhan)
+                    nhan.append(gt[khoa_nhan] == 1)
+                    vi_tri_o.append((dataset['name'], ballot_name, stt, khoa_nhan))
+                    
+                    for det in res.get("chi_tiet", {}).get(khoa_yolo, {}).get("chi_tiet_detection", []):
+                        if det['class'] not in MA_CLASS:
+                            continue
+                        o_cua_det.append(chi_so_o)
+                        class_det.append(MA_CLASS[det['class']])
+                        conf_det.append(det['confidence'])
+    
+    return {
+        'nhan': np.array(nhan, dtype=bool),
+        'o_cua_det': np.array(o_cua_det, dtype=np.int64),
+        'class_det': np.array(class_det, dtype=np.int64),
+        'conf_det': np.array(conf_det, dtype=np.float64),
+        'vi_tri_o': vi_tri_o
+    }
+
+# =============================
+# 3. Chấm lại theo ngưỡng (vector hóa)
+# =============================
+def conf_cao_nhat_theo_o(du_lieu):
+    """Confidence x_mark và x_cancelled cao nhất của từng ô: hai mảng (C,)"""
+    so_o = len(du_lieu['nhan'])
+    cao_nhat = np.zeros((2, so_o), dtype=np.float64)
+    np.maximum.at(cao_nhat, (du_lieu['class_det'], du_lieu['o_cua_det']), du_lieu['conf_det'])
+    return cao_nhat[0], cao_nhat[1]
+
+def du_doan_theo_nguong(x_mark, x_cancelled, cac_nguong, quy_tac='x_mark', nguong_cancelled=None):
+    """
+    Dự đoán có dấu X cho mọi ô dưới mọi ngưỡng
+    
+    Args:
+        x_mark, x_cancelled: Confidence cao nhất của từng ô (C,)
+        cac_nguong: Các ngưỡng confidence x_mark (T,)
+        quy_tac: 'x_mark' - chỉ cần x_mark vượt ngưỡng (như pipeline);
+                 'suppress' - bỏ ô nếu x_cancelled vượt ngưỡng và cao hơn x_mark
+        nguong_cancelled: Ngưỡng cho x_cancelled (None: dùng cùng ngưỡng với x_mark)
+    
+    Returns:
+        np.ndarray: (T, C) bool
+    """
+    nguong = np.asarray(cac_nguong, dtype=np.float64)[:, None]
+    du_doan = x_mark[None, :] >= nguong
+    
+    if quy_tac == 'suppress':
+        nguong_c = nguong if nguong_cancelled is None else nguong_cancelled
+        bi_huy = (x_cancelled[None, :] >= nguong_c) & (x_cancelled[None, :] > x_mark[None, :])
+        du_doan &= ~bi_huy
+    
+    return du_doan
+
+def tinh_duong_cong(du_doan, nhan):
+    """Precision/Recall/F1/Accuracy cho từng ngưỡng từ ma trận dự đoán (T, C), cùng định nghĩa TP/FP/FN/TN với precision_recall"""
+    TP = (du_doan & nhan).sum(axis=1)
+    FP = (du_doan & ~nhan).sum(axis=1)
+    FN = (~du_doan & nhan).sum(axis=1)
+    TN = (~du_doan & ~nhan).sum(axis=1)
+    
+    chi_so = np.array([tinh_chi_so(tp, fp, fn, tn) for tp, fp, fn, tn in zip(TP, FP, FN, TN)],
+                      dtype=np.float64).reshape(-1, 4)
+    
+    return {
+        'TP': TP, 'FP': FP, 'FN': FN, 'TN': TN,
+        'precision': chi_so[:, 0], 'recall': chi_so[:, 1], 'f1': chi_so[:, 2], 'accuracy': chi_so[:, 3]
+    }
+
+# =============================
+# 4. Ghi lại kết quả theo ngưỡng mới
+# =============================
+def ghi_ket_qua_moi(thu_muc_ket_qua, thu_muc_output, datasets, nguong, quy_tac, nguong_cancelled):
+    """Ghi bản sao các file *_result.json với dong_y/khong_dong_y được tính lại theo ngưỡng mới"""
+    for dataset in datasets:
+        result_dir = os.path.join(thu_muc_ket_qua, dataset['result_subdir'])
+        if not os.path.exists(result_dir):
+            continue
+        
+        output_dir = os.path.join(thu_muc_output, dataset['result_subdir'])
+        os.makedirs(output_dir, exist_ok=True)
+        
+        for file_path in glob.glob(os.path.join(result_dir, "*_result.json")):
+            with open(file_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            
+            for res in result:
+                for khoa_nhan, khoa_yolo in CAC_COT:
+                    detections = res.get("chi_tiet", {}).get(khoa_yolo, {}).get("chi_tiet_detection", [])
+                    x_mark = np.array([max((d['confidence'] for d in detections if d['class'] == 'x_mark'), default=0.0)])
+                    x_cancelled = np.array([max((d['confidence'] for d in detections if d['class'] == 'x_cancelled'), default=0.0)])
+                    res[khoa_nhan] = bool(du_doan_theo_nguong(x_mark, x_cancelled, [nguong], quy_tac, nguong_cancelled)[0, 0])
+            
+            with open(os.path.join(output_dir, os.path.basename(file_path)), "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+    
+    print(f"💾 Đã ghi kết quả chấm lại (ngưỡng {nguong}) vào {thu_muc_output}")
+
+# =============================
+# 5. Hàm chính
+# =============================
+def main():
+    """Chấm lại dấu X từ detection đã lưu dưới nhiều ngưỡng mà không chạy lại mô hình"""
+    parser = argparse.ArgumentParser(description="Chấm lại ngưỡng confidence từ detection đã lưu")
+    parser.add_argument("--results", default="results/ket_qua_trocr_yolo",
+                       help="Thư mục kết quả TrOCR + YOLO (chứa ket_qua_data1, ket_qua_data2)")
+    parser.add_argument("--thresholds", default=None,
+                       help="Danh sách ngưỡng, phân cách bằng dấu phẩy (mặc định: 0.05 đến 0.95, bước 0.05)")
+    parser.add_argument("--rule", choices=["x_mark", "suppress"], default="x_mark",
+                       help="x_mark: chỉ xét x_mark; suppress: x_cancelled mạnh hơn sẽ hủy x_mark")
+    parser.add_argument("--cancel-threshold", type=float, default=None,
+                       help="Ngưỡng riêng cho x_cancelled khi --rule suppress")
+    parser.add_argument("--apply", type=float, default=None,
+                       help="Ghi lại file kết quả với ngưỡng này vào --output")
+    parser.add_argument("--output", default="results/ket_qua_cham_lai",
+                       help="Thư mục lưu kết quả chấm lại (khi dùng --apply)")
+    parser.add_argument("--curve-output", default=None,
+                       help="File JSON lưu đường cong precision/recall/F1")
+    
+    args = parser.parse_args()
+    
+    print("🚀 CHẤM LẠI NGƯỠNG TỪ DETECTION ĐÃ LƯU")
+    
+    if args.thresholds:
+        cac_nguong = np.array([float(x) for x in args.thresholds.split(',')])
+    else:
+        cac_nguong = np.round(np.arange(0.05, 1.0, 0.05), 2)
+    
+    du_lieu = nap_detection(args.results, DATASETS)
+    if len(du_lieu['nhan']) == 0:
+        print("❌ Không có dữ liệu để tính toán")
+        return
+    
+    print(f"📖 {len(du_lieu['nhan'])} ô, {len(du_lieu['conf_det'])} detection")
+    if len(du_lieu['conf_det']) and cac_nguong.min() < du_lieu['conf_det'].min():
+        print(f"⚠️ Ngưỡng dưới {du_lieu['conf_det'].min():.3f} không chính xác: "
+              f"detection yếu hơn ngưỡng conf lúc suy luận không được lưu")
+    
+    x_mark, x_cancelled = conf_cao_nhat_theo_o(du_lieu)
+    du_doan = du_doan_theo_nguong(x_mark, x_cancelled, cac_nguong, args.rule, args.cancel_threshold)
+    duong_cong = tinh_duong_cong(du_doan, du_lieu['nhan'])
+    
+    print(f"\n{'='*60}")
+    print(f"{'Ngưỡng':>8} | {'Precision':>9} | {'Recall':>7} | {'F1':>7} | {'FP':>5} | {'FN':>5}")
+    print(f"{'─'*60}")
+    for i, nguong in enumerate(cac_nguong):
+        print(f"{nguong:8.3f} | {duong_cong['precision'][i]:9.4f} | {duong_cong['recall'][i]:7.4f} | "
+              f"{duong_cong['f1'][i]:7.4f} | {duong_cong['FP'][i]:5d} | {duong_cong['FN'][i]:5d}")
+    
+    tot_nhat = int(np.argmax(duong_cong['f1']))
+    print(f"{'='*60}")
+    print(f"✅ F1 tốt nhất {duong_cong['f1'][tot_nhat]:.4f} tại ngưỡng {cac_nguong[tot_nhat]:.3f} (quy tắc: {args.rule})")
+    
+    if args.curve_output:
+        os.makedirs(os.path.dirname(args.curve_output) or ".", exist_ok=True)
+        with open(args.curve_output, "w", encoding="utf-8") as f:
+            json.dump({
+                'quy_tac': args.rule,
+                'nguong': cac_nguong.tolist(),
+                **{k: v.tolist() for k, v in duong_cong.items()}
+            }, f, ensure_ascii=False, indent=2)
+    
+    if args.apply is not None:
+        ghi_ket_qua_moi(args.results, args.output, DATASETS, args.apply, args.rule, args.cancel_threshold)
+
+if __name__ == "__main__":
+    main()
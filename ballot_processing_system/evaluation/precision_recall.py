@@ -2,6 +2,31 @@ import json
 import os
 import glob
 
+def phan_loai_o(du_doan, thuc_te):
+    """
+    Phân loại kết quả một ô (đồng ý hoặc không đồng ý) so với nhãn
+    
+    Returns:
+        str: 'TP', 'FP', 'FN' hoặc 'TN'
+    """
+    if du_doan and thuc_te:
+        return 'TP'
+    elif du_doan and not thuc_te:
+        return 'FP'
+    elif not du_doan and thuc_te:
+        return 'FN'
+    return 'TN'
+
+def tinh_chi_so(TP, FP, FN, TN):
+    """
+    Tính Precision, Recall, F1, Accuracy từ các giá trị đếm
+    """
+    precision = TP / (TP + FP) if (TP + FP) > 0 else 0
+    recall = TP / (TP + FN) if (TP + FN) > 0 else 0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
+    accuracy = (TP + TN) / (TP + TN + FP + FN) if (TP + TN + FP + FN) > 0 else 0
+    return precision, recall, f1, accuracy
+
 def calculate_overall_metrics(result_dir, labels, dataset_name):
     """
     Tính Precision và Recall cho một dataset
@@ -11,7 +36,7 @@ def calculate_overall_metrics(result_dir, labels, dataset_name):
         labels: Dict chứa nhãn gốc
         dataset_name: Tên dataset (để debug)
     """
-    TP, FP, FN, TN = 0, 0, 0, 0
+    dem = {'TP': 0, 'FP': 0, 'FN': 0, 'TN': 0}
     processed_files = 0
 
     # Lấy tất cả file *_result.json trong thư mục
@@ -58,30 +83,11 @@ def calculate_overall_metrics(result_dir, labels, dataset_name):
             true_no = gt["khong_dong_y"] == 1
 
             # Tính toán cho cả đồng ý và không đồng ý
-            # Đồng ý
-            if pred_yes and true_yes:
-                TP += 1
-            elif pred_yes and not true_yes:
-                FP += 1
-            elif not pred_yes and true_yes:
-                FN += 1
-            elif not pred_yes and not true_yes:
-                TN += 1
-                
-            # Không đồng ý
-            if pred_no and true_no:
-                TP += 1
-            elif pred_no and not true_no:
-                FP += 1
-            elif not pred_no and true_no:
-                FN += 1
-            elif not pred_no and not true_no:
-                TN += 1
+            dem[phan_loai_o(pred_yes, true_yes)] += 1
+            dem[phan_loai_o(pred_no, true_no)] += 1
 
-    precision = TP / (TP + FP) if (TP + FP) > 0 else 0
-    recall = TP / (TP + FN) if (TP + FN) > 0 else 0
-    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-    accuracy = (TP + TN) / (TP + TN + FP + FN) if (TP + TN + FP + FN) > 0 else 0
+    TP, FP, FN, TN = dem['TP'], dem['FP'], dem['FN'], dem['TN']
+    precision, recall, f1, accuracy = tinh_chi_so(TP, FP, FN, TN)
     
     print(f"   ✅ Đã xử lý {processed_files} file")
     print(f"   📊 TP={TP}, FP={FP}, FN={FN}, TN={TN}")
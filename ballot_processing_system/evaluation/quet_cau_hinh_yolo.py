@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import time
+
+from core.tien_xu_ly import straighten_ballot, chon_layout, add_padding_only
+from processors.trocr_yolo import PhieuBauProcessor
+from evaluation.precision_recall import phan_loai_o, tinh_chi_so
+
+# =============================
+# 1. Cấu hình datasets
+# =============================
+DATASETS = [
+    {
+        'name': 'Data1',
+        'label_file': 'lable_ballot/lable_ballot_data1.json',
+        'image_dir': 'ballot/data1'
+    },
+    {
+        'name': 'Data2',
+        'label_file': 'lable_ballot/lable_ballot_data2.json',
+        'image_dir': 'ballot/data2'
+    }
+]
+
+# =============================
+# 2. Nạp ô đồng ý/không đồng ý đã có nhãn
+# =============================
+def nap_o_co_nhan(datasets, so_phieu_toi_da=None):
+    """
+    Làm phẳng các phiếu có nhãn một lần và giữ lại ảnh gốc của từng ô đồng ý/không đồng ý
+    
+    Returns:
+        list: Mỗi phần tử là một phiếu {'ten', 'o': [ảnh ô], 'nhan': [True/False]}
+    """
+    danh_sach_phieu = []
+    
+    for dataset in datasets:
+        if not os.path.exists(dataset['label_file']) or not os.path.exists(dataset['image_dir']):
+            print(f"⚠️ Bỏ qua {dataset['name']}: thiếu file nhãn hoặc thư mục ảnh")
+            continue
+        
+        with open(dataset['label_file'], "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        
+        for filename in sorted(os.listdir(dataset['image_dir'])):
+            ten, ext = os.path.splitext(filename)
+            if ext.lower() not in ('.jpg', '.jpeg', '.png', '.bmp', '.tiff') or ten not in labels:
+                continue
+            if so_phieu_toi_da and len(danh_sach_phieu) >= so_phieu_toi_da:
+                return danh_sach_phieu
+            
+            duong_dan_anh = os.path.join(dataset['image_dir'], filename)
+            try:
+                anh_phang = straighten_ballot(duong_dan_anh)
+                layout = chon_layout(duong_dan_anh)
+            except Exception as e:
+                print(f"   ❌ Lỗi tiền xử lý {filename}: {e}")
+                continue
+            
+            phieu = {'ten': ten, 'o': [], 'nhan': []}
+            for row_idx, row_data in layout.items():
+                if row_idx - 1 >= len(labels[ten]):
+                    continue
+                gt = labels[ten][row_idx - 1]
+                for field, khoa_nhan in (('agree', 'dong_y'), ('disagree', 'khong_dong_y')):
+                    x1, y1, x2, y2 = row_data[field]
+                    phieu['o'].append(anh_phang[y1:y2, x1:x2].copy())
+                    phieu['nhan'].append(gt[khoa_nhan] == 1)
+            
+            danh_sach_phieu.append(phieu)
+    
+    return danh_sach_phieu
+
+# =============================
+# 3. Chuẩn bị ảnh đầu vào theo chế độ
+# =============================
+def chuan_bi_anh(danh_sach_o, che_do):
+    """
+    square: padding vuông 640x640 như pipeline hiện tại
+    rect: chỉ bỏ 5px trên/trái, cắt về cùng kích thước để YOLO letterbox hình chữ nhật
+    """
+    if che_do == 'square':
+        return [add_padding_only(o, (640, 640)) for o in danh_sach_o]
+    
+    danh_sach_anh = [o[5:, 5:] for o in danh_sach_o]
+    h_min = min(anh.shape[0] for anh in danh_sach_anh)
+    w_min = min(anh.shape[1] for anh in danh_sach_anh)
+    return [anh[:h_min, :w_min] for anh in danh_sach_anh]
+
+# =============================
+# 4. Đánh giá một cấu hình
+# =============================
+def danh_gia_cau_hinh(processor, danh_sach_phieu, imgsz, che_do):
+    """Chạy YOLO với một cấu hình, trả về precision/recall/F1 và ms/ô"""
+    processor.imgsz_o = imgsz
+    processor.o_chu_nhat = che_do == 'rect'
+    
+    # Khởi động (warm-up) để không tính thời gian khởi tạo vào kết quả
+    if danh_sach_phieu:
+        processor.kiem_tra_dau_x_theo_lo(chuan_bi_anh(danh_sach_phieu[0]['o'], che_do))
+    
+    dem = {'TP': 0, 'FP': 0, 'FN': 0, 'TN': 0}
+    tong_thoi_gian = 0.0
+    tong_so_o = 0
+    
+    for phieu in danh_sach_phieu:
+        danh_sach_anh = chuan_bi_anh(phieu['o'], che_do)
+        
+        bat_dau = time.perf_counter()
+        ket_qua = processor.kiem_tra_dau_x_theo_lo(danh_sach_anh)
+        tong_thoi_gian += time.perf_counter() - bat_dau
+        tong_so_o += len(danh_sach_anh)
+        
+        for yolo_result, nhan in zip(ket_qua, phieu['nhan']):
+            dem[phan_loai_o(yolo_result['co_dau_x'], nhan)] += 1
+    
+    precision, recall, f1, accuracy = tinh_chi_so(dem['TP'], dem['FP'], dem['FN'], dem['TN'])
+    
+    return {
+        'imgsz': imgsz,
+        'che_do': che_do,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'accuracy': accuracy,
+        'ms_moi_o': tong_thoi_gian / tong_so_o * 1000 if tong_so_o else 0,
+        **dem
+    }
+
+# =============================
+# 5. Hàm chính
+# =============================
+def main():
+    """Quét các cấu hình suy luận YOLO: X-precision/recall so với thời gian mỗi ô"""
+    parser = argparse.ArgumentParser(description="Quét cấu hình suy luận YOLO (độ chính xác vs tốc độ)")
+    parser.add_argument("--weights", default="models/best.pt",
+                       help="Đường dẫn YOLO weights")
+    parser.add_argument("--backend", default="pt",
+                       help="Backend chạy YOLO: pt, onnx hoặc openvino")
+    parser.add_argument("--imgsz", default="640,480,320,256",
+                       help="Danh sách imgsz cần quét, phân cách bằng dấu phẩy")
+    parser.add_argument("--modes", default="square,rect",
+                       help="Danh sách chế độ đầu vào: square (padding 640x640), rect (không padding)")
+    parser.add_argument("--max-det", type=int, default=5,
+                       help="Số detection tối đa trên một ô")
+    parser.add_argument("--conf", type=float, default=0.25,
+                       help="Ngưỡng confidence của YOLO")
+    parser.add_argument("--classes", type=str, default=None,
+                       help="Chỉ giữ các class này, phân cách bằng dấu phẩy")
+    parser.add_argument("--f1-tolerance", type=float, default=0.005,
+                       help="Chấp nhận F1 thấp hơn F1 tốt nhất tối đa bao nhiêu khi chọn cấu hình rẻ nhất")
+    parser.add_argument("--limit", type=int, default=None,
+                       help="Chỉ dùng tối đa N phiếu có nhãn")
+    parser.add_argument("--output", default="results/quet_cau_hinh_yolo.json",
+                       help="File JSON lưu kết quả quét")
+    
+    args = parser.parse_args()
+    
+    print("🚀 QUÉT CẤU HÌNH SUY LUẬN YOLO")
+    
+    processor = PhieuBauProcessor(yolo_weights_path=args.weights,
+                                  yolo_backend=args.backend,
+                                  max_det_o=args.max_det,
+                                  conf_yolo=args.conf,
+                                  lop_yolo=[c.strip() for c in args.classes.split(',')] if args.classes else None)
+    if not processor.yolo_model:
+        print("❌ YOLO model không khả dụng")
+        return
+    
+    danh_sach_phieu = nap_o_co_nhan(DATASETS, args.limit)
+    if not danh_sach_phieu:
+        print("❌ Không có phiếu có nhãn để đánh giá")
+        return
+    print(f"📖 Đã nạp {len(danh_sach_phieu)} phiếu có nhãn ({sum(len(p['o']) for p in danh_sach_phieu)} ô)")
+    
+    ket_qua_quet = []
+    for che_do in [m.strip() for m in args.modes.split(',')]:
+        for imgsz in [int(x) for x in args.imgsz.split(',')]:
+            ket_qua = danh_gia_cau_hinh(processor, danh_sach_phieu, imgsz, che_do)
+            ket_qua_quet.append(ket_qua)
+            print(f"   {che_do:6} imgsz={imgsz:4d} | P={ket_qua['precision']:.4f} R={ket_qua['recall']:.4f} "
+                  f"F1={ket_qua['f1']:.4f} | {ket_qua['ms_moi_o']:.2f} ms/ô")
+    
+    # Chọn cấu hình rẻ nhất có F1 nằm trong dung sai so với F1 tốt nhất
+    f1_tot_nhat = max(kq['f1'] for kq in ket_qua_quet)
+    dat_yeu_cau = [kq for kq in ket_qua_quet if kq['f1'] >= f1_tot_nhat - args.f1_tolerance]
+    de_xuat = min(dat_yeu_cau, key=lambda kq: kq['ms_moi_o'])
+    
+    print(f"\n{'='*60}")
+    print(f"📊 F1 tốt nhất: {f1_tot_nhat:.4f}")
+    print(f"✅ Đề xuất: --imgsz {de_xuat['imgsz']}{' --rect' if de_xuat['che_do'] == 'rect' else ''} "
+          f"--max-det {args.max_det} (F1={de_xuat['f1']:.4f}, {de_xuat['ms_moi_o']:.2f} ms/ô)")
+    print(f"{'='*60}")
+    
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({'ket_qua_quet': ket_qua_quet, 'de_xuat': de_xuat,
+                   'f1_tolerance': args.f1_tolerance}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+# dich_vu.py - Dịch vụ HTTP thường trú xử lý phiếu bầu, giữ mô hình TrOCR + YOLO trong bộ nhớ
+import os
+import argparse
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict
+
+import cv2
+import numpy as np
+
+from core.tien_xu_ly import CAC_LAYOUT
+from core.trocr import get_pipeline
+from core.han_chot import HetThoiGian
+from processors.trocr_yolo import them_tham_so_processor, tao_processor, kiem_tra_tham_so_batch
+
+TRANG_THAI_HTTP = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout"
+}
+
+class LoiYeuCau(Exception):
+    """Lỗi trả về cho client kèm mã HTTP"""
+    
+    def __init__(self, ma: int, thong_diep: str):
+        super().__init__(thong_diep)
+        self.ma = ma
+
+class DichVuPhieuBau:
+    """
+    Dịch vụ HTTP trên asyncio: vòng lặp sự kiện chỉ nhận và trả yêu cầu, việc xử lý phiếu chạy
+    trên nhóm luồng dùng chung một PhieuBauProcessor đã load mô hình.
+    
+    Số phiếu được nhận (đang xử lý + đang chờ luồng) bị giới hạn bởi suc_chua: vượt quá thì trả
+    429 ngay, không đọc ảnh. Khi dừng (SIGINT/SIGTERM), dịch vụ ngừng nhận kết nối mới, trả 503
+    cho yêu cầu mới trên kết nối còn mở và chờ các phiếu đã nhận xử lý xong.
+    
+    Yêu cầu JSON {"duong_dan": ...} chỉ được đọc file nằm trong thu_muc_goc; không có thu_muc_goc
+    thì chỉ nhận ảnh tải lên.
+    """
+    
+    def __init__(self, processor, so_worker: int = 1, suc_chua: int = 8,
+                 kich_thuoc_toi_da: int = 50 * 1024 * 1024, thoi_gian_cho_dung: float = 120,
+                 thu_muc_goc: str = None):
+        """
+        Args:
+            processor: PhieuBauProcessor đã khởi tạo (mô hình đã load)
+            so_worker: Số phiếu xử lý đồng thời
+            suc_chua: Số phiếu tối đa được nhận cùng lúc (đang xử lý + đang chờ)
+            kich_thuoc_toi_da: Kích thước body tối đa (byte)
+            thoi_gian_cho_dung: Thời gian (giây) tối đa chờ các phiếu đã nhận khi dừng
+            thu_muc_goc: Thư mục chứa các ảnh client được trỏ tới bằng đường dẫn (None: tắt chế độ đường dẫn)
+        """
+        if so_worker < 1:
+            raise ValueError("Dịch vụ cần ít nhất một worker")
+        if suc_chua < so_worker:
+            raise ValueError("Sức chứa phải >= số worker")
+        
+        self.processor = processor
+        self.so_worker = so_worker
+        self.suc_chua = suc_chua
+        self.kich_thuoc_toi_da = kich_thuoc_toi_da
+        self.thoi_gian_cho_dung = thoi_gian_cho_dung
+        self.thu_muc_goc = os.path.realpath(thu_muc_goc) if thu_muc_goc else None
+        
+        self._nhom_luong = ThreadPoolExecutor(so_worker, thread_name_prefix="dich_vu")
+        self._server = None
+        self._dang_dung = False
+        self._so_dang_nhan = 0
+        self._het_viec = None
+        
+        self.thong_ke = {
+            'da_nhan': 0,
+            'thanh_cong': 0,
+            'loi': 0,
+            'tu_choi': 0,
+            'thoi_gian_xu_ly': 0.0
+        }
+    
+    async def chay(self, host: str = "127.0.0.1", port: int = 8000):
+        """Chạy dịch vụ đến khi nhận SIGINT/SIGTERM"""
+        loop = asyncio.get_running_loop()
+        self._het_viec = asyncio.Event()
+        self._het_viec.set()
+        
+        tin_hieu_dung = asyncio.Event()
+        for tin_hieu in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(tin_hieu, tin_hieu_dung.set)
+            except NotImplementedError:
+                # Windows: dừng bằng KeyboardInterrupt
+                pass
+        
+        self._server = await asyncio.start_server(self._xu_ly_ket_noi, host, port)
+        print(f"[INFO] Dịch vụ phiếu bầu đang chạy tại http://{host}:{port} "
+              f"({self.so_worker} worker, sức chứa {self.suc_chua} phiếu)")
+        
+        try:
+            await tin_hieu_dung.wait()
+        finally:
+            await self.dung()
+    
+    async def dung(self):
+        """Ngừng nhận kết nối mới và chờ các phiếu đã nhận xử lý xong"""
+        self._dang_dung = True
+        self._server.close()
+        print(f"[INFO] Đang dừng dịch vụ, chờ {self._so_dang_nhan} phiếu đang xử lý...")
+        
+        try:
+            await asyncio.wait_for(self._het_viec.wait(), self.thoi_gian_cho_dung)
+            self._nhom_luong.shutdown(wait=True)
+        except asyncio.TimeoutError:
+            print(f"[WARNING] Hết thời gian chờ, bỏ {self._so_dang_nhan} phiếu chưa xử lý xong")
+            self._nhom_luong.shutdown(wait=False, cancel_futures=True)
+        
+        await self._server.wait_closed()
+        print(f"[INFO] Dịch vụ đã dừng: {self.thong_ke}")
+    
+    async def _xu_ly_ket_noi(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Mỗi kết nối một yêu cầu (Connection: close)"""
+        try:
+            try:
+                ma, noi_dung = await self._dinh_tuyen(reader)
+            except LoiYeuCau as e:
+                ma, noi_dung = e.ma, {'loi': str(e)}
+            except Exception as e:
+                ma, noi_dung = 500, {'loi': str(e)}
+            await self._gui_phan_hoi(writer, ma, noi_dung)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _doc_tieu_de(self, reader: asyncio.StreamReader):
+        """Đọc dòng yêu cầu và header HTTP"""
+        dong_dau = (await reader.readline()).decode('latin-1').strip()
+        phan = dong_dau.split()
+        if len(phan) != 3:
+            raise LoiYeuCau(400, "Dòng yêu cầu HTTP không hợp lệ")
+        
+        tieu_de = {}
+        while True:
+            dong = (await reader.readline()).decode('latin-1').strip()
+            if not dong:
+                break
+            khoa, _, gia_tri = dong.partition(':')
+            tieu_de[khoa.strip().lower()] = gia_tri.strip()
+        
+        return phan[0].upper(), urlsplit(phan[1]), tieu_de
+    
+    async def _dinh_tuyen(self, reader: asyncio.StreamReader):
+        phuong_thuc, url, tieu_de = await self._doc_tieu_de(reader)
+        
+        if url.path == "/health":
+            return 200, {
+                'trang_thai': 'dang_dung' if self._dang_dung else 'san_sang',
+                'dang_xu_ly': self._so_dang_nhan,
+                'suc_chua': self.suc_chua,
+                'thong_ke': self.thong_ke
+            }
+        
+        if url.path != "/phieu":
+            raise LoiYeuCau(404, f"Không có endpoint {url.path}")
+        if phuong_thuc != "POST":
+            raise LoiYeuCau(405, "Chỉ hỗ trợ POST /phieu")
+        
+        # Kiểm tra tải trước khi đọc body, phiếu bị từ chối không tốn công đọc ảnh
+        if self._dang_dung:
+            raise LoiYeuCau(503, "Dịch vụ đang dừng")
+        if self._so_dang_nhan >= self.suc_chua:
+            self.thong_ke['tu_choi'] += 1
+            raise LoiYeuCau(429, f"Quá tải: đang có {self._so_dang_nhan} phiếu, thử lại sau")
+        
+        try:
+            do_dai = int(tieu_de.get('content-length', 0))
+        except ValueError:
+            raise LoiYeuCau(400, "Content-Length không hợp lệ")
+        if do_dai <= 0:
+            raise LoiYeuCau(400, "Thiếu body (ảnh phiếu hoặc JSON {\"duong_dan\": ...})")
+        if do_dai > self.kich_thuoc_toi_da:
+            raise LoiYeuCau(413, f"Body {do_dai} byte vượt quá giới hạn {self.kich_thuoc_toi_da} byte")
+        
+        # Nhận phiếu trước khi await để không vượt sức chứa
+        self._so_dang_nhan += 1
+        self._het_viec.clear()
+        self.thong_ke['da_nhan'] += 1
+        try:
+            body = await reader.readexactly(do_dai)
+            yeu_cau = self._phan_tich_yeu_cau(url, tieu_de, body)
+            
+            loop = asyncio.get_running_loop()
+            ket_qua = await loop.run_in_executor(self._nhom_luong, self._xu_ly_phieu, yeu_cau)
+            self.thong_ke['thanh_cong'] += 1
+            self.thong_ke['thoi_gian_xu_ly'] = round(self.thong_ke['thoi_gian_xu_ly'] + ket_qua['thoi_gian_xu_ly'], 3)
+            return 200, ket_qua
+        except Exception:
+            self.thong_ke['loi'] += 1
+            raise
+        finally:
+            self._so_dang_nhan -= 1
+            if self._so_dang_nhan == 0:
+                self._het_viec.set()
+    
+    def _phan_tich_yeu_cau(self, url, tieu_de: Dict, body: bytes) -> Dict:
+        """
+        Body là ảnh phiếu (tên và layout qua query ?ten=...&layout=...) hoặc
+        JSON {"duong_dan": ..., "layout": ...} trỏ tới ảnh trong thu_muc_goc trên máy chạy dịch vụ
+        """
+        tham_so = {khoa: gia_tri[0] for khoa, gia_tri in parse_qs(url.query).items()}
+        
+        if tieu_de.get('content-type', '').startswith('application/json'):
+            try:
+                du_lieu_json = json.loads(body)
+            except ValueError:
+                raise LoiYeuCau(400, "JSON không hợp lệ")
+            if not isinstance(du_lieu_json, dict):
+                raise LoiYeuCau(400, "JSON phải là object {\"duong_dan\": ...}")
+            tham_so.update(du_lieu_json)
+            ten_file = tham_so.get('duong_dan')
+            if not ten_file or not isinstance(ten_file, str):
+                raise LoiYeuCau(400, "JSON cần khóa 'duong_dan'")
+            duong_dan = self._duong_dan_trong_thu_muc_goc(ten_file)
+            du_lieu_anh = None
+            ten = tham_so.get('ten', ten_file)
+        else:
+            du_lieu_anh = body
+            ten = tham_so.get('ten', 'phieu_tai_len')
+        
+        ten_layout = tham_so.get('layout')
+        if ten_layout is not None and ten_layout not in CAC_LAYOUT:
+            raise LoiYeuCau(400, f"Layout không hợp lệ: {ten_layout} (hỗ trợ: {', '.join(CAC_LAYOUT)})")
+        
+        return {'ten': ten, 'duong_dan': duong_dan if du_lieu_anh is None else None,
+                'du_lieu_anh': du_lieu_anh, 'layout': ten_layout}
+    
+    def _duong_dan_trong_thu_muc_goc(self, ten_file: str) -> str:
+        """
+        Đường dẫn thật của file client trỏ tới (tương đối theo thu_muc_goc). File ngoài thu_muc_goc
+        và file không tồn tại cùng trả 403 để client không dò được file nào có trên máy
+        """
+        if self.thu_muc_goc is None:
+            raise LoiYeuCau(403, "Chế độ đường dẫn đang tắt (chạy dịch vụ với --path-root), hãy tải ảnh lên")
+        
+        duong_dan = os.path.realpath(os.path.join(self.thu_muc_goc, ten_file))
+        if os.path.commonpath([duong_dan, self.thu_muc_goc]) != self.thu_muc_goc or not os.path.isfile(duong_dan):
+            raise LoiYeuCau(403, f"Không đọc được file {ten_file} trong thư mục cho phép")
+        return duong_dan
+    
+    def _xu_ly_phieu(self, yeu_cau: Dict) -> Dict:
+        """Chạy trên nhóm luồng: decode ảnh, xử lý phiếu (ảnh cắt giữ trong bộ nhớ)"""
+        bat_dau = time.perf_counter()
+        
+        anh = None
+        if yeu_cau['du_lieu_anh'] is not None:
+            anh = cv2.imdecode(np.frombuffer(yeu_cau['du_lieu_anh'], dtype=np.uint8), cv2.IMREAD_COLOR)
+            if anh is None:
+                raise LoiYeuCau(400, "Không decode được ảnh")
+        
+        layout = CAC_LAYOUT[yeu_cau['layout']]() if yeu_cau['layout'] else None
+        try:
+            ket_qua = self.processor.xu_ly_phieu_bau_hoan_chinh(yeu_cau['duong_dan'] or yeu_cau['ten'], None,
+                                                                anh=anh, layout=layout)
+        except HetThoiGian as e:
+            # Phiếu bị hủy theo --ballot-timeout / --stage-timeout
+            raise LoiYeuCau(504, str(e))
+        if not ket_qua:
+            raise LoiYeuCau(422, "Không thể tiền xử lý ảnh (kiểm tra ArUco markers hoặc truyền layout)")
+        
+        return {
+            'ten': yeu_cau['ten'],
+            'ket_qua': ket_qua,
+            'thoi_gian_xu_ly': round(time.perf_counter() - bat_dau, 3)
+        }
+    
+    async def _gui_phan_hoi(self, writer: asyncio.StreamWriter, ma: int, noi_dung: Dict):
+        du_lieu = json.dumps(noi_dung, ensure_ascii=False).encode('utf-8')
+        tieu_de = [
+            f"HTTP/1.1 {ma} {TRANG_THAI_HTTP.get(ma, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(du_lieu)}",
+            "Connection: close"
+        ]
+        if ma in (429, 503):
+            tieu_de.append("Retry-After: 1")
+        
+        writer.write(("\r\n".join(tieu_de) + "\r\n\r\n").encode('latin-1') + du_lieu)
+        await writer.drain()
+
+def main():
+    """Chạy dịch vụ HTTP xử lý phiếu bầu"""
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP xử lý phiếu bầu với TrOCR + YOLO thường trú")
+    parser.add_argument("--host", default="127.0.0.1",
+                       help="Địa chỉ lắng nghe (mặc định: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000,
+                       help="Cổng lắng nghe (mặc định: 8000)")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="Số phiếu xử lý đồng thời (mặc định: 1)")
+    parser.add_argument("--max-pending", type=int, default=8,
+                       help="Số phiếu tối đa được nhận cùng lúc, vượt quá trả 429 (mặc định: 8)")
+    parser.add_argument("--max-body-mb", type=float, default=50,
+                       help="Kích thước ảnh tải lên tối đa (MB, mặc định: 50)")
+    parser.add_argument("--drain-timeout", type=float, default=120,
+                       help="Thời gian (giây) tối đa chờ các phiếu đang xử lý khi dừng (mặc định: 120)")
+    parser.add_argument("--path-root", type=str, default=None,
+                       help="Thư mục chứa ảnh client được trỏ tới bằng JSON {\"duong_dan\": ...}, "
+                            "đường dẫn tương đối theo thư mục này (mặc định: tắt, chỉ nhận ảnh tải lên)")
+    them_tham_so_processor(parser)
+    
+    args = parser.parse_args()
+    kiem_tra_tham_so_batch(parser, args, "dịch vụ HTTP")
+    
+    processor = tao_processor(args)
+    
+    # Load TrOCR ngay để yêu cầu đầu tiên không phải chờ load mô hình
+    try:
+        get_pipeline()
+    except Exception as e:
+        print(f"[WARNING] Không thể load TrOCR: {e}")
+    
+    dich_vu = DichVuPhieuBau(processor,
+                             so_worker=args.workers,
+                             suc_chua=args.max_pending,
+                             kich_thuoc_toi_da=int(args.max_body_mb * 1024 * 1024),
+                             thoi_gian_cho_dung=args.drain_timeout,
+                             thu_muc_goc=args.path_root)
+    asyncio.run(dich_vu.chay(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+# only_opencv.py - Hệ thống xử lý phiếu bầu chỉ dùng thị giác máy tính cổ điển (không dùng mô hình)
+import os
+import argparse
+import json
+from typing import List, Dict
+from datetime import datetime
+
+# Import các module tự viết
+from core.tien_xu_ly import straighten_ballot, chon_layout
+from core.loc_muc import nhi_phan_hoa, tinh_ti_le_muc, cat_vung_trong, phan_tich_net_but
+from core.ke_hoach_luong import lap_ke_hoach, ap_dung_ke_hoach, in_ke_hoach
+
+# Danh sách ứng viên in sẵn trên mẫu phiếu (theo thứ tự dòng)
+DANH_SACH_UNG_VIEN = [
+    "OLIVER JOHNSON",
+    "SOPHIA MILLER",
+    "JAMES ROBINSON",
+    "EMILY HARRIS",
+    "BENJAMIN SCOTT",
+    "CHARLOTTE WALKER",
+    "WILLIAM TURNER",
+    "AMELIA COOPER",
+    "DANIEL PARKER",
+    "GRACE MITCHELL"
+]
+
+class PhieuBauOpenCVProcessor:
+    """
+    Lớp xử lý phiếu bầu chỉ sử dụng OpenCV (mật độ mực + nét chéo Hough), không cần TrOCR/YOLO
+    """
+    
+    def __init__(self,
+                 danh_sach_ung_vien: List[str] = None,
+                 nguong_o_trong: float = 0.01,
+                 nguong_net_cheo: float = 0.5,
+                 nguong_gach_bo_muc: float = 0.3,
+                 nguong_gach_bo_net: float = 1.0):
+        """
+        Khởi tạo processor
+        
+        Args:
+            danh_sach_ung_vien: Tên ứng viên theo thứ tự dòng (mặc định: danh sách trên mẫu phiếu)
+            nguong_o_trong: Ô có tỉ lệ mực nhỏ hơn ngưỡng này là ô trống
+            nguong_net_cheo: Độ dài tương đối tối thiểu để coi là có nét chéo theo một hướng
+            nguong_gach_bo_muc: Tỉ lệ mực từ ngưỡng này trở lên coi là dấu X bị tô/gạch bỏ
+            nguong_gach_bo_net: Tổng độ dài nét ngang + dọc từ ngưỡng này trở lên coi là dấu X bị gạch bỏ
+        """
+        self.danh_sach_ung_vien = danh_sach_ung_vien or DANH_SACH_UNG_VIEN
+        self.nguong_o_trong = nguong_o_trong
+        self.nguong_net_cheo = nguong_net_cheo
+        self.nguong_gach_bo_muc = nguong_gach_bo_muc
+        self.nguong_gach_bo_net = nguong_gach_bo_net
+    
+    def phan_loai_o(self, ti_le_muc: float, net_but: Dict) -> Dict:
+        """
+        Phân loại một ô: trống, x_mark (dấu X hợp lệ) hoặc x_cancelled (dấu X bị gạch bỏ)
+        
+        Args:
+            ti_le_muc: Tỉ lệ mực bên trong ô
+            net_but: Độ dài các nét theo hướng (kết quả của phan_tich_net_but)
+        
+        Returns:
+            Dict chứa thông tin về dấu X
+        """
+        co_cheo_xuoi = net_but['cheo_xuoi'] >= self.nguong_net_cheo
+        co_cheo_nguoc = net_but['cheo_nguoc'] >= self.nguong_net_cheo
+        net_gach = net_but['ngang'] + net_but['doc']
+        
+        if ti_le_muc < self.nguong_o_trong:
+            loai, ly_do = 'trong', 'it_muc'
+        elif ti_le_muc >= self.nguong_gach_bo_muc:
+            # Ô bị tô kín - dấu X đã bị xóa/gạch bỏ
+            loai, ly_do = 'x_cancelled', 'to_kin'
+        elif (co_cheo_xuoi or co_cheo_nguoc) and net_gach >= self.nguong_gach_bo_net:
+            # Dấu X có thêm nét gạch ngang/dọc đè lên
+            loai, ly_do = 'x_cancelled', 'net_gach_de_len'
+        elif co_cheo_xuoi and co_cheo_nguoc:
+            loai, ly_do = 'x_mark', 'hai_net_cheo'
+        elif co_cheo_xuoi or co_cheo_nguoc:
+            # Chỉ thấy một nét chéo rõ (nét còn lại cong/đứt) - vẫn coi là đánh dấu
+            loai, ly_do = 'x_mark', 'mot_net_cheo'
+        else:
+            loai, ly_do = 'trong', 'khong_co_net_cheo'
+        
+        return {
+            'co_dau_x': loai == 'x_mark',
+            'loai_dau': loai,
+            'ti_le_muc': float(ti_le_muc),
+            'net_but': {k: round(v, 4) for k, v in net_but.items()},
+            'ly_do': ly_do,
+            'loi': None
+        }
+    
+    def xu_ly_phieu_bau_hoan_chinh(self, duong_dan_anh: str) -> List[Dict]:
+        """
+        Xử lý hoàn chỉnh một phiếu bầu (không lưu ảnh cắt ra đĩa)
+        
+        Args:
+            duong_dan_anh: Đường dẫn đến ảnh phiếu bầu gốc
+        
+        Returns:
+            List các kết quả xử lý cho từng dòng
+        """
+        # Bước 1: Làm phẳng và chọn layout
+        try:
+            anh_phang = straighten_ballot(duong_dan_anh)
+            layout = chon_layout(duong_dan_anh)
+        except Exception as e:
+            print(f"  [ERROR] Không thể tiền xử lý ảnh: {e}")
+            return []
+        
+        # Bước 2: Nhị phân hóa một lần và tính tỉ lệ mực cho tất cả ô đồng ý/không đồng ý
+        binary = nhi_phan_hoa(anh_phang)
+        
+        vi_tri_o = []
+        danh_sach_vung = []
+        for row_idx, row_data in layout.items():
+            for field in ('agree', 'disagree'):
+                if field in row_data:
+                    vi_tri_o.append((row_idx, field))
+                    danh_sach_vung.append(row_data[field])
+        
+        ti_le_muc = tinh_ti_le_muc(anh_phang, danh_sach_vung, binary=binary)
+        
+        # Bước 3: Phân loại từng ô (chỉ phân tích nét với ô có mực)
+        ket_qua_o = {}
+        for (row_idx, field), vung, ti_le in zip(vi_tri_o, danh_sach_vung, ti_le_muc):
+            try:
+                if ti_le < self.nguong_o_trong:
+                    net_but = {'cheo_xuoi': 0.0, 'cheo_nguoc': 0.0, 'ngang': 0.0, 'doc': 0.0}
+                else:
+                    net_but = phan_tich_net_but(cat_vung_trong(binary, vung))
+                ket_qua_o[(row_idx, field)] = self.phan_loai_o(ti_le, net_but)
+            except Exception as e:
+                ket_qua_o[(row_idx, field)] = {
+                    'co_dau_x': False,
+                    'loai_dau': 'loi',
+                    'ti_le_muc': float(ti_le),
+                    'net_but': {},
+                    'ly_do': 'loi_xu_ly',
+                    'loi': str(e)
+                }
+        
+        # Bước 4: Ghép kết quả theo dòng
+        ket_qua_tong = []
+        for i, row_idx in enumerate(layout.keys(), 1):
+            dong_y_info = ket_qua_o.get((row_idx, 'agree'), {})
+            khong_dong_y_info = ket_qua_o.get((row_idx, 'disagree'), {})
+            
+            ho_ten = self.danh_sach_ung_vien[i - 1] if i <= len(self.danh_sach_ung_vien) else ''
+            loi = [f"Lỗi xử lý {loai}: {info['loi']}"
+                   for loai, info in (('dongy', dong_y_info), ('khongdongy', khong_dong_y_info))
+                   if info.get('loi')]
+            
+            ket_qua_tong.append({
+                'stt': i,
+                'ho_ten': ho_ten,
+                'dong_y': dong_y_info.get('co_dau_x', False),
+                'khong_dong_y': khong_dong_y_info.get('co_dau_x', False),
+                'chi_tiet': {
+                    'ho_ten_nguon': 'danh_sach_mau',
+                    'dong_y_opencv': dong_y_info,
+                    'khong_dong_y_opencv': khong_dong_y_info,
+                    'loi': loi
+                },
+                'so_dong': i
+            })
+        
+        # Bước 5: Tổng hợp kết quả
+        self.in_ket_qua_tong_hop(ket_qua_tong)
+        
+        return ket_qua_tong
+    
+    def in_ket_qua_tong_hop(self, ket_qua_tong: List[Dict]):
+        """
+        In kết quả tổng hợp
+        """
+        print(f"\n{'='*70}")
+        print(f"KẾT QUẢ XỬ LÝ PHIẾU BẦU - CHỈ DÙNG OpenCV")
+        print(f"{'='*70}")
+        
+        tong_dong = len(ket_qua_tong)
+        so_dong_y = sum(1 for kq in ket_qua_tong if kq['dong_y'])
+        so_khong_dong_y = sum(1 for kq in ket_qua_tong if kq['khong_dong_y'])
+        so_khong_chon = sum(1 for kq in ket_qua_tong if not kq['dong_y'] and not kq['khong_dong_y'])
+        so_chon_ca_hai = sum(1 for kq in ket_qua_tong if kq['dong_y'] and kq['khong_dong_y'])
+        
+        print(f"Tổng số ứng viên: {tong_dong}")
+        print(f"Đồng ý: {so_dong_y}")
+        print(f"Không đồng ý: {so_khong_dong_y}")
+        print(f"Không chọn: {so_khong_chon}")
+        print(f"Chọn cả hai (lỗi): {so_chon_ca_hai}")
+        
+        print(f"\nCHI TIẾT TỪNG ỨNG VIÊN:")
+        print("-" * 70)
+        
+        for kq in ket_qua_tong:
+            trang_thai = "❌ Lỗi (chọn cả hai)" if (kq['dong_y'] and kq['khong_dong_y']) else \
+                        "✅ Đồng ý" if kq['dong_y'] else \
+                        "❌ Không đồng ý" if kq['khong_dong_y'] else \
+                        "⚪ Không chọn"
+            
+            dong_y_info = kq['chi_tiet']['dong_y_opencv']
+            khong_dong_y_info = kq['chi_tiet']['khong_dong_y_opencv']
+            
+            print(f"Dòng {kq['so_dong']:2d} | STT: {kq['stt']:3d} | {kq['ho_ten']:25s} | {trang_thai}")
+            print(f"       | Đồng ý: {dong_y_info.get('loai_dau', 'N/A')}({dong_y_info.get('ti_le_muc', 0):.3f}) "
+                  f"| Không đồng ý: {khong_dong_y_info.get('loai_dau', 'N/A')}({khong_dong_y_info.get('ti_le_muc', 0):.3f})")
+    
+    def xu_ly_nhieu_phieu_bau(self,
+                              thu_muc_anh=None,
+                              thu_muc_output: str = "results/ket_qua_only_opencv") -> Dict:
+        """
+        Xử lý nhiều phiếu bầu trong các thư mục (hỗ trợ ballot/data1, ballot/data2)
+        
+        Args:
+            thu_muc_anh: Thư mục hoặc danh sách thư mục chứa ảnh phiếu bầu (mặc định: ["ballot/data1", "ballot/data2"])
+            thu_muc_output: Thư mục lưu kết quả (mặc định: results/ket_qua_only_opencv)
+        
+        Returns:
+            Dict chứa kết quả tổng hợp
+        """
+        # Xử lý tham số đầu vào
+        if thu_muc_anh is None:
+            thu_muc_anh = ["ballot/data1", "ballot/data2"]  # Mặc định xử lý cả 2 thư mục
+        elif isinstance(thu_muc_anh, str):
+            thu_muc_anh = [thu_muc_anh]  # Chuyển string thành list
+        
+        # Tạo thư mục output chính
+        os.makedirs(thu_muc_output, exist_ok=True)
+        
+        ket_qua_tong_hop = {}
+        total_files = 0
+        total_success = 0
+        thoi_gian_bat_dau = datetime.now()
+        
+        for input_dir in thu_muc_anh:
+            if not os.path.exists(input_dir):
+                print(f"⚠️ Thư mục {input_dir} không tồn tại, bỏ qua...")
+                continue
+            
+            # Tạo thư mục con cho từng input_dir
+            sub_output_dir = os.path.join(thu_muc_output, f"ket_qua_{os.path.basename(input_dir)}")
+            os.makedirs(sub_output_dir, exist_ok=True)
+            
+            # Lấy danh sách ảnh
+            image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+            image_files = []
+            
+            for filename in os.listdir(input_dir):
+                if any(filename.lower().endswith(ext) for ext in image_extensions):
+                    image_files.append(os.path.join(input_dir, filename))
+            
+            if not image_files:
+                print(f"❌ Không tìm thấy ảnh nào trong {input_dir}!")
+                continue
+            
+            total_files += len(image_files)
+            
+            for i, image_path in enumerate(image_files, 1):
+                try:
+                    ten_file = os.path.splitext(os.path.basename(image_path))[0]
+                    
+                    # Xử lý phiếu bầu
+                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path)
+                    ket_qua_tong_hop[image_path] = ket_qua
+                    
+                    # Lưu kết quả chi tiết riêng cho từng phiếu
+                    self.luu_ket_qua_json(ket_qua, os.path.join(sub_output_dir, f"{ten_file}_result.json"))
+                    
+                    total_success += 1
+                
+                except Exception as e:
+                    print(f"❌ Lỗi xử lý {image_path}: {str(e)}")
+                    ket_qua_tong_hop[image_path] = []
+        
+        thoi_gian_chay = (datetime.now() - thoi_gian_bat_dau).total_seconds()
+        
+        # Tạo file tổng hợp
+        tong_hop_don_gian = self.tao_tong_hop_don_gian(ket_qua_tong_hop)
+        self.luu_ket_qua_json(tong_hop_don_gian, os.path.join(thu_muc_output, "tong_hop_ket_qua.json"))
+        
+        # In thông tin tổng kết
+        print(f"\n{'='*70}")
+        print(f"TỔNG KẾT QUẢ XỬ LÝ BATCH - CHỈ DÙNG OpenCV")
+        print(f"{'='*70}")
+        print(f"Tổng số phiếu: {tong_hop_don_gian['tong_so_phieu_bau']}")
+        print(f"Phiếu hợp lệ: {tong_hop_don_gian['tong_so_phieu_hop_le']}")
+        print(f"Phiếu lỗi: {tong_hop_don_gian['tong_so_phieu_loi']}")
+        print(f"Đã xử lý: {total_success}/{total_files} ảnh từ {len(thu_muc_anh)} thư mục")
+        if thoi_gian_chay > 0:
+            print(f"Tốc độ: {total_success / thoi_gian_chay * 60:.0f} phiếu/phút")
+        
+        if tong_hop_don_gian['danh_sach_phieu_loi']:
+            print(f"\nDanh sách phiếu lỗi:")
+            for phieu_loi in tong_hop_don_gian['danh_sach_phieu_loi']:
+                print(f"  - {phieu_loi}")
+        
+        print(f"\nTop 5 ứng viên được đồng ý nhiều nhất:")
+        for i, ung_vien in enumerate(tong_hop_don_gian['ket_qua_binh_chon'][:5], 1):
+            print(f"  {i}. {ung_vien['ho_ten']}: {ung_vien['so_luot_dong_y']} lượt")
+        
+        return ket_qua_tong_hop
+    
+    def tao_tong_hop_don_gian(self, ket_qua_tong_hop: Dict) -> Dict:
+        """
+        Tạo file tổng hợp đơn giản chỉ có tên và số lượng đồng ý
+        
+        Args:
+            ket_qua_tong_hop: Kết quả chi tiết từ tất cả phiếu bầu
+        
+        Returns:
+            Dict chứa thống kê đơn giản
+        """
+        # Đếm số lượt đồng ý cho từng người
+        dem_dong_y = {}
+        tong_so_phieu_hop_le = 0
+        danh_sach_phieu_loi = []
+        
+        for file_path, ket_qua_phieu in ket_qua_tong_hop.items():
+            ten_file = os.path.basename(file_path)
+            
+            if ket_qua_phieu:  # Nếu có kết quả
+                # Kiểm tra xem phiếu có lỗi không
+                phieu_co_loi = False
+                
+                for ung_vien in ket_qua_phieu:
+                    dong_y = ung_vien['dong_y']
+                    khong_dong_y = ung_vien['khong_dong_y']
+                    
+                    # Kiểm tra lỗi: chọn cả hai hoặc không chọn gì
+                    if (dong_y and khong_dong_y) or (not dong_y and not khong_dong_y):
+                        phieu_co_loi = True
+                        break
+                
+                if phieu_co_loi:
+                    # Phiếu lỗi - không tính vào kết quả
+                    danh_sach_phieu_loi.append(ten_file)
+                else:
+                    # Phiếu hợp lệ - tính vào kết quả
+                    tong_so_phieu_hop_le += 1
+                    for ung_vien in ket_qua_phieu:
+                        ten = ung_vien['ho_ten']
+                        dong_y = ung_vien['dong_y']
+                        
+                        if ten and ten.strip():  # Nếu có tên
+                            if ten not in dem_dong_y:
+                                dem_dong_y[ten] = 0
+                            if dong_y:
+                                dem_dong_y[ten] += 1
+        
+        # Sắp xếp theo số lượt đồng ý giảm dần
+        danh_sach_ket_qua = []
+        for ten, so_dong_y in sorted(dem_dong_y.items(), key=lambda x: x[1], reverse=True):
+            danh_sach_ket_qua.append({
+                'ho_ten': ten,
+                'so_luot_dong_y': so_dong_y
+            })
+        
+        return {
+            'tong_so_phieu_bau': len(ket_qua_tong_hop),
+            'tong_so_phieu_hop_le': tong_so_phieu_hop_le,
+            'tong_so_phieu_loi': len(danh_sach_phieu_loi),
+            'danh_sach_phieu_loi': danh_sach_phieu_loi,
+            'tong_so_ung_vien': len(dem_dong_y),
+            'ket_qua_binh_chon': danh_sach_ket_qua,
+            'thoi_gian_xu_ly': self.get_current_time(),
+            'phuong_phap': 'OpenCV cổ điển - không dùng TrOCR/YOLO'
+        }
+    
+    def get_current_time(self) -> str:
+        """
+        Lấy thời gian hiện tại
+        """
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    def luu_ket_qua_json(self, data, file_path: str):
+        """
+        Lưu kết quả ra file JSON
+        """
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except Exception:
+            pass
+
+def doc_danh_sach_ung_vien(duong_dan: str) -> List[str]:
+    """
+    Đọc danh sách ứng viên từ file JSON: một list tên, hoặc dict có khóa "name"
+    (cùng định dạng với lable_ballot/lable_ballot_*.json)
+    """
+    with open(duong_dan, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    
+    if isinstance(data, dict):
+        data = data.get('name', [])
+    
+    return [str(ten) for ten in data]
+
+def main():
+    """
+    Hàm main để test hệ thống
+    """
+    parser = argparse.ArgumentParser(description="Xử lý phiếu bầu chỉ với OpenCV (không dùng mô hình)")
+    parser.add_argument("--input", default=None,
+                       help="Thư mục hoặc danh sách thư mục chứa ảnh phiếu bầu (mặc định: ballot/data1,ballot/data2)")
+    parser.add_argument("--output", default="results/ket_qua_only_opencv",
+                       help="Thư mục lưu kết quả (mặc định: results/ket_qua_only_opencv)")
+    parser.add_argument("--single", type=str,
+                       help="Xử lý một ảnh cụ thể")
+    parser.add_argument("--roster", type=str, default=None,
+                       help="File JSON danh sách ứng viên (list tên hoặc dict có khóa 'name')")
+    parser.add_argument("--blank-threshold", type=float, default=0.01,
+                       help="Tỉ lệ mực dưới ngưỡng này được coi là ô trống (mặc định: 0.01)")
+    parser.add_argument("--threads", type=int, default=0,
+                       help="Số lõi CPU được dùng (mặc định: 0 - tất cả lõi)")
+    parser.add_argument("--pin-cpu", action="store_true",
+                       help="Ghim tiến trình vào các lõi được dùng")
+    
+    args = parser.parse_args()
+    
+    # Xử lý tham số input
+    if args.input:
+        if ',' in args.input:
+            input_dirs = [dir.strip() for dir in args.input.split(',')]
+        else:
+            input_dirs = args.input
+    else:
+        input_dirs = None  # Sẽ dùng mặc định ["ballot/data1", "ballot/data2"]
+    
+    danh_sach_ung_vien = doc_danh_sach_ung_vien(args.roster) if args.roster else None
+    
+    # Kế hoạch luồng: xử lý tuần tự, một worker dùng toàn bộ lõi
+    ke_hoach_luong = lap_ke_hoach(so_loi=args.threads or None, ghim_cpu=args.pin_cpu)
+    in_ke_hoach(ke_hoach_luong)
+    ap_dung_ke_hoach(ke_hoach_luong)
+    
+    # Khởi tạo processor
+    processor = PhieuBauOpenCVProcessor(danh_sach_ung_vien=danh_sach_ung_vien,
+                                        nguong_o_trong=args.blank_threshold)
+    
+    if args.single:
+        # Xử lý một ảnh
+        if os.path.exists(args.single):
+            ket_qua = processor.xu_ly_phieu_bau_hoan_chinh(args.single)
+        else:
+            print(f"[ERROR] File không tồn tại: {args.single}")
+    else:
+        # Xử lý batch
+        ket_qua = processor.xu_ly_nhieu_phieu_bau(input_dirs, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ from datetime import datetime
 # Import các module tự viết
 from core.tien_xu_ly import xu_ly_phieu_bau
 from core.trocr import doc_ten_tu_anh
+from core.ke_hoach_luong import lap_ke_hoach, ap_dung_ke_hoach, in_ke_hoach
 
 class PhieuBauTrOCRProcessor:
     """
@@ -505,6 +506,10 @@ def main():
                        help="Thư mục lưu kết quả (mặc định: results/ket_qua_only_trocr)")
     parser.add_argument("--single", type=str, 
                        help="Xử lý một ảnh cụ thể")
+    parser.add_argument("--threads", type=int, default=0,
+                       help="Số lõi CPU được dùng (mặc định: 0 - tất cả lõi)")
+    parser.add_argument("--pin-cpu", action="store_true",
+                       help="Ghim tiến trình vào các lõi được dùng")
     
     args = parser.parse_args()
     
@@ -517,6 +522,11 @@ def main():
     else:
         input_dirs = None  # Sẽ dùng mặc định ["ballot/data1", "ballot/data2"]
     
+    # Kế hoạch luồng: xử lý tuần tự, một worker dùng toàn bộ lõi
+    ke_hoach_luong = lap_ke_hoach(so_loi=args.threads or None, ghim_cpu=args.pin_cpu)
+    in_ke_hoach(ke_hoach_luong)
+    ap_dung_ke_hoach(ke_hoach_luong)
+    
     # Khởi tạo processor
     processor = PhieuBauTrOCRProcessor()
     
@@ -1,20 +1,50 @@
 # trocr_yolo.py - Hệ thống tích hợp xử lý phiếu bầu
 import os
+import sys
 import shutil
+import glob
 import argparse
 import json
+import math
+import time
+import queue
+import gc
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 from datetime import datetime
 
+import cv2
+import numpy as np
+
 # Import các module tự xây dựng
-from core.tien_xu_ly import xu_ly_phieu_bau
-from core.trocr import doc_ten_tu_anh
+from core.tien_xu_ly import tien_xu_ly_phieu_bau, chon_layout
+from core.trocr import get_pipeline, doc_ten_tu_anh, doc_ten_theo_lo, TEN_MO_HINH_TROCR, SO_TU_TOI_DA
+from core.loc_muc import tinh_ti_le_muc
+from core.xuat_yolo import CAC_BACKEND, xuat_mo_hinh_yolo
+from core.day_chuyen import GiaiDoan, DayChuyen, gop_thong_ke_day_chuyen
+from core.gom_lo import BoGomLo, gop_thong_ke_gom_lo
+from core.bo_nho_chung import BoDemVong, worker_tien_xu_ly
+from core.ke_hoach_luong import lap_ke_hoach, ap_dung_ke_hoach, in_ke_hoach
+from core.luong_stdin import doc_duong_dan, doc_khung_anh, chay_luong
+from core.theo_doi_thu_muc import TheoDoiThuMuc
+from core.quay_video import ChonKhungPhieu
+from core.hang_doi_cong_viec import HangDoiCongViec, ten_worker_mac_dinh, CHO, DANG_XU_LY, XONG
+from core.ban_ke import BanKe, bam_cau_hinh
+from core.trung_lap import ChiMucTrungLap, van_tay_phieu, vung_o_danh_dau
+from core.bo_nho_dem import BoNhoDemGiaiDoan, bam_anh_dau_vao, tao_khoa, LAM_PHANG, OCR, PHAT_HIEN, KET_QUA
+from core.han_chot import HanChotPhieu, HetThoiGian, CAC_GIAI_DOAN_GIOI_HAN, phan_tich_gioi_han_giai_doan
+from core.cach_ly import ThuMucCachLy
+from core.tien_xu_ly import CAC_LAYOUT
+from core.nguon_anh import (la_nguon_nhieu_anh, ten_nguon, khoa_anh, ten_anh, ten_co_so,
+                             liet_ke_anh_trong_nguon, doc_anh_tu_nguon, doc_anh_theo_khoa, la_tar_nen)
 
 # Import YOLO
 try:
     from ultralytics import YOLO
 except ImportError:
-    print("[WARNING] Chưa cài ultralytics. Sẽ chỉ sử dụng TrOCR.")
+    print("[WARNING] Chưa cài ultralytics. Sẽ chỉ sử dụng TrOCR.", file=sys.stderr)
     YOLO = None
 
 class PhieuBauProcessor:
@@ -22,24 +52,385 @@ class PhieuBauProcessor:
     Lớp xử lý phiếu bầu tích hợp TrOCR và YOLO
     """
     
+    # Số worker mặc định của các giai đoạn dây chuyền. TrOCR và YOLO chỉ một worker vì
+    # mỗi mô hình tự dùng nhiều luồng CPU; tiền xử lý OpenCV chạy song song với suy luận.
+    SO_WORKER_MAC_DINH = {
+        'tien_xu_ly': 2,
+        'ocr': 1,
+        'phat_hien': 1,
+        'ghi_ket_qua': 1
+    }
+    
+    # Khi gom lô, các worker OCR/YOLO chỉ gửi yêu cầu và chờ, mô hình chạy trên luồng của bộ gom lô
+    SO_WORKER_GOM_LO = {
+        'ocr': 4,
+        'phat_hien': 4
+    }
+    
     def __init__(self, 
-                 yolo_weights_path: str = "models/best.pt"):
+                 yolo_weights_path: str = "models/best.pt",
+                 kich_thuoc_lo_yolo: int = 32,
+                 che_do_phat_hien: str = "cell",
+                 imgsz_toan_phieu: int = None,
+                 nguong_chong_lan: float = 0.5,
+                 loc_muc: bool = False,
+                 nguong_o_trong: float = 0.01,
+                 yolo_backend: str = "pt",
+                 int8: bool = False,
+                 du_lieu_int8: str = None,
+                 imgsz_o: int = 640,
+                 o_chu_nhat: bool = False,
+                 max_det_o: int = 300,
+                 conf_yolo: float = 0.25,
+                 lop_yolo: List[str] = None,
+                 leo_thang: bool = False,
+                 vung_xam: tuple = (0.25, 0.6),
+                 imgsz_leo_thang: int = 960,
+                 conf_leo_thang: float = 0.1,
+                 day_chuyen: bool = False,
+                 so_worker_giai_doan: Dict = None,
+                 kich_thuoc_hang_doi: int = 4,
+                 gom_lo: bool = False,
+                 kich_thuoc_lo_ocr: int = 32,
+                 thoi_gian_cho_lo: float = 0.02,
+                 so_tien_trinh: int = 1,
+                 bo_nho_chung: bool = False,
+                 so_tien_trinh_tien_xu_ly: int = 2,
+                 so_slot_bo_dem: int = 8,
+                 so_loi: int = None,
+                 ghim_cpu: bool = False,
+                 song_song_dong: bool = False,
+                 so_luong_dong: int = 4,
+                 so_luong_doc_nen: int = 4,
+                 trung_lap: str = None,
+                 nguong_trung_lap: float = 0.2,
+                 thu_muc_bo_nho_dem: str = None,
+                 dung_luong_bo_nho_dem: int = 2 << 30,
+                 gioi_han_phieu: float = None,
+                 gioi_han_giai_doan: Dict = None):
         """
         Khởi tạo processor
         
         Args:
             yolo_weights_path: Đường dẫn đến weights YOLO
+            kich_thuoc_lo_yolo: Số ô tối đa trong một lần predict YOLO
+            che_do_phat_hien: "cell" - YOLO trên từng ô đã padding 640x640,
+                              "ballot" - YOLO một lần trên dải cột đồng ý/không đồng ý của phiếu
+            imgsz_toan_phieu: imgsz cho chế độ "ballot" (None: giữ nguyên độ phân giải của dải cột)
+            nguong_chong_lan: Tỉ lệ diện tích box tối thiểu nằm trong ô để gán box cho ô đó
+            loc_muc: Bật bước lọc mật độ mực trước YOLO (chỉ dùng cho chế độ "cell")
+            nguong_o_trong: Ô có tỉ lệ mực nhỏ hơn ngưỡng này được coi là trống, không gửi YOLO
+            yolo_backend: "pt" (PyTorch), "onnx" hoặc "openvino" (xuất một lần từ weights .pt)
+            int8: Lượng tử hóa int8 khi xuất (chỉ OpenVINO)
+            du_lieu_int8: Thư mục ảnh ô đã cắt dùng để hiệu chỉnh int8
+            imgsz_o: imgsz khi chạy YOLO trên ô đồng ý/không đồng ý
+            o_chu_nhat: Gửi ô đã cắt (không padding vuông 640x640) để YOLO suy luận hình chữ nhật
+            max_det_o: Số detection tối đa trên một ô
+            conf_yolo: Ngưỡng confidence của YOLO
+            lop_yolo: Chỉ giữ các class này (ví dụ ['x_mark', 'x_cancelled']), None để giữ tất cả
+            leo_thang: Chạy lượt thứ hai (TTA + độ phân giải cao, bỏ phiếu) cho các ô mơ hồ
+            vung_xam: Khoảng confidence [thấp, cao) coi là mơ hồ
+            imgsz_leo_thang: imgsz của lượt độ phân giải cao
+            conf_leo_thang: Ngưỡng confidence của lượt thứ hai (thấp hơn để bắt dấu X mờ)
+            day_chuyen: Xử lý nhiều phiếu theo dây chuyền (tiền xử lý → OCR → YOLO → ghi kết quả)
+            so_worker_giai_doan: Số worker của từng giai đoạn dây chuyền, ghi đè SO_WORKER_MAC_DINH
+            kich_thuoc_hang_doi: Số phiếu tối đa chờ trước mỗi giai đoạn dây chuyền
+            gom_lo: Gom ô họ tên / ô đồng ý-không đồng ý của nhiều phiếu đang xử lý thành lô chung
+                    cho TrOCR và YOLO (chế độ "cell")
+            kich_thuoc_lo_ocr: Số ô họ tên tối đa trong một lô TrOCR
+            thoi_gian_cho_lo: Thời gian (giây) tối đa chờ gom đủ lô
+            so_tien_trinh: Số tiến trình xử lý batch, mỗi tiến trình nhận một phần danh sách phiếu
+            bo_nho_chung: Tiền xử lý trong các tiến trình riêng, chuyển ô sang tiến trình suy luận
+                          qua bộ đệm vòng trên shared memory (chế độ "cell")
+            so_tien_trinh_tien_xu_ly: Số tiến trình tiền xử lý khi dùng bộ nhớ chung
+            so_slot_bo_dem: Số phiếu tối đa nằm trong bộ đệm vòng cùng lúc
+            so_loi: Số lõi CPU chia cho tiền xử lý và mô hình (None: tất cả lõi được phép dùng)
+            ghim_cpu: Ghim từng tiến trình vào khối lõi của nó theo kế hoạch luồng
+            song_song_dong: Xử lý các dòng của một phiếu song song trên nhóm luồng
+                            (OCR từng dòng và YOLO cả phiếu chạy đồng thời) để giảm độ trễ từng phiếu
+            so_luong_dong: Số luồng của nhóm luồng xử lý dòng
+            so_luong_doc_nen: Số luồng đọc và decode ảnh song song khi đầu vào là file zip/tar
+            trung_lap: Phát hiện phiếu quét trùng trong batch / thư mục theo dõi: "skip" - không chạy
+                       TrOCR + YOLO cho phiếu trùng, "flag" - vẫn xử lý; cả hai không tính phiếu trùng
+                       vào tổng hợp. None: tắt
+            nguong_trung_lap: Khoảng cách vân tay tối đa để coi hai phiếu là trùng
+            thu_muc_bo_nho_dem: Thư mục lưu đệm kết quả từng giai đoạn (làm phẳng, OCR, YOLO, ghép kết quả)
+                                để lần chạy sau chỉ tính lại các giai đoạn có cấu hình thay đổi (None: tắt)
+            dung_luong_bo_nho_dem: Dung lượng tối đa (byte) của bộ nhớ đệm
+            gioi_han_phieu: Số giây tối đa xử lý một phiếu, quá hạn thì hủy phiếu (None: không giới hạn)
+            gioi_han_giai_doan: Số giây tối đa của từng giai đoạn, ví dụ {'tien_xu_ly': 10, 'ocr': 30}
         """
+        if che_do_phat_hien not in ("cell", "ballot"):
+            raise ValueError(f"Chế độ phát hiện không hợp lệ: {che_do_phat_hien}")
+        if yolo_backend not in CAC_BACKEND:
+            raise ValueError(f"Backend YOLO không hợp lệ: {yolo_backend}")
+        if bo_nho_chung and che_do_phat_hien == "ballot":
+            raise ValueError("Bộ nhớ chung chỉ hỗ trợ chế độ phát hiện 'cell'")
+        if trung_lap not in (None, "skip", "flag"):
+            raise ValueError(f"Chính sách phiếu trùng không hợp lệ: {trung_lap}")
+        if song_song_dong and so_luong_dong < 2:
+            raise ValueError("Xử lý dòng song song cần ít nhất 2 luồng")
+        for ten in (so_worker_giai_doan or {}):
+            if ten not in self.SO_WORKER_MAC_DINH:
+                raise ValueError(f"Giai đoạn dây chuyền không hợp lệ: {ten}")
+        for ten in (gioi_han_giai_doan or {}):
+            if ten not in CAC_GIAI_DOAN_GIOI_HAN:
+                raise ValueError(f"Giai đoạn không hợp lệ: {ten}")
+        
+        self.yolo_weights_path = yolo_weights_path
+        self.yolo_backend = yolo_backend
+        self.int8 = int8
+        
+        self.kich_thuoc_lo_yolo = kich_thuoc_lo_yolo
+        self.che_do_phat_hien = che_do_phat_hien
+        self.imgsz_toan_phieu = imgsz_toan_phieu
+        self.nguong_chong_lan = nguong_chong_lan
+        self.loc_muc = loc_muc
+        self.nguong_o_trong = nguong_o_trong
+        
+        # Cấu hình suy luận YOLO
+        self.imgsz_o = imgsz_o
+        self.o_chu_nhat = o_chu_nhat
+        self.max_det_o = max_det_o
+        self.conf_yolo = conf_yolo
+        self.lop_yolo = lop_yolo
+        
+        # Cấu hình lượt thứ hai cho ô mơ hồ
+        self.leo_thang = leo_thang
+        self.vung_xam = vung_xam
+        self.imgsz_leo_thang = imgsz_leo_thang
+        self.conf_leo_thang = conf_leo_thang
+        self.thong_ke_leo_thang = {
+            'tong_so_o': 0,
+            'leo_thang': 0,
+            'doi_quyet_dinh': 0
+        }
+        
+        # Cấu hình dây chuyền xử lý nhiều phiếu
+        self.day_chuyen = day_chuyen
+        self.so_worker_giai_doan = dict(self.SO_WORKER_MAC_DINH)
+        if gom_lo:
+            # Cần nhiều phiếu cùng chờ ở OCR/YOLO thì bộ gom lô mới có lô lớn
+            self.so_worker_giai_doan.update(self.SO_WORKER_GOM_LO)
+        self.so_worker_giai_doan.update(so_worker_giai_doan or {})
+        self.kich_thuoc_hang_doi = kich_thuoc_hang_doi
+        self.thong_ke_day_chuyen = None
+        
+        # Bộ gom lô dùng chung cho mọi phiếu đang xử lý (tạo sau khi load YOLO)
+        self.gom_lo = gom_lo
+        self.kich_thuoc_lo_ocr = kich_thuoc_lo_ocr
+        self.thoi_gian_cho_lo = thoi_gian_cho_lo
+        self.bo_gom_ocr = None
+        self.bo_gom_yolo = None
+        self._thong_ke_gom_lo_shard = []
+        
+        # Số tiến trình xử lý batch (fork sau khi load mô hình)
+        self.so_tien_trinh = so_tien_trinh
+        self.thong_ke_tien_trinh = None
+        
+        # Tiền xử lý trong tiến trình riêng, ô đi qua bộ đệm vòng trên shared memory
+        self.bo_nho_chung = bo_nho_chung
+        self.so_tien_trinh_tien_xu_ly = so_tien_trinh_tien_xu_ly
+        self.so_slot_bo_dem = so_slot_bo_dem
+        
+        # Nhóm luồng xử lý dòng của một phiếu, giữ suốt vòng đời processor để không tạo lại mỗi phiếu
+        self.song_song_dong = song_song_dong
+        self.so_luong_dong = so_luong_dong
+        self._nhom_luong_dong = ThreadPoolExecutor(so_luong_dong, thread_name_prefix="dong") if song_song_dong else None
+        
+        self.so_luong_doc_nen = so_luong_doc_nen
+        
+        # Bản kê của batch đang chạy (xu_ly_nhieu_phieu_bau), None ngoài batch
+        self._ban_ke = None
+        
+        # Chỉ mục vân tay phiếu của batch / thư mục theo dõi đang chạy (khi bật phát hiện phiếu trùng)
+        self.trung_lap = trung_lap
+        self.nguong_trung_lap = nguong_trung_lap
+        self._chi_muc_trung_lap = None
+        
+        self._bo_nho_dem = (BoNhoDemGiaiDoan(thu_muc_bo_nho_dem, dung_luong_bo_nho_dem)
+                            if thu_muc_bo_nho_dem else None)
+        
+        # Giới hạn thời gian từng phiếu; phiếu lỗi của batch đang chạy được chép vào thư mục cách ly
+        self.gioi_han_phieu = gioi_han_phieu
+        self.gioi_han_giai_doan = dict(gioi_han_giai_doan or {})
+        self._cach_ly = None
+        
+        # Chia lõi CPU và đặt số luồng torch/OpenCV trước khi load mô hình
+        self.ke_hoach_luong = self.lap_ke_hoach_luong(so_loi, ghim_cpu)
+        in_ke_hoach(self.ke_hoach_luong)
+        ap_dung_ke_hoach(self.ke_hoach_luong)
+        
+        # Các bộ đếm thống kê có thể được cập nhật từ nhiều worker dây chuyền
+        self._khoa_thong_ke = threading.Lock()
+        
+        # Thống kê bước lọc mực: bao nhiêu ô được quyết định ngay, bao nhiêu ô gửi YOLO
+        self.thong_ke_loc_muc = {
+            'tong_so_o': 0,
+            'bo_qua_yolo': 0,
+            'gui_yolo': 0
+        }
+        
+        # Predictor của ultralytics không an toàn khi gọi từ nhiều luồng cùng lúc
+        self._khoa_yolo = threading.Lock()
         
         # Load YOLO model
         self.yolo_model = None
         if YOLO and os.path.exists(yolo_weights_path):
             try:
-                self.yolo_model = YOLO(yolo_weights_path)
+                if yolo_backend == "pt":
+                    self.yolo_model = YOLO(yolo_weights_path)
+                else:
+                    duong_dan_xuat = xuat_mo_hinh_yolo(yolo_weights_path, yolo_backend, int8, du_lieu_int8)
+                    self.yolo_model = YOLO(duong_dan_xuat, task="detect")
             except Exception as e:
                 print(f"[WARNING] Không thể load YOLO model: {e}")
         else:
             print("[WARNING] YOLO model không khả dụng")
+        
+        if gom_lo:
+            self._tao_bo_gom_lo()
+    
+    def lap_ke_hoach_luong(self, so_loi: int = None, ghim_cpu: bool = False) -> Dict:
+        """
+        Lập kế hoạch luồng từ chế độ xử lý batch: số worker tiền xử lý chạy song song với mô hình
+        và số worker gọi mô hình đồng thời trong mỗi tiến trình
+        """
+        if self.bo_nho_chung:
+            so_worker_tien_xu_ly = self.so_tien_trinh_tien_xu_ly
+            so_worker_mo_hinh = 1
+        elif self.day_chuyen:
+            so_worker_tien_xu_ly = self.so_worker_giai_doan['tien_xu_ly']
+            # Khi gom lô, mô hình chỉ chạy trên hai luồng gom lô (TrOCR và YOLO)
+            so_worker_mo_hinh = 2 if self.gom_lo else (self.so_worker_giai_doan['ocr'] +
+                                                       self.so_worker_giai_doan['phat_hien'])
+        else:
+            so_worker_tien_xu_ly = 0
+            so_worker_mo_hinh = self.so_luong_dong if self.song_song_dong else 1
+        
+        return lap_ke_hoach(so_loi=so_loi,
+                            so_tien_trinh=self.so_tien_trinh,
+                            so_worker_tien_xu_ly=so_worker_tien_xu_ly,
+                            so_worker_mo_hinh=so_worker_mo_hinh,
+                            ghim_cpu=ghim_cpu)
+    
+    def _ket_qua_rong(self, loi=None) -> Dict:
+        """
+        Kết quả mặc định khi không có detection nào (hoặc khi có lỗi)
+        """
+        return {
+            'co_dau_x': False,
+            'so_luong_x_mark': 0,
+            'so_luong_x_cancelled': 0,
+            'confidence_x_mark': [],
+            'confidence_x_cancelled': [],
+            'chi_tiet_detection': [],
+            'loi': loi
+        }
+    
+    def _tong_hop_detection(self, chi_tiet_detection: List[Dict]) -> Dict:
+        """
+        Tổng hợp danh sách detection của một ô thành dict thông tin dấu X
+        Phân biệt x_mark (dấu X hợp lệ) và x_cancelled (dấu X bị gạch bỏ)
+        
+        Args:
+            chi_tiet_detection: List dict {'class', 'confidence', 'bbox'}
+        
+        Returns:
+            Dict chứa thông tin về dấu X
+        """
+        # Khởi tạo các biến đếm
+        so_luong_x_mark = 0
+        so_luong_x_cancelled = 0
+        confidence_x_mark = []
+        confidence_x_cancelled = []
+        
+        for detection_info in chi_tiet_detection:
+            # Phân loại theo class
+            if detection_info['class'] == 'x_mark':
+                so_luong_x_mark += 1
+                confidence_x_mark.append(detection_info['confidence'])
+            elif detection_info['class'] == 'x_cancelled':
+                so_luong_x_cancelled += 1
+                confidence_x_cancelled.append(detection_info['confidence'])
+        
+        # Xác định có dấu X hợp lệ hay không
+        # Chỉ tính x_mark, bỏ qua x_cancelled
+        co_dau_x_hop_le = so_luong_x_mark > 0
+        
+        return {
+            'co_dau_x': co_dau_x_hop_le,
+            'so_luong_x_mark': so_luong_x_mark,
+            'so_luong_x_cancelled': so_luong_x_cancelled,
+            'confidence_x_mark': confidence_x_mark,
+            'confidence_x_cancelled': confidence_x_cancelled,
+            'chi_tiet_detection': chi_tiet_detection,
+            'loi': None
+        }
+    
+    def _lay_detection(self, result) -> List[Dict]:
+        """
+        Lấy danh sách detection {'class', 'confidence', 'bbox'} từ một kết quả YOLO
+        """
+        chi_tiet_detection = []
+        
+        if result.boxes is not None and len(result.boxes) > 0:
+            # Lấy thông tin boxes, classes và confidences
+            boxes = result.boxes.xyxy.cpu().numpy()  # Tọa độ boxes
+            classes = result.boxes.cls.cpu().numpy()  # Class IDs
+            confidences = result.boxes.conf.cpu().numpy()  # Confidence scores
+            
+            # Lấy tên class từ model
+            class_names = result.names  # Dict: {0: 'x_mark', 1: 'x_cancelled', ...}
+            
+            for box, cls_id, conf in zip(boxes, classes, confidences):
+                chi_tiet_detection.append({
+                    'class': class_names[int(cls_id)],
+                    'confidence': float(conf),
+                    'bbox': box.tolist()
+                })
+        
+        return chi_tiet_detection
+    
+    def _phan_tich_ket_qua_yolo(self, result) -> Dict:
+        """
+        Chuyển một kết quả YOLO (một ảnh) thành dict thông tin dấu X
+        
+        Args:
+            result: Một phần tử trong danh sách trả về từ yolo_model.predict
+        
+        Returns:
+            Dict chứa thông tin về dấu X
+        """
+        return self._tong_hop_detection(self._lay_detection(result))
+    
+    def _tham_so_predict(self, imgsz: int = None, max_det: int = None) -> Dict:
+        """
+        Tham số truyền cho yolo_model.predict theo cấu hình suy luận hiện tại
+        """
+        tham_so = {
+            'imgsz': imgsz or self.imgsz_o,
+            'max_det': max_det or self.max_det_o,
+            'conf': self.conf_yolo,
+            'save': False,
+            'verbose': False
+        }
+        
+        if self.lop_yolo and self.yolo_model:
+            tham_so['classes'] = [int(cls_id) for cls_id, ten in self.yolo_model.names.items()
+                                  if ten in self.lop_yolo]
+        
+        return tham_so
+    
+    def _bu_padding(self, vung) -> tuple:
+        """
+        Độ lệch của ô đã cắt 5px trong ảnh 640x640 sau add_padding_only,
+        dùng để đưa bbox về cùng hệ tọa độ với ô đã padding
+        """
+        x1, y1, x2, y2 = vung
+        w_o = x2 - x1 - 5 if x2 - x1 > 5 else x2 - x1
+        h_o = y2 - y1 - 5 if y2 - y1 > 5 else y2 - y1
+        return max(0, (640 - w_o) // 2), max(0, (640 - h_o) // 2)
     
     def kiem_tra_dau_x(self, duong_dan_anh: str) -> Dict:
         """
@@ -48,99 +439,156 @@ class PhieuBauProcessor:
         
         Args:
             duong_dan_anh: Đường dẫn đến ảnh
-            
+        
         Returns:
             Dict chứa thông tin về dấu X
         """
         if not self.yolo_model:
-            return {
-                'co_dau_x': False,
-                'so_luong_x_mark': 0,
-                'so_luong_x_cancelled': 0,
-                'confidence_x_mark': [],
-                'confidence_x_cancelled': [],
-                'chi_tiet_detection': [],
-                'loi': 'YOLO model không khả dụng'
-            }
+            return self._ket_qua_rong('YOLO model không khả dụng')
         
         try:
             # Predict với YOLO
-            results = self.yolo_model.predict(
-                source=duong_dan_anh,
-                save=False,
-                verbose=False
-            )
+            with self._khoa_yolo:
+                results = self.yolo_model.predict(
+                    source=duong_dan_anh,
+                    **self._tham_so_predict()
+                )
             
-            result = results[0]
-            
-            # Khởi tạo các biến đếm
-            so_luong_x_mark = 0
-            so_luong_x_cancelled = 0
-            confidence_x_mark = []
-            confidence_x_cancelled = []
-            chi_tiet_detection = []
+            return self._phan_tich_ket_qua_yolo(results[0])
+        
+        except Exception as e:
+            return self._ket_qua_rong(str(e))
+    
+    def kiem_tra_dau_x_theo_lo(self, danh_sach_anh, kich_thuoc_lo: int = None,
+                               tham_so_them: Dict = None) -> List[Dict]:
+        """
+        Kiểm tra dấu X cho nhiều ô cùng lúc, mỗi lô chỉ gọi predict một lần
+        
+        Args:
+            danh_sach_anh: List đường dẫn / ảnh numpy (BGR), hoặc mảng numpy (N, H, W, 3)
+                           chứa các ô đồng ý/không đồng ý (có thể thuộc nhiều dòng, nhiều phiếu)
+            kich_thuoc_lo: Số ô tối đa trong một lần predict (mặc định: self.kich_thuoc_lo_yolo)
+            tham_so_them: Tham số predict ghi đè cấu hình mặc định (ví dụ imgsz, augment)
+        
+        Returns:
+            List các dict (cùng cấu trúc với kiem_tra_dau_x), theo đúng thứ tự đầu vào
+        """
+        # Mảng (N, H, W, 3) được tách thành list các ảnh (view, không copy)
+        danh_sach_anh = list(danh_sach_anh)
+        
+        if not danh_sach_anh:
+            return []
+        
+        if not self.yolo_model:
+            return [self._ket_qua_rong('YOLO model không khả dụng') for _ in danh_sach_anh]
+        
+        if kich_thuoc_lo is None:
+            kich_thuoc_lo = self.kich_thuoc_lo_yolo
+        kich_thuoc_lo = max(1, kich_thuoc_lo)
+        
+        tham_so = self._tham_so_predict()
+        tham_so.update(tham_so_them or {})
+        
+        ket_qua = []
+        for bat_dau in range(0, len(danh_sach_anh), kich_thuoc_lo):
+            lo_anh = danh_sach_anh[bat_dau:bat_dau + kich_thuoc_lo]
             
-            if result.boxes is not None and len(result.boxes) > 0:
-                # Lấy thông tin boxes, classes và confidences
-                boxes = result.boxes.xyxy.cpu().numpy()  # Tọa độ boxes
-                classes = result.boxes.cls.cpu().numpy()  # Class IDs
-                confidences = result.boxes.conf.cpu().numpy()  # Confidence scores
-                
-                # Lấy tên class từ model
-                class_names = result.names  # Dict: {0: 'x_mark', 1: 'x_cancelled', ...}
+            try:
+                with self._khoa_yolo:
+                    results = self.yolo_model.predict(
+                        source=lo_anh,
+                        **tham_so
+                    )
                 
-                for i, (box, cls_id, conf) in enumerate(zip(boxes, classes, confidences)):
-                    cls_name = class_names[int(cls_id)]
-                    
-                    # Lưu chi tiết detection
-                    detection_info = {
-                        'class': cls_name,
-                        'confidence': float(conf),
-                        'bbox': box.tolist()
-                    }
-                    chi_tiet_detection.append(detection_info)
-                    
-                    # Phân loại theo class
-                    if cls_name == 'x_mark':
-                        so_luong_x_mark += 1
-                        confidence_x_mark.append(float(conf))
-                    elif cls_name == 'x_cancelled':
-                        so_luong_x_cancelled += 1
-                        confidence_x_cancelled.append(float(conf))
+                ket_qua.extend(self._phan_tich_ket_qua_yolo(result) for result in results)
             
-            # Xác định có dấu X hợp lệ hay không
-            # Chỉ tính x_mark, bỏ qua x_cancelled
-            co_dau_x_hop_le = so_luong_x_mark > 0
+            except Exception as e:
+                ket_qua.extend(self._ket_qua_rong(str(e)) for _ in lo_anh)
+        
+        return ket_qua
+    
+    def kiem_tra_tuong_duong_backend(self, danh_sach_anh: List[str]) -> Dict:
+        """
+        So sánh kết quả của mô hình đã xuất (ONNX/OpenVINO) với mô hình .pt gốc trên cùng ảnh
+        
+        Args:
+            danh_sach_anh: List đường dẫn ảnh ô đồng ý/không đồng ý
+        
+        Returns:
+            Dict báo cáo mức độ tương đương
+        """
+        if self.yolo_backend == "pt" or not self.yolo_model:
+            print("[WARNING] Không có mô hình đã xuất để so sánh với .pt")
+            return {}
+        
+        model_goc = YOLO(self.yolo_weights_path)
+        
+        # Cùng tham số suy luận với mô hình đã xuất, lớp lấy theo tên của mô hình .pt
+        tham_so_goc = self._tham_so_predict()
+        if self.lop_yolo:
+            tham_so_goc['classes'] = [int(cls_id) for cls_id, ten in model_goc.names.items()
+                                       if ten in self.lop_yolo]
+        
+        so_khop_quyet_dinh = 0
+        so_khop_so_luong = 0
+        chenh_lech_conf_toi_da = 0.0
+        danh_sach_khac = []
+        
+        for duong_dan_anh in danh_sach_anh:
+            ket_qua_goc = self._phan_tich_ket_qua_yolo(
+                model_goc.predict(source=duong_dan_anh, **tham_so_goc)[0])
+            ket_qua_xuat = self.kiem_tra_dau_x(duong_dan_anh)
             
-            return {
-                'co_dau_x': co_dau_x_hop_le,
-                'so_luong_x_mark': so_luong_x_mark,
-                'so_luong_x_cancelled': so_luong_x_cancelled,
-                'confidence_x_mark': confidence_x_mark,
-                'confidence_x_cancelled': confidence_x_cancelled,
-                'chi_tiet_detection': chi_tiet_detection,
-                'loi': None
-            }
-                
-        except Exception as e:
-            return {
-                'co_dau_x': False,
-                'so_luong_x_mark': 0,
-                'so_luong_x_cancelled': 0,
-                'confidence_x_mark': [],
-                'confidence_x_cancelled': [],
-                'chi_tiet_detection': [],
-                'loi': str(e)
-            }
+            khop_quyet_dinh = ket_qua_goc['co_dau_x'] == ket_qua_xuat['co_dau_x']
+            khop_so_luong = (ket_qua_goc['so_luong_x_mark'] == ket_qua_xuat['so_luong_x_mark'] and
+                             ket_qua_goc['so_luong_x_cancelled'] == ket_qua_xuat['so_luong_x_cancelled'])
+            
+            so_khop_quyet_dinh += khop_quyet_dinh
+            so_khop_so_luong += khop_so_luong
+            
+            # So sánh confidence cao nhất của từng class
+            for khoa in ('confidence_x_mark', 'confidence_x_cancelled'):
+                conf_goc = max(ket_qua_goc[khoa], default=0.0)
+                conf_xuat = max(ket_qua_xuat[khoa], default=0.0)
+                chenh_lech_conf_toi_da = max(chenh_lech_conf_toi_da, abs(conf_goc - conf_xuat))
+            
+            if not khop_quyet_dinh:
+                danh_sach_khac.append(os.path.basename(duong_dan_anh))
+        
+        tong = len(danh_sach_anh)
+        bao_cao = {
+            'backend': self.yolo_backend,
+            'so_anh': tong,
+            'ti_le_khop_quyet_dinh': so_khop_quyet_dinh / tong if tong else 0,
+            'ti_le_khop_so_luong': so_khop_so_luong / tong if tong else 0,
+            'chenh_lech_conf_toi_da': chenh_lech_conf_toi_da,
+            'danh_sach_khac': danh_sach_khac
+        }
+        
+        print(f"\n{'='*60}")
+        print(f"KIỂM TRA TƯƠNG ĐƯƠNG: {self.yolo_backend} so với .pt")
+        print(f"{'='*60}")
+        print(f"Số ảnh: {tong}")
+        print(f"Khớp quyết định có dấu X: {bao_cao['ti_le_khop_quyet_dinh']*100:.2f}%")
+        print(f"Khớp số lượng x_mark/x_cancelled: {bao_cao['ti_le_khop_so_luong']*100:.2f}%")
+        print(f"Chênh lệch confidence lớn nhất: {chenh_lech_conf_toi_da:.4f}")
+        for ten in danh_sach_khac:
+            print(f"  - Khác quyết định: {ten}")
+        
+        return bao_cao
     
-    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int) -> Dict:
+    def xu_ly_mot_dong(self, dong_anh: List[Dict], so_dong: int, ket_qua_yolo: Dict = None,
+                       ten_doc_san=None) -> Dict:
         """
         Xử lý một dòng gồm 4 ảnh: STT, Họ tên, Đồng ý, Không đồng ý
         
         Args:
             dong_anh: List chứa 4 dict với thông tin ảnh
             so_dong: Số thứ tự dòng (bắt đầu từ 1)
-            
+            ket_qua_yolo: Kết quả YOLO đã tính trước theo loại ô ('dongy', 'khongdongy'),
+                          None để gọi YOLO riêng cho từng ô
+            ten_doc_san: Họ tên đã OCR trước (hoặc Exception nếu OCR lỗi), None để OCR tại đây
+        
         Returns:
             Dict chứa kết quả xử lý
         """
@@ -161,7 +609,8 @@ class PhieuBauProcessor:
         # Xử lý từng ô
         for o in dong_anh:
             loai = o['loai']
-            duong_dan = o['duong_dan']
+            # Ô chỉ nằm trong bộ nhớ (không ghi ra đĩa) thì dùng trực tiếp ảnh
+            duong_dan = o['duong_dan'] or o['anh']
             
             try:
                 if loai == 'stt':
@@ -170,225 +619,1677 @@ class PhieuBauProcessor:
                     # ket_qua['chi_tiet']['stt_ocr'] = stt_text
                     # STT đã được set theo số dòng ở trên
                     pass
-                    
+                
                 elif loai == 'hoten':
                     # OCR cho họ tên
-                    ten_text = doc_ten_tu_anh(duong_dan)
+                    if ten_doc_san is None:
+                        ten_text = doc_ten_tu_anh(duong_dan)
+                    elif isinstance(ten_doc_san, Exception):
+                        raise ten_doc_san
+                    else:
+                        ten_text = ten_doc_san
                     ket_qua['ho_ten'] = ten_text if ten_text else ''
                     ket_qua['chi_tiet']['ho_ten_ocr'] = ten_text
-                    
+                
                 elif loai == 'dongy':
                     # YOLO cho ô đồng ý
-                    yolo_result = self.kiem_tra_dau_x(duong_dan)
+                    if ket_qua_yolo and loai in ket_qua_yolo:
+                        yolo_result = ket_qua_yolo[loai]
+                    else:
+                        yolo_result = self.kiem_tra_dau_x(duong_dan)
                     ket_qua['dong_y'] = yolo_result['co_dau_x']
                     ket_qua['chi_tiet']['dong_y_yolo'] = yolo_result
-                    
+                
                 elif loai == 'khongdongy':
                     # YOLO cho ô không đồng ý
-                    yolo_result = self.kiem_tra_dau_x(duong_dan)
+                    if ket_qua_yolo and loai in ket_qua_yolo:
+                        yolo_result = ket_qua_yolo[loai]
+                    else:
+                        yolo_result = self.kiem_tra_dau_x(duong_dan)
                     ket_qua['khong_dong_y'] = yolo_result['co_dau_x']
                     ket_qua['chi_tiet']['khong_dong_y_yolo'] = yolo_result
+            
+            except Exception as e:
+                loi_msg = f"Lỗi xử lý {loai}: {str(e)}"
+                ket_qua['chi_tiet']['loi'].append(loi_msg)
+                print(f"[ERROR] {loi_msg}")
+        
+        return ket_qua
+    
+    def xu_ly_phieu_bau_hoan_chinh(self, 
+                                   duong_dan_anh: str,
+                                   thu_muc_temp: str = "results/ket_qua_trocr_yolo/temp_processing",
+                                   anh=None,
+                                   layout: Dict = None,
+                                   han_chot: HanChotPhieu = None) -> List[Dict]:
+        """
+        Xử lý hoàn chỉnh một phiếu bầu
+        
+        Args:
+            duong_dan_anh: Đường dẫn đến ảnh phiếu bầu gốc (khi có anh: chỉ dùng làm tên phiếu)
+            thu_muc_temp: Thư mục tạm để lưu ảnh đã cắt (None: giữ ảnh cắt trong bộ nhớ)
+            anh: Ảnh phiếu BGR đã decode (ví dụ ảnh tải lên dịch vụ), None để đọc từ duong_dan_anh
+            layout: Layout cụ thể (None để auto-detect theo đường dẫn)
+            han_chot: Hạn chót của phiếu (None: tạo theo giới hạn của processor)
+        
+        Returns:
+            List các kết quả xử lý cho từng dòng
+        
+        Raises:
+            HetThoiGian: Phiếu vượt giới hạn thời gian của cả phiếu hoặc của một giai đoạn
+        """
+        if han_chot is None:
+            han_chot = self._tao_han_chot()
+        
+        # Khóa bộ nhớ đệm của các giai đoạn; kết quả cả phiếu đã lưu thì không cần chạy giai đoạn nào
+        khoa = self._khoa_giai_doan(duong_dan_anh, anh, layout, o_qua_jpeg=thu_muc_temp is not None)
+        ket_qua_tong = self._ket_qua_da_luu(khoa)
+        if ket_qua_tong is not None:
+            self.in_ket_qua_tong_hop(ket_qua_tong)
+            return ket_qua_tong
+        
+        # Bước 1: Tiền xử lý và cắt ảnh (auto-detect layout trong tien_xu_ly_phieu_bau)
+        with han_chot.giai_doan('tien_xu_ly'):
+            phieu = self._tien_xu_ly(duong_dan_anh, thu_muc_temp, layout, anh, khoa)
+            
+            if not phieu or not phieu['ma_tran_anh']:
+                print("  [ERROR] Không thể tiền xử lý ảnh")
+                return []
+            
+            # Phiếu trùng được phát hiện trên ảnh phẳng, trước các bước TrOCR / YOLO
+            if self._la_phieu_bo_qua(duong_dan_anh, phieu['anh_phang'], phieu['ma_tran_anh']):
+                return []
+        
+        if self._nhom_luong_dong:
+            # Bước 2-3: OCR từng dòng và YOLO cả phiếu chạy đồng thời trên nhóm luồng
+            ket_qua_yolo_theo_dong, ten_theo_dong = self.xu_ly_dong_song_song(phieu, khoa, han_chot)
+        else:
+            # Bước 2: Phát hiện dấu X cho tất cả ô đồng ý/không đồng ý của phiếu
+            with han_chot.giai_doan('phat_hien'):
+                ket_qua_yolo_theo_dong = self._chay_giai_doan(PHAT_HIEN, khoa,
+                                                              lambda: self.phat_hien_dau_x(phieu, han_chot))
+            
+            # Bước 3: OCR họ tên cả phiếu (theo lô nếu bật gom lô) trước khi ghép với kết quả YOLO,
+            # để bộ nhớ đệm lưu được họ tên và thời gian OCR được giới hạn như một giai đoạn riêng
+            with han_chot.giai_doan('ocr'):
+                ten_theo_dong = self._chay_giai_doan(OCR, khoa,
+                                                     lambda: self.doc_ten_phieu(phieu['ma_tran_anh'], han_chot))
+        
+        ket_qua_tong = self.ghep_ket_qua_phieu(phieu['ma_tran_anh'], ket_qua_yolo_theo_dong, ten_theo_dong)
+        self._luu_ket_qua_dem(khoa, ket_qua_tong)
+        
+        # Bước 4: Tổng hợp kết quả
+        self.in_ket_qua_tong_hop(ket_qua_tong)
+        
+        return ket_qua_tong
+    
+    def _khoa_giai_doan(self, duong_dan_anh: str, anh=None, layout: Dict = None, o_qua_jpeg: bool = False,
+                        co_anh_phang: bool = True) -> Dict:
+        """
+        Khóa bộ nhớ đệm của từng giai đoạn một phiếu. Làm phẳng theo mã băm đầu vào; OCR và phát hiện
+        dấu X theo khóa làm phẳng, layout và cấu hình / mô hình của giai đoạn; ghép kết quả theo khóa
+        OCR và phát hiện dấu X.
+        
+        Args:
+            duong_dan_anh: Đường dẫn ảnh (khi có anh: chỉ dùng để chọn layout)
+            anh: Ảnh phiếu đã decode trong bộ nhớ
+            layout: Layout cụ thể (None để auto-detect theo đường dẫn)
+            o_qua_jpeg: Ô họ tên được ghi ra JPEG rồi đọc lại để OCR (kết quả hơi khác ô trong bộ nhớ)
+            co_anh_phang: Bước phát hiện dấu X có ảnh phẳng (--rect chỉ dùng được khi có)
+        
+        Returns:
+            Dict {giai đoạn: khóa}, None nếu không dùng bộ nhớ đệm hoặc không đọc được đầu vào
+        """
+        if self._bo_nho_dem is None:
+            return None
+        try:
+            dau_vao = bam_anh_dau_vao(duong_dan_anh, anh)
+            if layout is None:
+                layout = chon_layout(duong_dan_anh)
+        except (OSError, ValueError):
+            return None  # Để bước tiền xử lý báo lỗi như khi không dùng bộ nhớ đệm
+        
+        lam_phang = tao_khoa(LAM_PHANG, dau_vao, cv2.__version__)
+        ocr = tao_khoa(OCR, lam_phang, layout, TEN_MO_HINH_TROCR, SO_TU_TOI_DA, o_qua_jpeg)
+        phat_hien = tao_khoa(PHAT_HIEN, lam_phang, layout, self._cau_hinh_phat_hien(),
+                             self.o_chu_nhat and co_anh_phang)
+        return {
+            LAM_PHANG: lam_phang,
+            OCR: ocr,
+            PHAT_HIEN: phat_hien,
+            KET_QUA: tao_khoa(KET_QUA, ocr, phat_hien)
+        }
+    
+    def _tao_han_chot(self) -> HanChotPhieu:
+        """Hạn chót cho một phiếu theo giới hạn thời gian của processor"""
+        return HanChotPhieu(self.gioi_han_phieu, self.gioi_han_giai_doan)
+    
+    def _tien_xu_ly(self, duong_dan_anh: str, thu_muc_temp: str, layout: Dict = None, anh=None, khoa: Dict = None):
+        """tien_xu_ly_phieu_bau, dùng lại ma trận làm phẳng đã lưu đệm để bỏ qua bước tìm marker ArUco"""
+        if khoa is None:
+            return tien_xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp, layout, anh)
+        
+        ma_tran = self._bo_nho_dem.lay(LAM_PHANG, khoa[LAM_PHANG])
+        phieu = tien_xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp, layout, anh, ma_tran_lam_phang=ma_tran)
+        if phieu and ma_tran is None:
+            self._bo_nho_dem.luu(LAM_PHANG, khoa[LAM_PHANG], phieu['ma_tran_lam_phang'])
+        return phieu
+    
+    def _chay_giai_doan(self, giai_doan: str, khoa: Dict, ham):
+        """
+        Kết quả giai đoạn từ bộ nhớ đệm, hoặc gọi ham() rồi lưu lại. Kết quả có lỗi (OCR lỗi,
+        YOLO không chạy được) không được lưu để lần sau chạy lại.
+        """
+        if khoa is None:
+            return ham()
+        
+        gia_tri = self._bo_nho_dem.lay(giai_doan, khoa[giai_doan])
+        if gia_tri is None:
+            gia_tri = ham()
+            if giai_doan == OCR:
+                luu_duoc = not any(isinstance(ten, Exception) for ten in gia_tri)
+            else:
+                luu_duoc = not any(ket_qua.get('loi') for dong in gia_tri for ket_qua in dong.values())
+            if luu_duoc:
+                self._bo_nho_dem.luu(giai_doan, khoa[giai_doan], gia_tri)
+        return gia_tri
+    
+    def _ket_qua_da_luu(self, khoa: Dict):
+        """Kết quả cả phiếu đã lưu đệm (None khi tìm phiếu trùng - cần ảnh phẳng để lấy vân tay)"""
+        if khoa is None or self._chi_muc_trung_lap is not None:
+            return None
+        return self._bo_nho_dem.lay(KET_QUA, khoa[KET_QUA])
+    
+    def _luu_ket_qua_dem(self, khoa: Dict, ket_qua: List[Dict]):
+        """Lưu kết quả cả phiếu nếu không dòng nào có lỗi OCR / YOLO"""
+        if khoa is None or not ket_qua:
+            return
+        for dong in ket_qua:
+            chi_tiet = dong['chi_tiet']
+            if chi_tiet['loi'] or chi_tiet['dong_y_yolo'].get('loi') or chi_tiet['khong_dong_y_yolo'].get('loi'):
+                return
+        self._bo_nho_dem.luu(KET_QUA, khoa[KET_QUA], ket_qua)
+    
+    def _la_phieu_bo_qua(self, khoa: str, anh_phang=None, ma_tran_anh=None, van_tay=None) -> bool:
+        """
+        Kiểm tra phiếu trùng (khi đang có chỉ mục vân tay)
+        
+        Returns:
+            True nếu phiếu trùng và chính sách là "skip" (không chạy TrOCR / YOLO)
+        """
+        if self._chi_muc_trung_lap is None:
+            return False
+        if van_tay is None:
+            van_tay = van_tay_phieu(anh_phang, vung_o_danh_dau(ma_tran_anh))
+        trung = self._chi_muc_trung_lap.kiem_tra(khoa, van_tay)
+        if trung is None:
+            return False
+        print(f"  [WARNING] Phiếu trùng: {ten_anh(khoa)} ~ {ten_anh(trung['trung_voi'])} "
+              f"(khoảng cách {trung['khoang_cach']}){', bỏ qua' if self.trung_lap == 'skip' else ''}")
+        return self.trung_lap == "skip"
+    
+    def xu_ly_dong_song_song(self, phieu: Dict, khoa: Dict = None, han_chot: HanChotPhieu = None):
+        """
+        Chia các ô của một phiếu cho nhóm luồng: mỗi dòng một tác vụ OCR họ tên, cả phiếu
+        một tác vụ YOLO (một lần predict theo lô). TrOCR và YOLO nhả GIL khi suy luận nên
+        các tác vụ chạy song song thật sự; kết quả được ghép lại theo thứ tự dòng.
+        
+        Args:
+            phieu: Kết quả của tien_xu_ly_phieu_bau
+            khoa: Khóa bộ nhớ đệm của phiếu (_khoa_giai_doan), None nếu không dùng
+            han_chot: Hạn chót của phiếu (None: tạo theo giới hạn của processor)
+        
+        Returns:
+            (Kết quả YOLO theo dòng, họ tên theo dòng) - cùng dạng với phat_hien_dau_x và doc_ten_phieu
+        """
+        if han_chot is None:
+            han_chot = self._tao_han_chot()
+        
+        def phat_hien():
+            with han_chot.giai_doan('phat_hien'):
+                return self._chay_giai_doan(PHAT_HIEN, khoa, lambda: self.phat_hien_dau_x(phieu, han_chot))
+        
+        future_yolo = self._nhom_luong_dong.submit(phat_hien)
+        
+        with han_chot.giai_doan('ocr'):
+            ten_theo_dong = self._bo_nho_dem.lay(OCR, khoa[OCR]) if khoa else None
+            if ten_theo_dong is None:
+                # Load TrOCR trước khi chia việc để các luồng không cùng load pipeline
+                try:
+                    get_pipeline()
+                except Exception as e:
+                    print(f"[WARNING] Không thể load TrOCR: {e}")
+                
+                futures_ten = [self._nhom_luong_dong.submit(self.doc_ten_phieu, [dong_anh], han_chot)
+                               for dong_anh in phieu['ma_tran_anh']]
+                try:
+                    ten_theo_dong = [future.result()[0] for future in futures_ten]
+                except HetThoiGian:
+                    # Phiếu bị hủy: các dòng chưa bắt đầu không cần chạy nữa
+                    for future in futures_ten:
+                        future.cancel()
+                    raise
+                if khoa and not any(isinstance(ten, Exception) for ten in ten_theo_dong):
+                    self._bo_nho_dem.luu(OCR, khoa[OCR], ten_theo_dong)
+        
+        return future_yolo.result(), ten_theo_dong
+    
+    def phat_hien_dau_x(self, phieu: Dict, han_chot: HanChotPhieu = None) -> List[Dict]:
+        """
+        Phát hiện dấu X cho một phiếu đã tiền xử lý theo chế độ đã cấu hình,
+        kèm lượt thứ hai cho các ô mơ hồ nếu bật
+        
+        Args:
+            phieu: Kết quả của tien_xu_ly_phieu_bau
+            han_chot: Hạn chót của phiếu, kiểm tra trước lượt thứ hai (None: không kiểm tra)
+        
+        Returns:
+            List (theo dòng) các dict {loai: kết quả YOLO}
+        """
+        ma_tran_anh = phieu['ma_tran_anh']
+        
+        if self.che_do_phat_hien == "ballot":
+            ket_qua_yolo_theo_dong = self.phat_hien_dau_x_toan_phieu(phieu['anh_phang'], ma_tran_anh)
+        else:
+            ket_qua_yolo_theo_dong = self.phat_hien_dau_x_phieu(ma_tran_anh, phieu['anh_phang'])
+        
+        # Lượt thứ hai chỉ cho các ô mơ hồ
+        if self.leo_thang:
+            if han_chot is not None:
+                han_chot.kiem_tra('phat_hien')
+            self.leo_thang_o_mo_ho(ma_tran_anh, ket_qua_yolo_theo_dong)
+        
+        return ket_qua_yolo_theo_dong
+    
+    def doc_ten_phieu(self, ma_tran_anh: List[List[Dict]], han_chot: HanChotPhieu = None) -> List:
+        """
+        OCR họ tên cho tất cả dòng của phiếu
+        
+        Args:
+            ma_tran_anh: Ma trận ảnh đã cắt
+            han_chot: Hạn chót của phiếu, kiểm tra trước mỗi dòng (None: không kiểm tra)
+        
+        Returns:
+            List (theo dòng) họ tên, hoặc Exception nếu OCR dòng đó lỗi, None nếu dòng không có ô họ tên
+        """
+        if self.bo_gom_ocr:
+            # Gửi tất cả ô họ tên của phiếu, bộ gom lô ghép với ô của các phiếu khác
+            futures = [[self.bo_gom_ocr.gui(o['duong_dan'] or o['anh']) for o in dong_anh if o['loai'] == 'hoten']
+                       for dong_anh in ma_tran_anh]
+        
+        ten_theo_dong = []
+        for chi_so_dong, dong_anh in enumerate(ma_tran_anh):
+            if han_chot is not None:
+                han_chot.kiem_tra('ocr')
+            ten = None
+            for chi_so_o, o in enumerate(o for o in dong_anh if o['loai'] == 'hoten'):
+                try:
+                    if self.bo_gom_ocr:
+                        ten = futures[chi_so_dong][chi_so_o].result()
+                    else:
+                        ten = doc_ten_tu_anh(o['duong_dan'] or o['anh'])
+                except Exception as e:
+                    ten = e
+            ten_theo_dong.append(ten)
+        return ten_theo_dong
+    
+    def ghep_ket_qua_phieu(self, ma_tran_anh: List[List[Dict]], ket_qua_yolo_theo_dong: List[Dict],
+                           ten_theo_dong: List = None) -> List[Dict]:
+        """
+        Ghép kết quả OCR và YOLO thành kết quả từng dòng của phiếu
+        
+        Args:
+            ma_tran_anh: Ma trận ảnh đã cắt
+            ket_qua_yolo_theo_dong: Kết quả YOLO theo dòng
+            ten_theo_dong: Họ tên đã OCR trước theo dòng (None để OCR trong xu_ly_mot_dong)
+        """
+        ket_qua_tong = []
+        
+        for i, dong_anh in enumerate(ma_tran_anh, 1):
+            ten_doc_san = ten_theo_dong[i - 1] if ten_theo_dong else None
+            ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i, ket_qua_yolo_theo_dong[i - 1], ten_doc_san)
+            ket_qua_dong['so_dong'] = i
+            ket_qua_tong.append(ket_qua_dong)
+        
+        return ket_qua_tong
+    
+    def phat_hien_dau_x_phieu(self, ma_tran_anh: List[List[Dict]], anh_phang=None, ti_le_muc=None) -> List[Dict]:
+        """
+        Gom tất cả ô đồng ý/không đồng ý của một phiếu và chạy YOLO theo lô
+        Nếu bật loc_muc, các ô chắc chắn trống được quyết định ngay mà không qua YOLO
+        
+        Args:
+            ma_tran_anh: Ma trận ảnh đã cắt (kết quả của xu_ly_phieu_bau)
+            anh_phang: Ảnh phiếu đã làm phẳng (cần cho bước lọc mực)
+            ti_le_muc: Tỉ lệ mực của các ô đồng ý/không đồng ý đã tính sẵn (theo thứ tự dòng),
+                       dùng khi không có ảnh phẳng
+        
+        Returns:
+            List (theo dòng) các dict {loai: kết quả YOLO}
+        """
+        vi_tri_o = []
+        danh_sach_o = []
+        
+        for chi_so_dong, dong_anh in enumerate(ma_tran_anh):
+            for o in dong_anh:
+                if o['loai'] in ('dongy', 'khongdongy'):
+                    vi_tri_o.append((chi_so_dong, o['loai']))
+                    danh_sach_o.append(o)
+        
+        ket_qua_yolo_theo_dong = [{} for _ in ma_tran_anh]
+        
+        # Bước lọc: tỉ lệ mực của cả 20 ô tính một lần bằng ảnh tích phân
+        if not self.loc_muc:
+            ti_le_muc = None
+        elif ti_le_muc is None and anh_phang is not None and danh_sach_o:
+            ti_le_muc = tinh_ti_le_muc(anh_phang, [o['vung'] for o in danh_sach_o])
+        
+        chi_so_gui_yolo = []
+        for chi_so, ((chi_so_dong, loai), o) in enumerate(zip(vi_tri_o, danh_sach_o)):
+            if ti_le_muc is not None and ti_le_muc[chi_so] < self.nguong_o_trong:
+                # Ô trống rõ ràng - không cần YOLO
+                ket_qua = self._ket_qua_rong()
+                ket_qua['ti_le_muc'] = float(ti_le_muc[chi_so])
+                ket_qua['bo_qua_yolo'] = True
+                ket_qua_yolo_theo_dong[chi_so_dong][loai] = ket_qua
+            else:
+                chi_so_gui_yolo.append(chi_so)
+        
+        if self.o_chu_nhat and anh_phang is not None:
+            danh_sach_anh = self._cat_o_chu_nhat(anh_phang, [danh_sach_o[chi_so]['vung'] for chi_so in chi_so_gui_yolo])
+        else:
+            # Dùng ảnh trong bộ nhớ, tránh đọc lại file từ đĩa
+            danh_sach_anh = [danh_sach_o[chi_so]['anh'] if danh_sach_o[chi_so].get('anh') is not None
+                             else danh_sach_o[chi_so]['duong_dan'] for chi_so in chi_so_gui_yolo]
+        if self.bo_gom_yolo:
+            # Các ô được gom chung lô với ô của những phiếu khác đang xử lý
+            ket_qua_lo = self.bo_gom_yolo.xu_ly(danh_sach_anh)
+        else:
+            ket_qua_lo = self.kiem_tra_dau_x_theo_lo(danh_sach_anh)
+        
+        for chi_so, yolo_result in zip(chi_so_gui_yolo, ket_qua_lo):
+            chi_so_dong, loai = vi_tri_o[chi_so]
+            if self.o_chu_nhat and anh_phang is not None:
+                # Đưa bbox về hệ tọa độ ô 640x640 như chế độ padding vuông
+                bu_x, bu_y = self._bu_padding(danh_sach_o[chi_so]['vung'])
+                for detection_info in yolo_result['chi_tiet_detection']:
+                    bx1, by1, bx2, by2 = detection_info['bbox']
+                    detection_info['bbox'] = [bx1 + bu_x, by1 + bu_y, bx2 + bu_x, by2 + bu_y]
+            if ti_le_muc is not None:
+                yolo_result['ti_le_muc'] = float(ti_le_muc[chi_so])
+                yolo_result['bo_qua_yolo'] = False
+            ket_qua_yolo_theo_dong[chi_so_dong][loai] = yolo_result
+        
+        if ti_le_muc is not None:
+            with self._khoa_thong_ke:
+                self.thong_ke_loc_muc['tong_so_o'] += len(danh_sach_o)
+                self.thong_ke_loc_muc['gui_yolo'] += len(chi_so_gui_yolo)
+                self.thong_ke_loc_muc['bo_qua_yolo'] += len(danh_sach_o) - len(chi_so_gui_yolo)
+        
+        return ket_qua_yolo_theo_dong
+    
+    def _cat_o_chu_nhat(self, anh_phang, danh_sach_vung: List[tuple]) -> List:
+        """
+        Cắt các ô đồng ý/không đồng ý không padding (chỉ bỏ 5px trên/trái như add_padding_only),
+        cắt về cùng kích thước để YOLO letterbox cả lô theo hình chữ nhật nhỏ nhất
+        """
+        danh_sach_anh = []
+        for x1, y1, x2, y2 in danh_sach_vung:
+            lech_y = 5 if y2 - y1 > 5 else 0
+            lech_x = 5 if x2 - x1 > 5 else 0
+            danh_sach_anh.append(anh_phang[y1 + lech_y:y2, x1 + lech_x:x2])
+        
+        if danh_sach_anh:
+            h_min = min(anh.shape[0] for anh in danh_sach_anh)
+            w_min = min(anh.shape[1] for anh in danh_sach_anh)
+            danh_sach_anh = [anh[:h_min, :w_min] for anh in danh_sach_anh]
+        
+        return danh_sach_anh
+    
+    def phat_hien_dau_x_toan_phieu(self, anh_phang, ma_tran_anh: List[List[Dict]]) -> List[Dict]:
+        """
+        Chạy YOLO một lần trên dải cột đồng ý/không đồng ý của phiếu đã làm phẳng,
+        sau đó gán từng box x_mark/x_cancelled vào ô theo độ chồng lấn với layout
+        
+        Args:
+            anh_phang: Ảnh phiếu bầu đã làm phẳng
+            ma_tran_anh: Ma trận ảnh đã cắt (mỗi ô có 'vung' là tọa độ trên ảnh phẳng)
+        
+        Returns:
+            List (theo dòng) các dict {loai: kết quả YOLO}, cùng cấu trúc với phat_hien_dau_x_phieu
+        """
+        vi_tri_o = []
+        vung_o = []
+        
+        for chi_so_dong, dong_anh in enumerate(ma_tran_anh):
+            for o in dong_anh:
+                if o['loai'] in ('dongy', 'khongdongy'):
+                    vi_tri_o.append((chi_so_dong, o['loai']))
+                    vung_o.append(o['vung'])
+        
+        ket_qua_yolo_theo_dong = [{} for _ in ma_tran_anh]
+        
+        if not vi_tri_o:
+            return ket_qua_yolo_theo_dong
+        
+        if not self.yolo_model:
+            for chi_so_dong, loai in vi_tri_o:
+                ket_qua_yolo_theo_dong[chi_so_dong][loai] = self._ket_qua_rong('YOLO model không khả dụng')
+            return ket_qua_yolo_theo_dong
+        
+        vung_o = np.array(vung_o, dtype=np.float32)  # (C, 4): x1, y1, x2, y2
+        
+        # Dải cột bao tất cả ô đồng ý/không đồng ý
+        x0, y0 = int(vung_o[:, 0].min()), int(vung_o[:, 1].min())
+        x1, y1 = int(vung_o[:, 2].max()), int(vung_o[:, 3].max())
+        dai_cot = anh_phang[y0:y1, x0:x1]
+        
+        # Giữ nguyên độ phân giải để kích thước dấu X gần với lúc huấn luyện trên từng ô
+        imgsz = self.imgsz_toan_phieu
+        if imgsz is None:
+            imgsz = int(math.ceil(max(dai_cot.shape[:2]) / 32) * 32)
+        
+        try:
+            with self._khoa_yolo:
+                results = self.yolo_model.predict(
+                    source=dai_cot,
+                    **self._tham_so_predict(imgsz=imgsz, max_det=self.max_det_o * len(vi_tri_o))
+                )
+            detections = self._lay_detection(results[0])
+        except Exception as e:
+            for chi_so_dong, loai in vi_tri_o:
+                ket_qua_yolo_theo_dong[chi_so_dong][loai] = self._ket_qua_rong(str(e))
+            return ket_qua_yolo_theo_dong
+        
+        detection_theo_o = [[] for _ in vi_tri_o]
+        
+        if detections:
+            # Đổi tọa độ box từ dải cột sang ảnh phẳng
+            boxes = np.array([d['bbox'] for d in detections], dtype=np.float32)
+            boxes += np.array([x0, y0, x0, y0], dtype=np.float32)
+            
+            # Diện tích giao giữa từng box và từng ô: (B, C)
+            giao_w = np.clip(np.minimum(boxes[:, None, 2], vung_o[None, :, 2]) -
+                             np.maximum(boxes[:, None, 0], vung_o[None, :, 0]), 0, None)
+            giao_h = np.clip(np.minimum(boxes[:, None, 3], vung_o[None, :, 3]) -
+                             np.maximum(boxes[:, None, 1], vung_o[None, :, 1]), 0, None)
+            dien_tich_box = np.maximum((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), 1e-6)
+            ti_le_chong_lan = giao_w * giao_h / dien_tich_box[:, None]
+            
+            o_tot_nhat = ti_le_chong_lan.argmax(axis=1)
+            
+            for chi_so_box, detection_info in enumerate(detections):
+                chi_so_o = o_tot_nhat[chi_so_box]
+                if ti_le_chong_lan[chi_so_box, chi_so_o] < self.nguong_chong_lan:
+                    continue  # Box nằm giữa các ô hoặc ngoài bảng, bỏ qua
+                
+                # Đổi bbox về hệ tọa độ ảnh ô 640x640 (cắt 5px + padding giữa như add_padding_only)
+                # để chi_tiet_detection cùng hệ tọa độ với chế độ "cell"
+                ox1, oy1 = vung_o[chi_so_o][:2]
+                bu_x, bu_y = self._bu_padding(vung_o[chi_so_o])
+                lech_x = ox1 + 5 - bu_x
+                lech_y = oy1 + 5 - bu_y
+                box = boxes[chi_so_box] - np.array([lech_x, lech_y, lech_x, lech_y], dtype=np.float32)
+                
+                detection_theo_o[chi_so_o].append({
+                    'class': detection_info['class'],
+                    'confidence': detection_info['confidence'],
+                    'bbox': box.tolist()
+                })
+        
+        for (chi_so_dong, loai), chi_tiet_detection in zip(vi_tri_o, detection_theo_o):
+            ket_qua_yolo_theo_dong[chi_so_dong][loai] = self._tong_hop_detection(chi_tiet_detection)
+        
+        return ket_qua_yolo_theo_dong
+    
+    def _ly_do_leo_thang(self, ket_qua_yolo: Dict, ket_qua_o_con_lai: Dict) -> str:
+        """
+        Lý do cần chạy lượt thứ hai cho một ô, None nếu ô đã rõ ràng
+        
+        Args:
+            ket_qua_yolo: Kết quả lượt đầu của ô
+            ket_qua_o_con_lai: Kết quả lượt đầu của ô còn lại trong cùng dòng
+        """
+        if ket_qua_yolo.get('bo_qua_yolo') or ket_qua_yolo.get('loi'):
+            return None  # Ô trống chắc chắn (lọc mực) hoặc lỗi - không leo thang
+        
+        confidences = ket_qua_yolo['confidence_x_mark'] + ket_qua_yolo['confidence_x_cancelled']
+        conf_cao_nhat = max(confidences, default=0.0)
+        if confidences and self.vung_xam[0] <= conf_cao_nhat < self.vung_xam[1]:
+            return 'confidence_vung_xam'
+        
+        if ket_qua_o_con_lai:
+            if ket_qua_yolo['co_dau_x'] and ket_qua_o_con_lai['co_dau_x']:
+                return 'dong_chon_ca_hai'
+            if not ket_qua_yolo['co_dau_x'] and not ket_qua_o_con_lai['co_dau_x']:
+                return 'dong_khong_chon'
+        
+        return None
+    
+    def leo_thang_o_mo_ho(self, ma_tran_anh: List[List[Dict]], ket_qua_yolo_theo_dong: List[Dict]):
+        """
+        Chạy thêm hai lượt (TTA và độ phân giải cao) cho các ô mơ hồ rồi bỏ phiếu đa số
+        cùng với lượt đầu. Các ô rõ ràng giữ nguyên kết quả lượt đầu.
+        
+        Args:
+            ma_tran_anh: Ma trận ảnh đã cắt
+            ket_qua_yolo_theo_dong: Kết quả lượt đầu theo dòng, được cập nhật tại chỗ
+        """
+        can_leo_thang = []  # (chi_so_dong, loai, ly_do, anh)
+        
+        for chi_so_dong, dong_anh in enumerate(ma_tran_anh):
+            ket_qua_dong = ket_qua_yolo_theo_dong[chi_so_dong]
+            for o in dong_anh:
+                loai = o['loai']
+                if loai not in ket_qua_dong:
+                    continue
+                
+                loai_con_lai = 'khongdongy' if loai == 'dongy' else 'dongy'
+                ly_do = self._ly_do_leo_thang(ket_qua_dong[loai], ket_qua_dong.get(loai_con_lai))
+                with self._khoa_thong_ke:
+                    self.thong_ke_leo_thang['tong_so_o'] += 1
+                
+                if ly_do:
+                    anh = o['anh'] if o.get('anh') is not None else o['duong_dan']
+                    can_leo_thang.append((chi_so_dong, loai, ly_do, anh))
+        
+        if not can_leo_thang:
+            return
+        
+        danh_sach_anh = [anh for _, _, _, anh in can_leo_thang]
+        ket_qua_tta = self.kiem_tra_dau_x_theo_lo(
+            danh_sach_anh, tham_so_them={'augment': True, 'conf': self.conf_leo_thang})
+        ket_qua_phan_giai_cao = self.kiem_tra_dau_x_theo_lo(
+            danh_sach_anh, tham_so_them={'imgsz': self.imgsz_leo_thang, 'conf': self.conf_leo_thang})
+        
+        for (chi_so_dong, loai, ly_do, _), tta, phan_giai_cao in zip(can_leo_thang, ket_qua_tta, ket_qua_phan_giai_cao):
+            luot_dau = ket_qua_yolo_theo_dong[chi_so_dong][loai]
+            cac_luot = [luot_dau, phan_giai_cao, tta]
+            phieu = [luot['co_dau_x'] for luot in cac_luot]
+            quyet_dinh = sum(phieu) >= 2
+            
+            # Lấy chi tiết từ lượt đầu tiên đồng ý với đa số để số lượng/detection khớp quyết định
+            dai_dien = next(luot for luot in cac_luot if luot['co_dau_x'] == quyet_dinh)
+            ket_qua = dict(dai_dien)
+            for khoa in ('ti_le_muc', 'bo_qua_yolo'):
+                if khoa in luot_dau:
+                    ket_qua[khoa] = luot_dau[khoa]
+            ket_qua['leo_thang'] = {
+                'ly_do': ly_do,
+                'phieu': {'luot_dau': phieu[0], 'phan_giai_cao': phieu[1], 'tta': phieu[2]},
+                'quyet_dinh_luot_dau': luot_dau['co_dau_x']
+            }
+            ket_qua_yolo_theo_dong[chi_so_dong][loai] = ket_qua
+            
+            with self._khoa_thong_ke:
+                self.thong_ke_leo_thang['leo_thang'] += 1
+                if quyet_dinh != luot_dau['co_dau_x']:
+                    self.thong_ke_leo_thang['doi_quyet_dinh'] += 1
+    
+    def in_ket_qua_tong_hop(self, ket_qua_tong: List[Dict]):
+        """
+        In kết quả tổng hợp
+        """
+        print(f"\n{'='*60}")
+        print(f"KẾT QUẢ XỬ LÝ PHIẾU BẦU")
+        print(f"{'='*60}")
+        
+        tong_dong = len(ket_qua_tong)
+        so_dong_y = sum(1 for kq in ket_qua_tong if kq['dong_y'])
+        so_khong_dong_y = sum(1 for kq in ket_qua_tong if kq['khong_dong_y'])
+        so_khong_chon = sum(1 for kq in ket_qua_tong if not kq['dong_y'] and not kq['khong_dong_y'])
+        so_chon_ca_hai = sum(1 for kq in ket_qua_tong if kq['dong_y'] and kq['khong_dong_y'])
+        
+        # Thống kê x_cancelled
+        so_x_cancelled_dong_y = sum(1 for kq in ket_qua_tong 
+                                   if kq.get('chi_tiet', {}).get('dong_y_yolo', {}).get('so_luong_x_cancelled', 0) > 0)
+        so_x_cancelled_khong_dong_y = sum(1 for kq in ket_qua_tong 
+                                         if kq.get('chi_tiet', {}).get('khong_dong_y_yolo', {}).get('so_luong_x_cancelled', 0) > 0)
+        
+        print(f"Tổng số ứng viên: {tong_dong}")
+        print(f"Đồng ý: {so_dong_y}")
+        print(f"Không đồng ý: {so_khong_dong_y}")
+        print(f"Không chọn: {so_khong_chon}")
+        print(f"Chọn cả hai (lỗi): {so_chon_ca_hai}")
+        print(f"Có dấu X bị gạch bỏ ở ô đồng ý: {so_x_cancelled_dong_y}")
+        print(f"Có dấu X bị gạch bỏ ở ô không đồng ý: {so_x_cancelled_khong_dong_y}")
+        
+        print(f"\nCHI TIẾT TỪNG ỨNG VIÊN:")
+        print("-" * 80)
+        
+        for kq in ket_qua_tong:
+            trang_thai = "❌ Lỗi (chọn cả hai)" if (kq['dong_y'] and kq['khong_dong_y']) else \
+                        "✅ Đồng ý" if kq['dong_y'] else \
+                        "❌ Không đồng ý" if kq['khong_dong_y'] else \
+                        "⚪ Không chọn"
+            
+            # Thêm thông tin về x_cancelled
+            cancelled_info = ""
+            dong_y_cancelled = kq.get('chi_tiet', {}).get('dong_y_yolo', {}).get('so_luong_x_cancelled', 0)
+            khong_dong_y_cancelled = kq.get('chi_tiet', {}).get('khong_dong_y_yolo', {}).get('so_luong_x_cancelled', 0)
+            
+            if dong_y_cancelled > 0 or khong_dong_y_cancelled > 0:
+                cancelled_info = f" [Gạch bỏ: ĐY:{dong_y_cancelled}, KĐY:{khong_dong_y_cancelled}]"
+            
+            print(f"Dòng {kq['so_dong']:2d} | STT: {kq['stt']:3d} | {kq['ho_ten']:25s} | {trang_thai}{cancelled_info}")
+    
+    def xu_ly_nhieu_phieu_bau(self, 
+                              thu_muc_anh=None,
+                              thu_muc_output: str = "results/ket_qua_trocr_yolo",
+                              tiep_tuc: bool = True,
+                              chi_phieu_cach_ly: bool = False) -> Dict:
+        """
+        Xử lý nhiều phiếu bầu trong các thư mục (hỗ trợ ballot/data1, ballot/data2) hoặc file zip/tar.
+        Mỗi phiếu xong được ghi vào bản kê thu_muc_output/ban_ke.jsonl; chạy lại sau khi bị dừng
+        chỉ xử lý các phiếu chưa xong, và file tổng hợp được dựng lại từ kết quả từng phiếu.
+        Phiếu lỗi hoặc quá hạn được cách ly trong thu_muc_output/cach_ly (ThuMucCachLy).
+        
+        Args:
+            thu_muc_anh: Thư mục / file nén hoặc danh sách thư mục / file nén chứa ảnh phiếu bầu
+                         (mặc định: ["ballot/data1", "ballot/data2"])
+            thu_muc_output: Thư mục lưu kết quả
+            tiep_tuc: Dùng lại kết quả các phiếu đã xong trong bản kê (False: xóa bản kê, xử lý lại tất cả)
+            chi_phieu_cach_ly: Chỉ xử lý lại các phiếu đang bị cách ly (tổng hợp vẫn gồm mọi phiếu)
+        
+        Returns:
+            Dict chứa kết quả tổng hợp
+        """
+        # Xử lý tham số đầu vào
+        if thu_muc_anh is None:
+            thu_muc_anh = ["ballot/data1", "ballot/data2"]  # Mặc định xử lý cả 2 thư mục
+        elif isinstance(thu_muc_anh, str):
+            thu_muc_anh = [thu_muc_anh]  # Chuyển string thành list
+        
+        danh_sach_viec, cac_thu_muc_temp = liet_ke_viec(thu_muc_anh, thu_muc_output)
+        total_files = len(danh_sach_viec)
+        for thu_muc_temp in cac_thu_muc_temp:
+            os.makedirs(thu_muc_temp, exist_ok=True)
+        
+        # Bản kê: bỏ qua phiếu đã xong với cùng nội dung và cùng cấu hình ở lần chạy trước
+        file_ban_ke = os.path.join(thu_muc_output, "ban_ke.jsonl")
+        file_chi_muc = os.path.join(thu_muc_output, "chi_muc_trung_lap.jsonl")
+        for file_cu in (file_ban_ke, file_chi_muc):
+            if not tiep_tuc and os.path.exists(file_cu):
+                os.remove(file_cu)
+        self._ban_ke = BanKe(file_ban_ke, self.van_tay_cau_hinh())
+        ket_qua_da_co = {}
+        viec_con_lai = []
+        for viec in danh_sach_viec:
+            # Ảnh trong file nén / trang tài liệu: mã băm của cả file nguồn (băm một lần)
+            viec['file'] = viec.get('nguon') or viec['duong_dan_anh']
+            viec['bam'], viec['kich_thuoc'], viec['mtime_ns'] = self._ban_ke.bam_dau_vao(viec['file'])
+            ket_qua = self._ban_ke.ket_qua_da_xong(viec)
+            if ket_qua is None:
+                viec_con_lai.append(viec)
+            else:
+                ket_qua_da_co[viec['duong_dan_anh']] = ket_qua
+        if ket_qua_da_co:
+            print(f"[INFO] Bản kê {file_ban_ke}: {len(ket_qua_da_co)}/{total_files} phiếu đã xong, "
+                  f"xử lý {len(viec_con_lai)} phiếu còn lại")
+        
+        # Thư mục cách ly: phiếu đã xong (ví dụ ở tiến trình bị dừng sau khi ghi kết quả) không còn bị cách ly
+        self._cach_ly = ThuMucCachLy(os.path.join(thu_muc_output, "cach_ly"))
+        cac_khoa_cach_ly = self._cach_ly.cac_khoa()
+        for khoa in cac_khoa_cach_ly & ket_qua_da_co.keys():
+            self._cach_ly.xoa(khoa)
+        if chi_phieu_cach_ly:
+            viec_con_lai = [viec for viec in viec_con_lai if viec['duong_dan_anh'] in cac_khoa_cach_ly]
+            print(f"[INFO] Xử lý lại {len(viec_con_lai)}/{len(cac_khoa_cach_ly)} phiếu trong {self._cach_ly.thu_muc}")
+        
+        # Chỉ mục vân tay nằm cạnh bản kê nên phiếu trùng của lần chạy trước vẫn được nhớ khi chạy tiếp
+        if self.trung_lap:
+            self._chi_muc_trung_lap = ChiMucTrungLap(file_chi_muc, self.nguong_trung_lap)
+        
+        try:
+            if not viec_con_lai:
+                ket_qua_tong_hop, total_success = {}, 0
+            elif self.so_tien_trinh > 1:
+                # Chia danh sách phiếu cho nhiều tiến trình dùng chung mô hình đã load
+                ket_qua_tong_hop, total_success = self.xu_ly_nhieu_tien_trinh(viec_con_lai)
+            else:
+                ket_qua_tong_hop, total_success = self.xu_ly_danh_sach_viec(viec_con_lai)
+        finally:
+            self._ban_ke = None
+            cach_ly, self._cach_ly = self._cach_ly, None
+        
+        phieu_trung_lap = None
+        if self._chi_muc_trung_lap is not None:
+            phieu_trung_lap = self._chi_muc_trung_lap.cac_phieu_trung_lap()
+            self._chi_muc_trung_lap = None
+        
+        # Tổng hợp theo thứ tự danh sách phiếu, gồm cả phiếu đã xong từ lần chạy trước
+        ket_qua_tong_hop.update(ket_qua_da_co)
+        ket_qua_tong_hop = {viec['duong_dan_anh']: ket_qua_tong_hop.get(viec['duong_dan_anh'], [])
+                            for viec in danh_sach_viec}
+        total_success += len(ket_qua_da_co)
+        
+        # Xóa thư mục temp sau khi hoàn thành
+        for thu_muc_temp in cac_thu_muc_temp:
+            try:
+                if os.path.exists(thu_muc_temp):
+                    shutil.rmtree(thu_muc_temp)
+            except Exception:
+                pass
+        
+        # Tạo file tổng hợp
+        tong_hop_don_gian = self.tao_tong_hop_don_gian(ket_qua_tong_hop, phieu_trung_lap)
+        self.luu_ket_qua_json(tong_hop_don_gian, os.path.join(thu_muc_output, "tong_hop_ket_qua.json"))
+        
+        # In thông tin tổng kết
+        print(f"\n{'='*70}")
+        print(f"TỔNG KẾT QUẢ XỬ LÝ BATCH - TrOCR + YOLO")
+        print(f"{'='*70}")
+        print(f"Tổng số phiếu: {tong_hop_don_gian['tong_so_phieu_bau']}")
+        print(f"Phiếu hợp lệ: {tong_hop_don_gian['tong_so_phieu_hop_le']}")
+        print(f"Phiếu lỗi: {tong_hop_don_gian['tong_so_phieu_loi']}")
+        print(f"Đã xử lý: {total_success}/{total_files} ảnh từ {len(thu_muc_anh)} thư mục")
+        
+        if self.loc_muc and self.thong_ke_loc_muc['tong_so_o'] > 0:
+            tk = self.thong_ke_loc_muc
+            print(f"Lọc mực: {tk['bo_qua_yolo']}/{tk['tong_so_o']} ô bỏ qua YOLO "
+                  f"({tk['bo_qua_yolo'] / tk['tong_so_o'] * 100:.1f}%), {tk['gui_yolo']} ô gửi YOLO")
+        
+        if self.leo_thang and self.thong_ke_leo_thang['tong_so_o'] > 0:
+            tk = self.thong_ke_leo_thang
+            print(f"Leo thang: {tk['leo_thang']}/{tk['tong_so_o']} ô chạy lượt thứ hai "
+                  f"({tk['leo_thang'] / tk['tong_so_o'] * 100:.1f}%), {tk['doi_quyet_dinh']} ô đổi quyết định")
+        
+        if self.thong_ke_day_chuyen:
+            for ten, tk in self.thong_ke_day_chuyen.items():
+                print(f"Dây chuyền {ten}: {tk['so_worker']} worker, {tk['thoi_gian_xu_ly']:.1f}s, "
+                      f"hàng đợi TB {tk['do_sau_trung_binh']} / tối đa {tk['do_sau_toi_da']}")
+        
+        if self.gom_lo:
+            for ten, tk in self.thong_ke_gom_lo().items():
+                print(f"Gom lô {ten}: {tk['so_phan_tu']} ô / {tk['so_lo']} lô "
+                      f"(TB {tk['kich_thuoc_lo_trung_binh']}), phân bố {tk['phan_bo_kich_thuoc_lo']}")
+        
+        if self.thong_ke_tien_trinh:
+            for tk in self.thong_ke_tien_trinh:
+                print(f"Tiến trình {tk['shard']}: {tk['so_thanh_cong']}/{tk['so_phieu']} phiếu, {tk['thoi_gian']:.1f}s")
+        
+        if self._bo_nho_dem:
+            print("Bộ nhớ đệm: " + ", ".join(f"{giai_doan} {dem['trung']}/{dem['trung'] + dem['truot']} trúng"
+                                              for giai_doan, dem in self._bo_nho_dem.thong_ke.items()))
+        
+        if phieu_trung_lap is not None:
+            print(f"Phiếu trùng ({'bỏ qua' if self.trung_lap == 'skip' else 'đánh dấu'}, không tính vào tổng hợp): "
+                  f"{tong_hop_don_gian['tong_so_phieu_trung_lap']}")
+            for phieu in tong_hop_don_gian['danh_sach_phieu_trung_lap']:
+                print(f"  - {phieu['phieu']} ~ {phieu['trung_voi']} (khoảng cách {phieu['khoang_cach']})")
+        
+        if tong_hop_don_gian['danh_sach_phieu_loi']:
+            print(f"\nDanh sách phiếu lỗi:")
+            for phieu_loi in tong_hop_don_gian['danh_sach_phieu_loi']:
+                print(f"  - {phieu_loi}")
+        
+        cac_phieu_cach_ly = cach_ly.danh_sach()
+        if cac_phieu_cach_ly:
+            print(f"\nPhiếu bị cách ly trong {cach_ly.thu_muc} (chạy lại với --retry-quarantined): {len(cac_phieu_cach_ly)}")
+            for ban_ghi in cac_phieu_cach_ly:
+                print(f"  - {ban_ghi['viec']['duong_dan_anh']} [{ban_ghi['giai_doan'] or '?'}, "
+                      f"lần {ban_ghi['so_lan_thu']}]: {ban_ghi['loi']}")
+        
+        print(f"\nTop 5 ứng viên được đồng ý nhiều nhất:")
+        for i, ung_vien in enumerate(tong_hop_don_gian['ket_qua_binh_chon'][:5], 1):
+            print(f"  {i}. {ung_vien['ho_ten']}: {ung_vien['so_luot_dong_y']} lượt")
+        
+        return ket_qua_tong_hop
+    
+    def xu_ly_danh_sach_viec(self, danh_sach_viec: List[Dict]):
+        """
+        Xử lý các phiếu trong danh sách việc (tuần tự hoặc theo dây chuyền) và lưu kết quả từng phiếu
+        
+        Args:
+            danh_sach_viec: List dict {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua'},
+                            thêm {'nguon', 'thanh_vien'} với ảnh nằm trong file zip/tar hoặc trang PDF/TIFF
+        
+        Returns:
+            (Dict {đường dẫn ảnh: kết quả phiếu}, số phiếu xử lý thành công)
+        """
+        viec_trong_nguon = [viec for viec in danh_sach_viec if viec.get('nguon')]
+        if viec_trong_nguon:
+            # Ảnh trong file nén / trang tài liệu đi đường riêng: decode thẳng từ file nguồn trong bộ nhớ
+            ket_qua_tong_hop, total_success = self.xu_ly_nguon_nhieu_anh(viec_trong_nguon)
+            viec_con_lai = [viec for viec in danh_sach_viec if not viec.get('nguon')]
+            if viec_con_lai:
+                ket_qua_con_lai, so_thanh_cong = self.xu_ly_danh_sach_viec(viec_con_lai)
+                ket_qua_tong_hop.update(ket_qua_con_lai)
+                total_success += so_thanh_cong
+            return ket_qua_tong_hop, total_success
+        
+        if self.bo_nho_chung:
+            return self.xu_ly_qua_bo_nho_chung(danh_sach_viec)
+        
+        ket_qua_tong_hop = {}
+        total_success = 0
+        
+        if self.day_chuyen:
+            # Tiền xử lý phiếu sau chạy song song với OCR/YOLO của phiếu trước
+            for ket_qua_viec in self.xu_ly_theo_day_chuyen(danh_sach_viec):
+                image_path = ket_qua_viec['dau_vao']['duong_dan_anh']
+                if ket_qua_viec['loi']:
+                    self._bao_loi_phieu(ket_qua_viec['dau_vao'], ket_qua_viec['loi'], ket_qua_viec['han_chot'])
+                    ket_qua_tong_hop[image_path] = []
+                else:
+                    ket_qua_tong_hop[image_path] = ket_qua_viec['ket_qua']
+                    total_success += 1
+        else:
+            for viec in danh_sach_viec:
+                image_path = viec['duong_dan_anh']
+                han_chot = self._tao_han_chot()
+                try:
+                    # Xử lý phiếu bầu
+                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, viec['thu_muc_temp'], han_chot=han_chot)
+                    ket_qua_tong_hop[image_path] = ket_qua
+                    
+                    # Lưu kết quả chi tiết riêng cho từng phiếu
+                    self._luu_ket_qua_phieu(viec, ket_qua, han_chot)
                     
+                    total_success += 1
+                
+                except Exception as e:
+                    self._bao_loi_phieu(viec, e, han_chot)
+                    ket_qua_tong_hop[image_path] = []
+        
+        return ket_qua_tong_hop, total_success
+    
+    def _luu_ket_qua_phieu(self, viec: Dict, ket_qua, han_chot: HanChotPhieu = None, loi: str = None):
+        """
+        Lưu kết quả một phiếu của batch rồi ghi phiếu vào bản kê (nếu có). Phiếu không có kết quả
+        (trừ phiếu trùng bị bỏ qua) được cách ly; phiếu có kết quả được xóa khỏi thư mục cách ly.
+        
+        Args:
+            viec: Dict việc của phiếu
+            ket_qua: Kết quả phiếu (list rỗng nếu không tiền xử lý được)
+            han_chot: Hạn chót đã dùng khi xử lý phiếu (thời gian từng giai đoạn cho bản ghi cách ly)
+            loi: Lý do phiếu không có kết quả (mặc định: không tiền xử lý được)
+        """
+        self.luu_ket_qua_json(ket_qua, viec['file_ket_qua'])
+        if self._ban_ke is not None and 'bam' in viec:
+            self._ban_ke.ghi(viec, thanh_cong=bool(ket_qua))
+        
+        if self._cach_ly is None:
+            return
+        khoa = viec['duong_dan_anh']
+        if ket_qua or (self._chi_muc_trung_lap is not None and khoa in self._chi_muc_trung_lap.phieu_trung_lap):
+            if self._cach_ly.xoa(khoa):
+                print(f"[INFO] {khoa} đã xử lý được, xóa khỏi thư mục cách ly")
+        else:
+            self._cach_ly_phieu(viec, loi or "Không thể tiền xử lý ảnh (kiểm tra ArUco markers)", han_chot,
+                                giai_doan='tien_xu_ly')
+    
+    def _bao_loi_phieu(self, viec: Dict, loi, han_chot: HanChotPhieu = None, anh=None, giai_doan: str = None):
+        """In lỗi của một phiếu trong batch và cách ly phiếu (nếu đang có thư mục cách ly)"""
+        print(f"❌ Lỗi xử lý {viec['duong_dan_anh']}: {str(loi)}")
+        if self._cach_ly is not None:
+            self._cach_ly_phieu(viec, loi, han_chot, anh, giai_doan)
+    
+    def _cach_ly_phieu(self, viec: Dict, loi, han_chot: HanChotPhieu = None, anh=None, giai_doan: str = None):
+        try:
+            thu_muc = self._cach_ly.ghi(viec, loi, han_chot, anh, giai_doan)
+            print(f"  [WARNING] Đã cách ly phiếu: {thu_muc}")
+        except OSError as e:
+            print(f"[WARNING] Không ghi được thư mục cách ly cho {viec['duong_dan_anh']}: {e}")
+    
+    def van_tay_cau_hinh(self) -> str:
+        """
+        Vân tay của các tham số ảnh hưởng đến kết quả phiếu (mô hình, weights, ngưỡng, chế độ phát hiện).
+        Tham số chỉ ảnh hưởng tốc độ (số tiến trình, dây chuyền, gom lô...) không nằm trong vân tay.
+        """
+        return bam_cau_hinh({
+            'trocr': TEN_MO_HINH_TROCR,
+            'so_tu_toi_da': SO_TU_TOI_DA,
+            **self._cau_hinh_phat_hien(),
+            # Ô cắt giữ trong bộ nhớ (không qua JPEG) cho kết quả OCR hơi khác
+            'bo_nho_chung': self.bo_nho_chung
+        })
+    
+    def _cau_hinh_phat_hien(self) -> Dict:
+        """Các tham số ảnh hưởng đến kết quả phát hiện dấu X (weights YOLO theo đường dẫn, kích thước, mtime)"""
+        try:
+            st = os.stat(self.yolo_weights_path)
+            weights = [self.yolo_weights_path, st.st_size, st.st_mtime_ns]
+        except OSError:
+            weights = None
+        return {
+            'yolo': weights if self.yolo_model is not None else None,
+            'yolo_backend': self.yolo_backend,
+            'int8': self.int8,
+            'che_do_phat_hien': self.che_do_phat_hien,
+            'imgsz_toan_phieu': self.imgsz_toan_phieu,
+            'nguong_chong_lan': self.nguong_chong_lan,
+            'loc_muc': self.loc_muc,
+            'nguong_o_trong': self.nguong_o_trong,
+            'imgsz_o': self.imgsz_o,
+            'o_chu_nhat': self.o_chu_nhat,
+            'max_det_o': self.max_det_o,
+            'conf_yolo': self.conf_yolo,
+            'lop_yolo': self.lop_yolo,
+            'leo_thang': self.leo_thang,
+            'vung_xam': list(self.vung_xam),
+            'imgsz_leo_thang': self.imgsz_leo_thang,
+            'conf_leo_thang': self.conf_leo_thang
+        }
+    
+    def xu_ly_nguon_nhieu_anh(self, danh_sach_viec: List[Dict]):
+        """
+        Xử lý các phiếu nằm trong file zip/tar hoặc các trang của PDF/TIFF nhiều trang: ảnh được
+        decode trong bộ nhớ và đọc trước vài phiếu trong lúc phiếu hiện tại chạy TrOCR + YOLO,
+        không giải nén hay tách trang ra đĩa
+        
+        Args:
+            danh_sach_viec: List dict {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua', 'nguon', 'thanh_vien'}
+        
+        Returns:
+            (Dict {khóa ảnh: kết quả phiếu}, số phiếu xử lý thành công)
+        """
+        viec_theo_nguon = {}
+        for viec in danh_sach_viec:
+            viec_theo_nguon.setdefault(viec['nguon'], {})[viec['thanh_vien']] = viec
+        
+        ket_qua_tong_hop = {}
+        total_success = 0
+        
+        for nguon, viec_theo_thanh_vien in viec_theo_nguon.items():
+            print(f"[INFO] Đọc {len(viec_theo_thanh_vien)} ảnh từ {nguon}")
+            try:
+                for thanh_vien, anh, loi in doc_anh_tu_nguon(nguon, list(viec_theo_thanh_vien),
+                                                             self.so_luong_doc_nen):
+                    viec = viec_theo_thanh_vien[thanh_vien]
+                    image_path = viec['duong_dan_anh']
+                    han_chot = self._tao_han_chot()
+                    if anh is None:
+                        self._bao_loi_phieu(viec, loi, giai_doan='doc_anh')
+                        ket_qua_tong_hop[image_path] = []
+                        continue
+                    try:
+                        ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, viec['thu_muc_temp'], anh=anh,
+                                                                  han_chot=han_chot)
+                        ket_qua_tong_hop[image_path] = ket_qua
+                        self._luu_ket_qua_phieu(viec, ket_qua, han_chot)
+                        total_success += 1
+                    except Exception as e:
+                        self._bao_loi_phieu(viec, e, han_chot, anh)
+                        ket_qua_tong_hop[image_path] = []
             except Exception as e:
-                loi_msg = f"Lỗi xử lý {loai}: {str(e)}"
-                ket_qua['chi_tiet']['loi'].append(loi_msg)
-                print(f"[ERROR] {loi_msg}")
+                print(f"❌ Lỗi đọc {nguon}: {str(e)}")
+                loi_nguon = e
+            else:
+                loi_nguon = None
+            
+            # Ảnh không đọc được (file hỏng giữa chừng) vẫn có mặt trong tổng hợp là phiếu lỗi
+            for viec in viec_theo_thanh_vien.values():
+                if viec['duong_dan_anh'] not in ket_qua_tong_hop:
+                    ket_qua_tong_hop[viec['duong_dan_anh']] = []
+                    if self._cach_ly is not None:
+                        self._cach_ly_phieu(viec, loi_nguon or "Không đọc được ảnh từ nguồn", giai_doan='doc_anh')
         
-        return ket_qua
+        return ket_qua_tong_hop, total_success
     
-    def xu_ly_phieu_bau_hoan_chinh(self, 
-                                   duong_dan_anh: str,
-                                   thu_muc_temp: str = "results/ket_qua_trocr_yolo/temp_processing") -> List[Dict]:
+    def xu_ly_qua_bo_nho_chung(self, danh_sach_viec: List[Dict]):
         """
-        Xử lý hoàn chỉnh một phiếu bầu
+        Các tiến trình con làm phẳng và cắt phiếu, ghi ô vào bộ đệm vòng trên shared memory;
+        tiến trình này đọc ô (không copy) để chạy TrOCR + YOLO rồi trả slot
         
         Args:
-            duong_dan_anh: Đường dẫn đến ảnh phiếu bầu gốc
-            thu_muc_temp: Thư mục tạm để lưu ảnh đã cắt
-            
+            danh_sach_viec: List dict {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua'}
+        
         Returns:
-            List các kết quả xử lý cho từng dòng
+            (Dict {đường dẫn ảnh: kết quả phiếu}, số phiếu xử lý thành công), cùng thứ tự đầu vào
         """
-        # Bước 1: Tiền xử lý và cắt ảnh (auto-detect layout trong xu_ly_phieu_bau)
-        ma_tran_anh = xu_ly_phieu_bau(duong_dan_anh, thu_muc_temp)
+        if not danh_sach_viec:
+            return {}, 0
         
-        if not ma_tran_anh:
-            print("  [ERROR] Không thể tiền xử lý ảnh")
-            return []
+        phuong_thuc = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        ctx = multiprocessing.get_context(phuong_thuc)
+        bo_dem = BoDemVong(self.so_slot_bo_dem, ctx=ctx)
         
-        # Bước 2: Xử lý từng dòng với TrOCR + YOLO
-        ket_qua_tong = []
+        so_tien_trinh = max(1, min(self.so_tien_trinh_tien_xu_ly, len(danh_sach_viec)))
+        hang_doi_viec = ctx.Queue()
+        for viec in danh_sach_viec:
+            hang_doi_viec.put(viec['duong_dan_anh'])
+        for _ in range(so_tien_trinh):
+            hang_doi_viec.put(None)
         
-        for i, dong_anh in enumerate(ma_tran_anh, 1):
-            ket_qua_dong = self.xu_ly_mot_dong(dong_anh, i)
-            ket_qua_dong['so_dong'] = i
-            ket_qua_tong.append(ket_qua_dong)
+        cac_tien_trinh = [ctx.Process(target=worker_tien_xu_ly,
+                                      args=(bo_dem, hang_doi_viec, self.loc_muc, self.ke_hoach_luong,
+                                            self._chi_muc_trung_lap is not None))
+                          for _ in range(so_tien_trinh)]
+        for tien_trinh in cac_tien_trinh:
+            tien_trinh.start()
         
-        # Bước 3: Tổng hợp kết quả
-        self.in_ket_qua_tong_hop(ket_qua_tong)
+        viec_theo_anh = {viec['duong_dan_anh']: viec for viec in danh_sach_viec}
+        ket_qua_theo_anh = {}
+        total_success = 0
         
-        return ket_qua_tong
+        try:
+            while len(ket_qua_theo_anh) < len(danh_sach_viec):
+                try:
+                    mo_ta = bo_dem.san_sang.get(timeout=1)
+                except queue.Empty:
+                    if not any(tien_trinh.is_alive() for tien_trinh in cac_tien_trinh):
+                        print("❌ Các tiến trình tiền xử lý đã dừng trước khi hoàn thành")
+                        break
+                    continue
+                
+                image_path = mo_ta['duong_dan_anh']
+                han_chot = self._tao_han_chot()
+                try:
+                    if mo_ta.get('thoi_gian_tien_xu_ly') is not None:
+                        # Tiền xử lý đã chạy ở tiến trình con, chỉ kiểm tra được sau khi xong
+                        han_chot.ghi_giai_doan('tien_xu_ly', mo_ta['thoi_gian_tien_xu_ly'])
+                    if mo_ta['loi']:
+                        print(f"  [ERROR] {mo_ta['loi']}: {image_path}")
+                        ket_qua = []
+                    elif mo_ta.get('van_tay') is not None and self._la_phieu_bo_qua(image_path, van_tay=mo_ta['van_tay']):
+                        ket_qua = []
+                    else:
+                        # Tiến trình con đã làm phẳng và cắt; bộ nhớ đệm chỉ bỏ qua được OCR / YOLO / ghép
+                        khoa = self._khoa_giai_doan(image_path, co_anh_phang=False)
+                        ket_qua = self._ket_qua_da_luu(khoa)
+                        if ket_qua is None:
+                            ma_tran_anh = bo_dem.doc_phieu(mo_ta)
+                            ti_le_muc = np.array(mo_ta['ti_le_muc']) if mo_ta['ti_le_muc'] is not None else None
+                            
+                            def phat_hien():
+                                ket_qua_yolo = self.phat_hien_dau_x_phieu(ma_tran_anh, ti_le_muc=ti_le_muc)
+                                if self.leo_thang:
+                                    han_chot.kiem_tra('phat_hien')
+                                    self.leo_thang_o_mo_ho(ma_tran_anh, ket_qua_yolo)
+                                return ket_qua_yolo
+                            
+                            with han_chot.giai_doan('phat_hien'):
+                                ket_qua_yolo_theo_dong = self._chay_giai_doan(PHAT_HIEN, khoa, phat_hien)
+                            with han_chot.giai_doan('ocr'):
+                                ten_theo_dong = self._chay_giai_doan(OCR, khoa,
+                                                                     lambda: self.doc_ten_phieu(ma_tran_anh, han_chot))
+                            ket_qua = self.ghep_ket_qua_phieu(ma_tran_anh, ket_qua_yolo_theo_dong, ten_theo_dong)
+                            self._luu_ket_qua_dem(khoa, ket_qua)
+                        self.in_ket_qua_tong_hop(ket_qua)
+                    
+                    self._luu_ket_qua_phieu(viec_theo_anh[image_path], ket_qua, han_chot, mo_ta['loi'])
+                    total_success += 1
+                except Exception as e:
+                    self._bao_loi_phieu(viec_theo_anh[image_path], e, han_chot)
+                    ket_qua = []
+                finally:
+                    # Kết quả không giữ tham chiếu tới ảnh trong slot, có thể trả slot ngay
+                    bo_dem.tra_slot(mo_ta['slot'])
+                
+                ket_qua_theo_anh[image_path] = ket_qua
+        finally:
+            for tien_trinh in cac_tien_trinh:
+                tien_trinh.join(timeout=5)
+                if tien_trinh.is_alive():
+                    tien_trinh.terminate()
+            bo_dem.dong()
+        
+        ket_qua_tong_hop = {viec['duong_dan_anh']: ket_qua_theo_anh.get(viec['duong_dan_anh'], [])
+                            for viec in danh_sach_viec}
+        self._cach_ly_phieu_thieu(danh_sach_viec, ket_qua_theo_anh, "Tiến trình tiền xử lý dừng trước khi xử lý phiếu")
+        
+        return ket_qua_tong_hop, total_success
     
-    def in_ket_qua_tong_hop(self, ket_qua_tong: List[Dict]):
+    def _cach_ly_phieu_thieu(self, danh_sach_viec: List[Dict], ket_qua_theo_anh: Dict, loi: str):
+        """Cách ly các phiếu không có mặt trong kết quả (tiến trình xử lý phiếu dừng bất thường)"""
+        if self._cach_ly is None:
+            return
+        for viec in danh_sach_viec:
+            if viec['duong_dan_anh'] not in ket_qua_theo_anh:
+                self._cach_ly_phieu(viec, loi)
+    
+    def xu_ly_nhieu_tien_trinh(self, danh_sach_viec: List[Dict]):
         """
-        In kết quả tổng hợp
+        Chia danh sách phiếu cho nhiều tiến trình con. Mô hình được load một lần ở tiến trình cha,
+        tiến trình con được fork sau khi load nên dùng chung weights theo copy-on-write.
+        
+        Args:
+            danh_sach_viec: List dict {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua'}
+        
+        Returns:
+            (Dict {đường dẫn ảnh: kết quả phiếu}, số phiếu xử lý thành công), cùng thứ tự đầu vào
         """
-        print(f"\n{'='*60}")
-        print(f"KẾT QUẢ XỬ LÝ PHIẾU BẦU")
-        print(f"{'='*60}")
+        so_tien_trinh = min(self.so_tien_trinh, len(danh_sach_viec))
+        if so_tien_trinh <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return self.xu_ly_danh_sach_viec(danh_sach_viec)
         
-        tong_dong = len(ket_qua_tong)
-        so_dong_y = sum(1 for kq in ket_qua_tong if kq['dong_y'])
-        so_khong_dong_y = sum(1 for kq in ket_qua_tong if kq['khong_dong_y'])
-        so_khong_chon = sum(1 for kq in ket_qua_tong if not kq['dong_y'] and not kq['khong_dong_y'])
-        so_chon_ca_hai = sum(1 for kq in ket_qua_tong if kq['dong_y'] and kq['khong_dong_y'])
+        # TrOCR được load lười - load trước khi fork để các tiến trình con không tự load lại
+        try:
+            get_pipeline()
+        except Exception as e:
+            print(f"[WARNING] Không thể load TrOCR trước khi fork: {e}")
         
-        # Thống kê x_cancelled
-        so_x_cancelled_dong_y = sum(1 for kq in ket_qua_tong 
-                                   if kq.get('chi_tiet', {}).get('dong_y_yolo', {}).get('so_luong_x_cancelled', 0) > 0)
-        so_x_cancelled_khong_dong_y = sum(1 for kq in ket_qua_tong 
-                                         if kq.get('chi_tiet', {}).get('khong_dong_y_yolo', {}).get('so_luong_x_cancelled', 0) > 0)
+        ctx = multiprocessing.get_context('fork')
+        hang_doi_ket_qua = ctx.Queue()
         
-        print(f"Tổng số ứng viên: {tong_dong}")
-        print(f"Đồng ý: {so_dong_y}")
-        print(f"Không đồng ý: {so_khong_dong_y}")
-        print(f"Không chọn: {so_khong_chon}")
-        print(f"Chọn cả hai (lỗi): {so_chon_ca_hai}")
-        print(f"Có dấu X bị gạch bỏ ở ô đồng ý: {so_x_cancelled_dong_y}")
-        print(f"Có dấu X bị gạch bỏ ở ô không đồng ý: {so_x_cancelled_khong_dong_y}")
+        # Đưa các object hiện có ra khỏi GC để tiến trình con không ghi vào trang nhớ chứa weights
+        gc.freeze()
+        cac_tien_trinh = []
+        for chi_so in range(so_tien_trinh):
+            tien_trinh = ctx.Process(target=self._chay_shard,
+                                     args=(chi_so, so_tien_trinh, danh_sach_viec[chi_so::so_tien_trinh], hang_doi_ket_qua))
+            tien_trinh.start()
+            cac_tien_trinh.append(tien_trinh)
+        gc.unfreeze()
         
-        print(f"\nCHI TIẾT TỪNG ỨNG VIÊN:")
-        print("-" * 80)
+        # Nhận kết quả trước khi join để tiến trình con không bị chặn khi ghi vào hàng đợi
+        ket_qua_shard = {}
+        while len(ket_qua_shard) < so_tien_trinh:
+            try:
+                thong_diep = hang_doi_ket_qua.get(timeout=1)
+                ket_qua_shard[thong_diep['shard']] = thong_diep
+            except queue.Empty:
+                if not any(tien_trinh.is_alive() for tien_trinh in cac_tien_trinh):
+                    break
         
-        for kq in ket_qua_tong:
-            trang_thai = "❌ Lỗi (chọn cả hai)" if (kq['dong_y'] and kq['khong_dong_y']) else \
-                        "✅ Đồng ý" if kq['dong_y'] else \
-                        "❌ Không đồng ý" if kq['khong_dong_y'] else \
-                        "⚪ Không chọn"
-            
-            # Thêm thông tin về x_cancelled
-            cancelled_info = ""
-            dong_y_cancelled = kq.get('chi_tiet', {}).get('dong_y_yolo', {}).get('so_luong_x_cancelled', 0)
-            khong_dong_y_cancelled = kq.get('chi_tiet', {}).get('khong_dong_y_yolo', {}).get('so_luong_x_cancelled', 0)
+        for tien_trinh in cac_tien_trinh:
+            tien_trinh.join()
+        
+        # Gộp kết quả và thống kê của các shard
+        ket_qua_theo_anh = {}
+        total_success = 0
+        cac_thong_ke_day_chuyen = []
+        self.thong_ke_tien_trinh = []
+        
+        for chi_so in range(so_tien_trinh):
+            thong_diep = ket_qua_shard.get(chi_so)
+            if thong_diep is None:
+                print(f"❌ Tiến trình {chi_so} dừng bất thường (exit code {cac_tien_trinh[chi_so].exitcode})")
+                continue
             
-            if dong_y_cancelled > 0 or khong_dong_y_cancelled > 0:
-                cancelled_info = f" [Gạch bỏ: ĐY:{dong_y_cancelled}, KĐY:{khong_dong_y_cancelled}]"
+            ket_qua_theo_anh.update(thong_diep['ket_qua_tong_hop'])
+            total_success += thong_diep['so_thanh_cong']
+            for khoa in self.thong_ke_loc_muc:
+                self.thong_ke_loc_muc[khoa] += thong_diep['thong_ke_loc_muc'][khoa]
+            for khoa in self.thong_ke_leo_thang:
+                self.thong_ke_leo_thang[khoa] += thong_diep['thong_ke_leo_thang'][khoa]
+            if thong_diep['thong_ke_day_chuyen']:
+                cac_thong_ke_day_chuyen.append(thong_diep['thong_ke_day_chuyen'])
+            if thong_diep['thong_ke_gom_lo']:
+                self._thong_ke_gom_lo_shard.append(thong_diep['thong_ke_gom_lo'])
+            if thong_diep['thong_ke_bo_nho_dem']:
+                self._bo_nho_dem.gop_thong_ke(thong_diep['thong_ke_bo_nho_dem'])
             
-            print(f"Dòng {kq['so_dong']:2d} | STT: {kq['stt']:3d} | {kq['ho_ten']:25s} | {trang_thai}{cancelled_info}")
+            self.thong_ke_tien_trinh.append({
+                'shard': chi_so,
+                'so_phieu': thong_diep['so_phieu'],
+                'so_thanh_cong': thong_diep['so_thanh_cong'],
+                'thoi_gian': thong_diep['thoi_gian']
+            })
+        
+        if cac_thong_ke_day_chuyen:
+            self.thong_ke_day_chuyen = gop_thong_ke_day_chuyen(cac_thong_ke_day_chuyen)
+        
+        # Phiếu của tiến trình lỗi được ghi nhận là không có kết quả và được cách ly
+        ket_qua_tong_hop = {viec['duong_dan_anh']: ket_qua_theo_anh.get(viec['duong_dan_anh'], [])
+                            for viec in danh_sach_viec}
+        self._cach_ly_phieu_thieu(danh_sach_viec, ket_qua_theo_anh, "Tiến trình xử lý phiếu dừng bất thường")
+        
+        return ket_qua_tong_hop, total_success
     
-    def xu_ly_nhieu_phieu_bau(self, 
-                              thu_muc_anh=None,
-                              thu_muc_output: str = "results/ket_qua_trocr_yolo") -> Dict:
+    def _chay_shard(self, chi_so, so_tien_trinh, danh_sach_viec, hang_doi_ket_qua):
+        """Chạy trong tiến trình con: xử lý một shard rồi gửi kết quả về tiến trình cha"""
+        bat_dau = time.perf_counter()
+        
+        # Mỗi tiến trình dùng khối lõi riêng trong kế hoạch luồng để không tranh luồng của nhau
+        ap_dung_ke_hoach(self.ke_hoach_luong, chi_so_tien_trinh=chi_so)
+        
+        self.so_tien_trinh = 1
+        self._thong_ke_gom_lo_shard = []
+        for khoa in self.thong_ke_loc_muc:
+            self.thong_ke_loc_muc[khoa] = 0
+        for khoa in self.thong_ke_leo_thang:
+            self.thong_ke_leo_thang[khoa] = 0
+        if self._bo_nho_dem:
+            self._bo_nho_dem.dat_lai_thong_ke()
+        
+        # Luồng gom lô và nhóm luồng xử lý dòng của tiến trình cha không tồn tại sau fork
+        if self.gom_lo:
+            self._tao_bo_gom_lo()
+        if self.song_song_dong:
+            self._nhom_luong_dong = ThreadPoolExecutor(self.so_luong_dong, thread_name_prefix="dong")
+        
+        ket_qua_tong_hop, so_thanh_cong = self.xu_ly_danh_sach_viec(danh_sach_viec)
+        
+        hang_doi_ket_qua.put({
+            'shard': chi_so,
+            'so_phieu': len(danh_sach_viec),
+            'so_thanh_cong': so_thanh_cong,
+            'thoi_gian': round(time.perf_counter() - bat_dau, 3),
+            'ket_qua_tong_hop': ket_qua_tong_hop,
+            'thong_ke_loc_muc': self.thong_ke_loc_muc,
+            'thong_ke_leo_thang': self.thong_ke_leo_thang,
+            'thong_ke_day_chuyen': self.thong_ke_day_chuyen,
+            'thong_ke_gom_lo': self.thong_ke_gom_lo() if self.gom_lo else None,
+            'thong_ke_bo_nho_dem': self._bo_nho_dem.thong_ke if self._bo_nho_dem else None
+        })
+    
+    def _tao_bo_gom_lo(self):
+        """Tạo bộ gom lô TrOCR và YOLO dùng chung cho mọi phiếu đang xử lý trong tiến trình"""
+        self.bo_gom_ocr = BoGomLo('ocr', lambda ds: doc_ten_theo_lo(ds, batch_size=self.kich_thuoc_lo_ocr),
+                                  self.kich_thuoc_lo_ocr, self.thoi_gian_cho_lo)
+        self.bo_gom_yolo = BoGomLo('yolo', self.kiem_tra_dau_x_theo_lo,
+                                   self.kich_thuoc_lo_yolo, self.thoi_gian_cho_lo)
+    
+    def thong_ke_gom_lo(self) -> Dict:
+        """Thống kê gom lô của tiến trình này, gộp với thống kê của các tiến trình con (nếu có)"""
+        return {
+            ten: gop_thong_ke_gom_lo([bo_gom.thong_ke()] + [tk[ten] for tk in self._thong_ke_gom_lo_shard])
+            for ten, bo_gom in (('ocr', self.bo_gom_ocr), ('yolo', self.bo_gom_yolo))
+        }
+    
+    def xu_ly_theo_day_chuyen(self, danh_sach_viec: List[Dict]) -> List[Dict]:
         """
-        Xử lý nhiều phiếu bầu trong các thư mục (hỗ trợ ballot/data1, ballot/data2)
+        Xử lý nhiều phiếu theo dây chuyền: tiền xử lý → OCR → YOLO → ghi kết quả,
+        các giai đoạn nối với nhau bằng hàng đợi có giới hạn
         
         Args:
-            thu_muc_anh: Thư mục hoặc danh sách thư mục chứa ảnh phiếu bầu (mặc định: ["ballot/data1", "ballot/data2"])
-            thu_muc_output: Thư mục lưu kết quả
-            
+            danh_sach_viec: List dict {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua'}
+        
         Returns:
-            Dict chứa kết quả tổng hợp
+            List (theo thứ tự đầu vào) các dict {'dau_vao', 'ket_qua', 'loi'} của DayChuyen.chay,
+            thêm 'han_chot' (hạn chót của phiếu, None nếu phiếu chưa vào giai đoạn nào)
         """
-        # Xử lý tham số đầu vào
-        if thu_muc_anh is None:
-            thu_muc_anh = ["ballot/data1", "ballot/data2"]  # Mặc định xử lý cả 2 thư mục
-        elif isinstance(thu_muc_anh, str):
-            thu_muc_anh = [thu_muc_anh]  # Chuyển string thành list
+        # Hạn chót từng phiếu, giữ lại để phiếu lỗi giữa dây chuyền vẫn có thời gian các giai đoạn
+        han_chot_theo_anh = {}
         
-        # Tạo thư mục output chính
-        os.makedirs(thu_muc_output, exist_ok=True)
+        def tien_xu_ly(viec):
+            viec = dict(viec)
+            viec['han_chot'] = han_chot_theo_anh[viec['duong_dan_anh']] = self._tao_han_chot()
+            with viec['han_chot'].giai_doan('tien_xu_ly'):
+                viec['khoa_dem'] = self._khoa_giai_doan(viec['duong_dan_anh'],
+                                                        o_qua_jpeg=viec['thu_muc_temp'] is not None)
+                viec['ket_qua_dem'] = self._ket_qua_da_luu(viec['khoa_dem'])
+                if viec['ket_qua_dem'] is not None:
+                    # Kết quả cả phiếu đã lưu đệm: các giai đoạn sau bỏ qua phiếu này
+                    viec['phieu'] = None
+                    return viec
+                viec['phieu'] = self._tien_xu_ly(viec['duong_dan_anh'], viec['thu_muc_temp'], khoa=viec['khoa_dem'])
+                phieu = viec['phieu']
+                if phieu and phieu['ma_tran_anh'] and self._la_phieu_bo_qua(viec['duong_dan_anh'], phieu['anh_phang'],
+                                                                            phieu['ma_tran_anh']):
+                    viec['phieu'] = None
+                    viec['bo_qua'] = True
+            return viec
         
-        ket_qua_tong_hop = {}
-        total_files = 0
-        total_success = 0
+        def ocr(viec):
+            if viec['phieu'] and viec['phieu']['ma_tran_anh']:
+                with viec['han_chot'].giai_doan('ocr'):
+                    viec['ten_theo_dong'] = self._chay_giai_doan(
+                        OCR, viec['khoa_dem'], lambda: self.doc_ten_phieu(viec['phieu']['ma_tran_anh'], viec['han_chot']))
+            return viec
         
-        for input_dir in thu_muc_anh:
-            if not os.path.exists(input_dir):
-                print(f"⚠️ Thư mục {input_dir} không tồn tại, bỏ qua...")
-                continue
-            
-            # Tạo thư mục con cho từng input_dir
-            sub_output_dir = os.path.join(thu_muc_output, f"ket_qua_{os.path.basename(input_dir)}")
-            os.makedirs(sub_output_dir, exist_ok=True)
-            
-            # Lấy danh sách ảnh
-            image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-            image_files = []
-            
-            for filename in os.listdir(input_dir):
-                if any(filename.lower().endswith(ext) for ext in image_extensions):
-                    image_files.append(os.path.join(input_dir, filename))
+        def phat_hien(viec):
+            if viec['phieu'] and viec['phieu']['ma_tran_anh']:
+                with viec['han_chot'].giai_doan('phat_hien'):
+                    viec['ket_qua_yolo'] = self._chay_giai_doan(
+                        PHAT_HIEN, viec['khoa_dem'], lambda: self.phat_hien_dau_x(viec['phieu'], viec['han_chot']))
+            return viec
+        
+        def ghi_ket_qua(viec):
+            phieu = viec['phieu']
+            if viec.get('bo_qua'):
+                ket_qua = []
+            elif viec['ket_qua_dem'] is not None:
+                ket_qua = viec['ket_qua_dem']
+                self.in_ket_qua_tong_hop(ket_qua)
+            elif not phieu or not phieu['ma_tran_anh']:
+                print(f"  [ERROR] Không thể tiền xử lý ảnh {viec['duong_dan_anh']}")
+                ket_qua = []
+            else:
+                ket_qua = self.ghep_ket_qua_phieu(phieu['ma_tran_anh'], viec['ket_qua_yolo'], viec['ten_theo_dong'])
+                self._luu_ket_qua_dem(viec['khoa_dem'], ket_qua)
+                self.in_ket_qua_tong_hop(ket_qua)
             
-            if not image_files:
-                print(f"❌ Không tìm thấy ảnh nào trong {input_dir}!")
+            self._luu_ket_qua_phieu(viec, ket_qua, viec['han_chot'])
+            return ket_qua
+        
+        day_chuyen = DayChuyen([
+            GiaiDoan('tien_xu_ly', tien_xu_ly, self.so_worker_giai_doan['tien_xu_ly'], self.kich_thuoc_hang_doi),
+            GiaiDoan('ocr', ocr, self.so_worker_giai_doan['ocr'], self.kich_thuoc_hang_doi),
+            GiaiDoan('phat_hien', phat_hien, self.so_worker_giai_doan['phat_hien'], self.kich_thuoc_hang_doi),
+            GiaiDoan('ghi_ket_qua', ghi_ket_qua, self.so_worker_giai_doan['ghi_ket_qua'], self.kich_thuoc_hang_doi)
+        ])
+        
+        ket_qua = day_chuyen.chay(danh_sach_viec)
+        self.thong_ke_day_chuyen = day_chuyen.thong_ke()
+        for ket_qua_viec in ket_qua:
+            ket_qua_viec['han_chot'] = han_chot_theo_anh.get(ket_qua_viec['dau_vao']['duong_dan_anh'])
+        
+        return ket_qua
+    
+    def chay_worker_hang_doi(self,
+                             duong_dan_hang_doi: str,
+                             thu_muc_output: str = "results/ket_qua_trocr_yolo",
+                             ten_worker: str = None,
+                             thoi_gian_thue: float = 120.0,
+                             so_lan_thu_toi_da: int = 3) -> Dict:
+        """
+        Nhận và xử lý phiếu từ hàng đợi SQLite dùng chung cho đến khi hàng đợi hết việc. Nhiều
+        worker (trên nhiều máy cùng gắn ổ chung) chạy hàm này trên cùng một file hàng đợi; thêm máy
+        chỉ cần chạy thêm worker. Kết quả từng phiếu chỉ được ghi bởi worker có kết quả được ghi nhận.
+        
+        Args:
+            duong_dan_hang_doi: File SQLite của hàng đợi (tạo bằng --enqueue)
+            thu_muc_output: Thư mục lưu tong_hop_ket_qua.json
+            ten_worker: Tên worker trong hàng đợi (mặc định: máy:pid)
+            thoi_gian_thue: Số giây giữ việc nếu worker không gia hạn (worker chết)
+            so_lan_thu_toi_da: Số lần nhận một phiếu tối đa trước khi đánh dấu lỗi
+        
+        Returns:
+            Dict {khóa ảnh: kết quả phiếu} của toàn bộ hàng đợi (phiếu lỗi là list rỗng)
+        """
+        hang_doi = HangDoiCongViec(duong_dan_hang_doi, thoi_gian_thue=thoi_gian_thue,
+                                   so_lan_thu_toi_da=so_lan_thu_toi_da)
+        ten_worker = ten_worker or ten_worker_mac_dinh()
+        so_thanh_cong = so_bi_mat = so_loi = 0
+        bat_dau = time.perf_counter()
+        print(f"[INFO] Worker {ten_worker} nhận việc từ {duong_dan_hang_doi}: {hang_doi.thong_ke()}")
+        
+        while True:
+            cac_viec = hang_doi.nhan_viec(ten_worker)
+            if not cac_viec:
+                dem = hang_doi.thong_ke()
+                if dem[DANG_XU_LY] == 0 and dem[CHO] == 0:
+                    break
+                # Worker khác đang giữ các việc còn lại - chờ, nhận lại nếu lượt thuê của họ hết hạn
+                time.sleep(min(5.0, thoi_gian_thue / 4))
                 continue
             
-            total_files += len(image_files)
-            
-            # Tạo thư mục temp cho thư mục này
-            thu_muc_temp = os.path.join(sub_output_dir, "temp_processing")
-            os.makedirs(thu_muc_temp, exist_ok=True)
-            
-            success_count = 0
-            
-            for i, image_path in enumerate(image_files, 1):
+            viec = cac_viec[0]
+            khoa = viec['khoa']
+            with hang_doi.giu_thue(viec) as mat_thue:
                 try:
-                    ten_file = os.path.splitext(os.path.basename(image_path))[0]
-
-                    
-                    # Xử lý phiếu bầu
-                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(image_path, thu_muc_temp)
-                    ket_qua_tong_hop[image_path] = ket_qua
-                    
-                    # Lưu kết quả chi tiết riêng cho từng phiếu
-                    self.luu_ket_qua_json(ket_qua, os.path.join(sub_output_dir, f"{ten_file}_result.json"))
-                    
-                    success_count += 1
-                    total_success += 1
-                    
+                    # Ảnh cắt giữ trong bộ nhớ, không cần thư mục temp
+                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(khoa, None, anh=doc_anh_theo_khoa(khoa))
+                    if not ket_qua:
+                        raise ValueError("Không tiền xử lý được phiếu")
                 except Exception as e:
-                    print(f"❌ Lỗi xử lý {image_path}: {str(e)}")
-                    ket_qua_tong_hop[image_path] = []
-    
+                    print(f"❌ Lỗi xử lý {khoa} (lần {viec['so_lan_thu']}): {str(e)}")
+                    hang_doi.bao_loi(viec, str(e))
+                    so_loi += 1
+                    continue
             
-            # Xóa thư mục temp sau khi hoàn thành thư mục này
+            if not mat_thue.is_set() and hang_doi.hoan_thanh(viec, ket_qua):
+                self.luu_ket_qua_json(ket_qua, viec['file_ket_qua'])
+                so_thanh_cong += 1
+            else:
+                # Lượt thuê hết hạn giữa chừng và worker khác đã nhận phiếu: bỏ kết quả này
+                print(f"[WARNING] Mất lượt thuê {khoa}, bỏ kết quả")
+                so_bi_mat += 1
+        
+        # Mọi phiếu đã xong hoặc lỗi: tổng hợp từ kết quả đã ghi nhận trong hàng đợi
+        ket_qua_tong_hop = {}
+        for dong in hang_doi.ket_qua():
+            ket_qua_tong_hop[dong['khoa']] = dong['ket_qua']
+            if dong['trang_thai'] == XONG and not os.path.exists(dong['file_ket_qua']):
+                self.luu_ket_qua_json(dong['ket_qua'], dong['file_ket_qua'])
+        
+        file_tong_hop = os.path.join(thu_muc_output, "tong_hop_ket_qua.json")
+        os.makedirs(thu_muc_output, exist_ok=True)
+        self._cap_nhat_tong_hop(ket_qua_tong_hop, file_tong_hop, f"Worker {ten_worker}",
+                                time.perf_counter() - bat_dau)
+        print(f"[INFO] Worker {ten_worker}: {so_thanh_cong} phiếu ghi nhận, {so_loi} lần lỗi, "
+              f"{so_bi_mat} kết quả bỏ do mất lượt thuê | hàng đợi {hang_doi.thong_ke()}")
+        
+        return ket_qua_tong_hop
+    
+    def theo_doi_thu_muc(self,
+                         thu_muc_vao: str,
+                         thu_muc_output: str = "results/ket_qua_trocr_yolo",
+                         layout: Dict = None,
+                         thoi_gian_on_dinh: float = 1.0,
+                         chu_ky_quet: float = 2.0,
+                         dung_inotify: bool = True):
+        """
+        Theo dõi thư mục máy quét và xử lý từng phiếu ngay khi ảnh được ghi xong. Ảnh đã xử lý
+        được chuyển vào thu_muc_vao/done (hoặc failed nếu không tiền xử lý được); file tổng hợp
+        được cập nhật sau mỗi phiếu. Dừng bằng Ctrl+C - phiếu đang dở vẫn nằm trong thư mục
+        theo dõi và được xử lý lại ở lần chạy sau.
+        
+        Máy quét dùng lại tên file (bộ đếm bắt đầu lại mỗi phiên) thì phiếu sau được thêm hậu tố
+        theo mtime (<tên>_YYYYmmdd_HHMMSS) thay vì ghi đè ảnh và kết quả của phiếu trước. Ảnh không
+        chuyển được (OSError) được giữ lại trong thư mục theo dõi và xử lý lại ở lần quét sau.
+        
+        Args:
+            thu_muc_vao: Thư mục máy quét ghi ảnh vào
+            thu_muc_output: Thư mục lưu kết quả từng phiếu và tong_hop_ket_qua.json
+            layout: Layout cụ thể (None để auto-detect theo đường dẫn)
+            thoi_gian_on_dinh: Số giây kích thước ảnh phải giữ nguyên trước khi xử lý
+            chu_ky_quet: Chu kỳ (giây) quét lại thư mục (dự phòng khi inotify không thấy file)
+            dung_inotify: Dùng inotify nếu có, không thì chỉ quét định kỳ
+        """
+        thu_muc_xong = os.path.join(thu_muc_vao, "done")
+        thu_muc_loi = os.path.join(thu_muc_vao, "failed")
+        for thu_muc in (thu_muc_output, thu_muc_xong, thu_muc_loi):
+            os.makedirs(thu_muc, exist_ok=True)
+        file_tong_hop = os.path.join(thu_muc_output, "tong_hop_ket_qua.json")
+        
+        # Nạp kết quả đã có để tổng hợp tiếp sau khi khởi động lại
+        ket_qua_tong_hop = self._nap_ket_qua_da_co(thu_muc_output)
+        
+        # Chỉ mục nằm trong thư mục kết quả nên vẫn nhớ phiếu gốc sau khi khởi động lại
+        if self.trung_lap:
+            self._chi_muc_trung_lap = ChiMucTrungLap(os.path.join(thu_muc_output, "chi_muc_trung_lap.jsonl"),
+                                                     self.nguong_trung_lap)
+        
+        def da_dung(ten_phieu: str, duoi: str) -> bool:
+            # Tên đã có kết quả (kể cả từ lần chạy trước) hoặc đã có ảnh trong done / failed
+            return ten_phieu in ket_qua_tong_hop or any(
+                os.path.exists(os.path.join(thu_muc, ten_phieu + duoi)) for thu_muc in (thu_muc_xong, thu_muc_loi))
+        
+        def ten_khong_trung(ten_phieu: str, duoi: str, mtime: float) -> str:
+            # Hậu tố theo mtime không đổi khi xử lý lại cùng ảnh, thêm số thứ tự nếu vẫn trùng
+            ten_moi = f"{ten_phieu}_{datetime.fromtimestamp(mtime):%Y%m%d_%H%M%S}"
+            ung_vien, so = ten_moi, 1
+            while da_dung(ung_vien, duoi):
+                so += 1
+                ung_vien = f"{ten_moi}_{so}"
+            return ung_vien
+        
+        def phieu_trung_lap_theo_ten():
+            # Tổng hợp của chế độ theo dõi dùng tên phiếu (không đuôi) làm khóa
+            if self._chi_muc_trung_lap is None:
+                return None
+            ten = lambda khoa: os.path.splitext(ten_anh(khoa))[0]
+            return {ten(khoa): dict(trung, trung_voi=ten(trung['trung_voi']))
+                    for khoa, trung in self._chi_muc_trung_lap.cac_phieu_trung_lap().items()}
+        
+        theo_doi = TheoDoiThuMuc(thu_muc_vao, thoi_gian_on_dinh=thoi_gian_on_dinh,
+                                 chu_ky_quet=chu_ky_quet, dung_inotify=dung_inotify)
+        print(f"👀 Theo dõi {thu_muc_vao} ({theo_doi.che_do}), đã có {len(ket_qua_tong_hop)} phiếu. Ctrl+C để dừng")
+        
+        try:
+            while True:
+                for image_path in theo_doi.cho_file_san_sang():
+                    ten_phieu, duoi = os.path.splitext(os.path.basename(image_path))
+                    bat_dau = time.perf_counter()
+                    
+                    try:
+                        # Tên trùng phiếu trước: xử lý dưới tên mới (khóa chỉ mục trùng lặp, bộ nhớ đệm cũng theo tên mới)
+                        khoa = image_path
+                        if da_dung(ten_phieu, duoi):
+                            ten_moi = ten_khong_trung(ten_phieu, duoi, os.path.getmtime(image_path))
+                            print(f"[WARNING] {ten_phieu}{duoi} trùng tên phiếu đã xử lý, đổi thành {ten_moi}{duoi}")
+                            ten_phieu = ten_moi
+                            khoa = os.path.join(thu_muc_vao, ten_phieu + duoi)
+                        ten_file = ten_phieu + duoi
+                        
+                        try:
+                            # Ảnh cắt giữ trong bộ nhớ, không cần thư mục temp
+                            anh = None
+                            if khoa != image_path:
+                                anh = cv2.imread(image_path)
+                                if anh is None:
+                                    raise ValueError(f"Không đọc được ảnh {image_path}")
+                            ket_qua = self.xu_ly_phieu_bau_hoan_chinh(khoa, None, anh=anh, layout=layout)
+                        except Exception as e:
+                            print(f"❌ Lỗi xử lý {image_path}: {str(e)}")
+                            ket_qua = []
+                        
+                        phieu_trung_lap = phieu_trung_lap_theo_ten()
+                        # Phiếu trùng bị bỏ qua vẫn là đã xử lý xong, không chuyển vào failed
+                        xong = ket_qua or (phieu_trung_lap is not None and ten_phieu in phieu_trung_lap)
+                        
+                        # Chuyển ảnh trước khi ghi kết quả: chuyển lỗi thì phiếu chưa được tính
+                        os.replace(image_path, os.path.join(thu_muc_xong if xong else thu_muc_loi, ten_file))
+                        self.luu_ket_qua_json(ket_qua, os.path.join(thu_muc_output, f"{ten_phieu}_result.json"))
+                        
+                        ket_qua_tong_hop[ten_phieu] = ket_qua
+                        self._cap_nhat_tong_hop(ket_qua_tong_hop, file_tong_hop, ten_file,
+                                                time.perf_counter() - bat_dau, phieu_trung_lap)
+                    except OSError as e:
+                        # Ảnh chưa chuyển được vẫn nằm trong thư mục theo dõi và được xử lý lại ở lần quét sau
+                        print(f"❌ Lỗi chuyển ảnh / ghi kết quả {image_path}: {str(e)}")
+        except KeyboardInterrupt:
+            print(f"\n⏹️ Dừng theo dõi {thu_muc_vao}: {len(ket_qua_tong_hop)} phiếu trong {file_tong_hop}")
+        finally:
+            theo_doi.dong()
+            self._chi_muc_trung_lap = None
+        
+        return ket_qua_tong_hop
+    
+    def xu_ly_video(self,
+                    nguon,
+                    thu_muc_output: str = "results/ket_qua_trocr_yolo",
+                    layout: Dict = None,
+                    luu_khung: bool = True,
+                    so_phieu_cho: int = 8,
+                    **tham_so_chon_khung):
+        """
+        Xử lý phiếu quay bằng camera cố định: một luồng đọc video / camera và chọn khung rõ nhất của
+        từng phiếu (ChonKhungPhieu), luồng này chạy TrOCR + YOLO trên khung đó. Kết quả từng phiếu và
+        file tổng hợp được ghi ngay như chế độ theo dõi thư mục. Dừng bằng Ctrl+C với camera.
+        
+        Args:
+            nguon: File video, URL luồng hoặc chỉ số camera
+            thu_muc_output: Thư mục lưu kết quả từng phiếu, khung hình đã chọn và tong_hop_ket_qua.json
+            layout: Layout cụ thể (None để auto-detect theo tên video)
+            luu_khung: Lưu khung hình đã chọn của từng phiếu vào thu_muc_output/khung_hinh để đối chiếu
+            so_phieu_cho: Số phiếu đã chọn khung tối đa chờ xử lý (khung đầy đủ độ phân giải)
+            **tham_so_chon_khung: Tham số của ChonKhungPhieu
+        """
+        thu_muc_khung = os.path.join(thu_muc_output, "khung_hinh")
+        os.makedirs(thu_muc_khung if luu_khung else thu_muc_output, exist_ok=True)
+        file_tong_hop = os.path.join(thu_muc_output, "tong_hop_ket_qua.json")
+        ket_qua_tong_hop = self._nap_ket_qua_da_co(thu_muc_output)
+        
+        # Ô đánh dấu theo layout để tách hai phiếu đặt chồng nhau theo vân tay mực
+        layout_vung_o = layout
+        if layout_vung_o is None:
             try:
-                if os.path.exists(thu_muc_temp):
-                    shutil.rmtree(thu_muc_temp)
-            except Exception:
-                pass
+                layout_vung_o = chon_layout(str(nguon))
+            except ValueError:
+                print("[WARNING] Không đoán được layout theo tên nguồn, chỉ tách phiếu theo vị trí marker")
+        vung_o = None if layout_vung_o is None else [
+            vung for dong in layout_vung_o.values() for ten, vung in dong.items() if ten in ('agree', 'disagree')]
         
-        # Tạo file tổng hợp
-        tong_hop_don_gian = self.tao_tong_hop_don_gian(ket_qua_tong_hop)
-        self.luu_ket_qua_json(tong_hop_don_gian, os.path.join(thu_muc_output, "tong_hop_ket_qua.json"))
+        chon_khung = ChonKhungPhieu(nguon, vung_o=vung_o, **tham_so_chon_khung)
+        if chon_khung.la_file:
+            # Chạy lại cùng video ghi đè kết quả cũ thay vì đếm phiếu hai lần
+            ten_video = os.path.splitext(os.path.basename(nguon))[0]
+        else:
+            # Mỗi phiên camera có tên riêng để không ghi đè phiên trước
+            ten_video = f"camera_{datetime.now():%Y%m%d_%H%M%S}"
         
-        # In thông tin tổng kết
-        print(f"\n{'='*70}")
-        print(f"TỔNG KẾT QUẢ XỬ LÝ BATCH - TrOCR + YOLO")
-        print(f"{'='*70}")
-        print(f"Tổng số phiếu: {tong_hop_don_gian['tong_so_phieu_bau']}")
-        print(f"Phiếu hợp lệ: {tong_hop_don_gian['tong_so_phieu_hop_le']}")
-        print(f"Phiếu lỗi: {tong_hop_don_gian['tong_so_phieu_loi']}")
-        print(f"Đã xử lý: {total_success}/{total_files} ảnh từ {len(thu_muc_anh)} thư mục")
+        # Chọn khung chạy song song với suy luận để không bỏ lỡ phiếu của camera trong lúc mô hình chạy
+        hang_doi = queue.Queue(so_phieu_cho)
+        loi_doc = []
         
-        if tong_hop_don_gian['danh_sach_phieu_loi']:
-            print(f"\nDanh sách phiếu lỗi:")
-            for phieu_loi in tong_hop_don_gian['danh_sach_phieu_loi']:
-                print(f"  - {phieu_loi}")
+        def doc_video():
+            try:
+                for phieu in chon_khung.cac_phieu():
+                    hang_doi.put(phieu)
+            except Exception as e:
+                loi_doc.append(e)
+            finally:
+                hang_doi.put(None)
         
-        print(f"\nTop 5 ứng viên được đồng ý nhiều nhất:")
-        for i, ung_vien in enumerate(tong_hop_don_gian['ket_qua_binh_chon'][:5], 1):
-            print(f"  {i}. {ung_vien['ho_ten']}: {ung_vien['so_luot_dong_y']} lượt")
+        luong_doc = threading.Thread(target=doc_video, name="doc_video", daemon=True)
+        luong_doc.start()
+        print(f"🎥 Đọc {nguon} ({chon_khung.fps:.0f} fps), đã có {len(ket_qua_tong_hop)} phiếu")
+        
+        try:
+            while True:
+                phieu = hang_doi.get()
+                if phieu is None:
+                    break
+                
+                ten_phieu = f"{ten_video}_phieu_{phieu['so_thu_tu']:04d}"
+                bat_dau = time.perf_counter()
+                if luu_khung:
+                    cv2.imwrite(os.path.join(thu_muc_khung, f"{ten_phieu}.jpg"), phieu['anh'])
+                
+                try:
+                    ket_qua = self.xu_ly_phieu_bau_hoan_chinh(ten_phieu, None, anh=phieu['anh'], layout=layout)
+                except Exception as e:
+                    print(f"❌ Lỗi xử lý {ten_phieu}: {str(e)}")
+                    ket_qua = []
+                
+                self.luu_ket_qua_json(ket_qua, os.path.join(thu_muc_output, f"{ten_phieu}_result.json"))
+                ket_qua_tong_hop[ten_phieu] = ket_qua
+                self._cap_nhat_tong_hop(ket_qua_tong_hop, file_tong_hop,
+                                        f"{ten_phieu} @{phieu['thoi_diem']:.1f}s, độ nét {phieu['do_net']}",
+                                        time.perf_counter() - bat_dau)
+        except KeyboardInterrupt:
+            print(f"\n⏹️ Dừng đọc {nguon}")
+        finally:
+            chon_khung.dung()
+            # Giải phóng luồng đọc nếu nó đang chờ chỗ trong hàng đợi
+            while luong_doc.is_alive():
+                try:
+                    hang_doi.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            chon_khung.dong()
+        
+        if loi_doc:
+            print(f"❌ Lỗi đọc {nguon}: {loi_doc[0]}")
+        tk = chon_khung.thong_ke
+        print(f"🎥 {tk['so_khung']} khung, phân tích {tk['so_khung_phan_tich']} "
+              f"({tk['thoi_gian_phan_tich']:.1f}s), {tk['so_phieu']} phiếu, "
+              f"{tk['bo_qua_ngan']} lần xuất hiện quá ngắn bị bỏ, {tk['tach_doi_phieu']} lần tách phiếu đặt chồng "
+              f"| {len(ket_qua_tong_hop)} phiếu trong {file_tong_hop}")
         
         return ket_qua_tong_hop
     
-    def tao_tong_hop_don_gian(self, ket_qua_tong_hop: Dict) -> Dict:
+    def _nap_ket_qua_da_co(self, thu_muc_output: str) -> Dict:
+        """Nạp các file <phiếu>_result.json đã có trong thư mục kết quả, theo tên phiếu"""
+        ket_qua_tong_hop = {}
+        for file_ket_qua in sorted(glob.glob(os.path.join(thu_muc_output, "*_result.json"))):
+            try:
+                with open(file_ket_qua, 'r', encoding='utf-8') as f:
+                    ket_qua_tong_hop[os.path.basename(file_ket_qua)[:-len("_result.json")]] = json.load(f)
+            except Exception as e:
+                print(f"[WARNING] Không đọc được {file_ket_qua}: {e}")
+        return ket_qua_tong_hop
+    
+    def _cap_nhat_tong_hop(self, ket_qua_tong_hop: Dict, file_tong_hop: str, nhan: str, thoi_gian: float,
+                           phieu_trung_lap: Dict = None):
+        """Ghi lại file tổng hợp sau mỗi phiếu và in kết quả tạm thời"""
+        # Ghi file tạm rồi đổi tên để không ai đọc phải file ghi dở; file tạm riêng cho từng tiến trình
+        # vì nhiều worker của hàng đợi có thể cùng ghi file tổng hợp
+        tong_hop = self.tao_tong_hop_don_gian(ket_qua_tong_hop, phieu_trung_lap)
+        file_tam = f"{file_tong_hop}.{ten_worker_mac_dinh()}.tmp"
+        self.luu_ket_qua_json(tong_hop, file_tam)
+        os.replace(file_tam, file_tong_hop)
+        
+        dan_dau = ", ".join(f"{ung_vien['ho_ten']}: {ung_vien['so_luot_dong_y']}"
+                            for ung_vien in tong_hop['ket_qua_binh_chon'][:3])
+        print(f"📊 {nhan} ({thoi_gian:.2f}s) | "
+              f"{tong_hop['tong_so_phieu_bau']} phiếu, {tong_hop['tong_so_phieu_hop_le']} hợp lệ, "
+              f"{tong_hop['tong_so_phieu_loi']} lỗi | {dan_dau}")
+    
+    def tao_tong_hop_don_gian(self, ket_qua_tong_hop: Dict, phieu_trung_lap: Dict = None) -> Dict:
         """
         Tạo file tổng hợp đơn giản chỉ có tên và số lượng đồng ý
         
         Args:
             ket_qua_tong_hop: Kết quả chi tiết từ tất cả phiếu bầu
-            
+            phieu_trung_lap: Dict {khóa phiếu: {'trung_voi', 'khoang_cach'}} các phiếu trùng, không được
+                             tính (None: không phát hiện phiếu trùng)
+        
         Returns:
             Dict chứa thống kê đơn giản
         """
@@ -396,9 +2297,19 @@ class PhieuBauProcessor:
         dem_dong_y = {}
         tong_so_phieu_hop_le = 0
         danh_sach_phieu_loi = []
+        danh_sach_phieu_trung_lap = []
         
         for file_path, ket_qua_phieu in ket_qua_tong_hop.items():
-            ten_file = os.path.basename(file_path)
+            ten_file = ten_anh(file_path)
+            
+            if phieu_trung_lap and file_path in phieu_trung_lap:
+                # Bản quét lại của một phiếu đã tính - ghi lại phiếu gốc, không đếm lần hai
+                danh_sach_phieu_trung_lap.append({
+                    'phieu': ten_file,
+                    'trung_voi': ten_anh(phieu_trung_lap[file_path]['trung_voi']),
+                    'khoang_cach': phieu_trung_lap[file_path]['khoang_cach']
+                })
+                continue
             
             if ket_qua_phieu:  # Nếu có kết quả
                 # Kiểm tra xem phiếu có lỗi không
@@ -437,8 +2348,8 @@ class PhieuBauProcessor:
                 'so_luot_dong_y': so_dong_y
             })
         
-        return {
-            'tong_so_phieu_bau': len(ket_qua_tong_hop),
+        tong_hop = {
+            'tong_so_phieu_bau': len(ket_qua_tong_hop) - len(danh_sach_phieu_trung_lap),
             'tong_so_phieu_hop_le': tong_so_phieu_hop_le,
             'tong_so_phieu_loi': len(danh_sach_phieu_loi),
             'danh_sach_phieu_loi': danh_sach_phieu_loi,
@@ -447,6 +2358,25 @@ class PhieuBauProcessor:
             'thoi_gian_xu_ly': self.get_current_time(),
             'phuong_phap': 'TrOCR + YOLO tích hợp'
         }
+        
+        if phieu_trung_lap is not None:
+            tong_hop['tong_so_phieu_trung_lap'] = len(danh_sach_phieu_trung_lap)
+            tong_hop['danh_sach_phieu_trung_lap'] = danh_sach_phieu_trung_lap
+        if self.loc_muc:
+            tong_hop['thong_ke_loc_muc'] = dict(self.thong_ke_loc_muc)
+        if self._bo_nho_dem:
+            tong_hop['thong_ke_bo_nho_dem'] = {giai_doan: dict(dem)
+                                               for giai_doan, dem in self._bo_nho_dem.thong_ke.items()}
+        if self.leo_thang:
+            tong_hop['thong_ke_leo_thang'] = dict(self.thong_ke_leo_thang)
+        if self.thong_ke_day_chuyen:
+            tong_hop['thong_ke_day_chuyen'] = self.thong_ke_day_chuyen
+        if self.gom_lo:
+            tong_hop['thong_ke_gom_lo'] = self.thong_ke_gom_lo()
+        if self.thong_ke_tien_trinh:
+            tong_hop['thong_ke_tien_trinh'] = self.thong_ke_tien_trinh
+        
+        return tong_hop
     
     def get_current_time(self) -> str:
         """
@@ -464,22 +2394,293 @@ class PhieuBauProcessor:
         except Exception:
             pass
 
+def liet_ke_viec(thu_muc_anh: List[str], thu_muc_output: str) -> tuple:
+    """
+    Liệt kê các phiếu cần xử lý trong các thư mục / file nén / tài liệu nhiều trang (không cần load mô hình)
+    
+    Args:
+        thu_muc_anh: Danh sách thư mục / file nén / tài liệu chứa ảnh phiếu bầu
+        thu_muc_output: Thư mục lưu kết quả (tạo thư mục con ket_qua_<nguồn> cho từng đầu vào)
+    
+    Returns:
+        (List dict việc {'duong_dan_anh', 'thu_muc_temp', 'file_ket_qua'[, 'nguon', 'thanh_vien']},
+         list thư mục temp chưa được tạo)
+    """
+    # Tạo thư mục output chính
+    os.makedirs(thu_muc_output, exist_ok=True)
+    
+    danh_sach_viec = []
+    cac_thu_muc_temp = []
+    
+    for input_dir in thu_muc_anh:
+        if not os.path.exists(input_dir):
+            print(f"⚠️ Thư mục {input_dir} không tồn tại, bỏ qua...")
+            continue
+        
+        # Tạo thư mục con cho từng input_dir
+        sub_output_dir = os.path.join(thu_muc_output, f"ket_qua_{ten_nguon(input_dir)}")
+        os.makedirs(sub_output_dir, exist_ok=True)
+        
+        # Lấy danh sách ảnh: (khóa ảnh, nguồn nhiều ảnh hoặc None, tên ảnh / số trang trong nguồn)
+        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+        image_files = []
+        
+        if os.path.isdir(input_dir):
+            cac_file = [os.path.join(input_dir, filename) for filename in os.listdir(input_dir)]
+        else:
+            cac_file = [input_dir]
+        
+        for duong_dan in cac_file:
+            if la_nguon_nhieu_anh(duong_dan):
+                # File nén hoặc PDF/TIFF nhiều trang: ảnh được đọc thẳng từ file khi xử lý,
+                # khóa phiếu dạng "nguồn#tên_trong_file_nén" hoặc "nguồn#trang"
+                try:
+                    cac_thanh_vien = liet_ke_anh_trong_nguon(duong_dan)
+                except Exception as e:
+                    print(f"❌ Không đọc được {duong_dan}: {e}")
+                    continue
+                image_files.extend((khoa_anh(duong_dan, thanh_vien), duong_dan, thanh_vien)
+                                   for thanh_vien in cac_thanh_vien)
+            elif any(duong_dan.lower().endswith(ext) for ext in image_extensions):
+                image_files.append((duong_dan, None, None))
+        
+        if not image_files:
+            print(f"❌ Không tìm thấy ảnh nào trong {input_dir}!")
+            continue
+        
+        # Thư mục temp cho thư mục này (tạo khi xử lý nếu ảnh cắt được lưu ra đĩa)
+        thu_muc_temp = os.path.join(sub_output_dir, "temp_processing")
+        cac_thu_muc_temp.append(thu_muc_temp)
+        
+        for image_path, nguon, thanh_vien in image_files:
+            ten_file = ten_co_so(image_path)
+            viec = {
+                'duong_dan_anh': image_path,
+                'thu_muc_temp': thu_muc_temp,
+                'file_ket_qua': os.path.join(sub_output_dir, f"{ten_file}_result.json")
+            }
+            if nguon:
+                viec['nguon'] = nguon
+                viec['thanh_vien'] = thanh_vien
+            danh_sach_viec.append(viec)
+    
+    return danh_sach_viec, cac_thu_muc_temp
+
+def them_tham_so_processor(parser: argparse.ArgumentParser):
+    """Thêm các tham số cấu hình PhieuBauProcessor vào parser (dùng chung cho CLI batch và dịch vụ)"""
+    parser.add_argument("--weights", default="models/best.pt",
+                       help="Đường dẫn YOLO weights")
+    parser.add_argument("--yolo-batch", type=int, default=32,
+                       help="Số ô tối đa trong một lần predict YOLO (mặc định: 32)")
+    parser.add_argument("--detect-mode", choices=["cell", "ballot"], default="cell",
+                       help="cell: YOLO trên từng ô; ballot: YOLO một lần trên dải cột đồng ý/không đồng ý")
+    parser.add_argument("--backend", choices=list(CAC_BACKEND), default="pt",
+                       help="Backend chạy YOLO: pt, onnx hoặc openvino (tự xuất từ --weights lần đầu)")
+    parser.add_argument("--int8", action="store_true",
+                       help="Lượng tử hóa int8 khi xuất (chỉ với --backend openvino)")
+    parser.add_argument("--int8-data", type=str, default=None,
+                       help="Thư mục ảnh ô đồng ý/không đồng ý đã cắt dùng để hiệu chỉnh int8")
+    parser.add_argument("--imgsz", type=int, default=640,
+                       help="imgsz khi chạy YOLO trên ô (mặc định: 640)")
+    parser.add_argument("--rect", action="store_true",
+                       help="Gửi ô đã cắt không padding vuông để suy luận hình chữ nhật")
+    parser.add_argument("--max-det", type=int, default=300,
+                       help="Số detection tối đa trên một ô (mặc định: 300)")
+    parser.add_argument("--conf", type=float, default=0.25,
+                       help="Ngưỡng confidence của YOLO (mặc định: 0.25)")
+    parser.add_argument("--classes", type=str, default=None,
+                       help="Chỉ giữ các class này, phân cách bằng dấu phẩy (ví dụ: x_mark,x_cancelled)")
+    parser.add_argument("--escalate", action="store_true",
+                       help="Chạy lượt thứ hai (TTA + độ phân giải cao, bỏ phiếu) cho các ô mơ hồ")
+    parser.add_argument("--grey-zone", type=str, default="0.25,0.6",
+                       help="Khoảng confidence mơ hồ 'thấp,cao' (mặc định: 0.25,0.6)")
+    parser.add_argument("--escalate-imgsz", type=int, default=960,
+                       help="imgsz của lượt độ phân giải cao (mặc định: 960)")
+    parser.add_argument("--ink-filter", action="store_true",
+                       help="Lọc ô trống bằng mật độ mực trước khi gửi YOLO (chế độ cell)")
+    parser.add_argument("--blank-threshold", type=float, default=0.01,
+                       help="Tỉ lệ mực dưới ngưỡng này được coi là ô trống (mặc định: 0.01)")
+    parser.add_argument("--pipeline", action="store_true",
+                       help="Xử lý batch theo dây chuyền: tiền xử lý phiếu sau chạy song song với OCR/YOLO phiếu trước")
+    parser.add_argument("--pipeline-workers", type=str, default=None,
+                       help="Số worker từng giai đoạn, ví dụ tien_xu_ly=2,ocr=1,phat_hien=1,ghi_ket_qua=1")
+    parser.add_argument("--queue-size", type=int, default=4,
+                       help="Số phiếu tối đa chờ trước mỗi giai đoạn dây chuyền (mặc định: 4)")
+    parser.add_argument("--micro-batch", action="store_true",
+                       help="Gom ô của nhiều phiếu đang xử lý thành lô chung cho TrOCR và YOLO (dùng cùng --pipeline)")
+    parser.add_argument("--ocr-batch", type=int, default=32,
+                       help="Số ô họ tên tối đa trong một lô TrOCR (mặc định: 32)")
+    parser.add_argument("--max-wait-ms", type=float, default=20,
+                       help="Thời gian tối đa chờ gom đủ lô, mili giây (mặc định: 20)")
+    parser.add_argument("--shared-memory", action="store_true",
+                       help="Tiền xử lý trong các tiến trình riêng, chuyển ô sang suy luận qua bộ đệm vòng shared memory")
+    parser.add_argument("--preprocess-workers", type=int, default=2,
+                       help="Số tiến trình tiền xử lý khi dùng --shared-memory (mặc định: 2)")
+    parser.add_argument("--ring-slots", type=int, default=8,
+                       help="Số phiếu tối đa trong bộ đệm vòng (mặc định: 8, khoảng 29MB mỗi slot)")
+    parser.add_argument("--processes", type=int, default=1,
+                       help="Số tiến trình xử lý batch, fork sau khi load mô hình để dùng chung weights (mặc định: 1)")
+    parser.add_argument("--row-parallel", action="store_true",
+                       help="Xử lý các dòng của một phiếu song song (OCR từng dòng đồng thời với YOLO) để giảm độ trễ")
+    parser.add_argument("--row-workers", type=int, default=4,
+                       help="Số luồng xử lý dòng khi dùng --row-parallel (mặc định: 4)")
+    parser.add_argument("--duplicates", choices=["skip", "flag"], default=None,
+                       help="Phát hiện phiếu quét trùng (batch, --watch): skip - không chạy TrOCR + YOLO, "
+                            "flag - vẫn xử lý; phiếu trùng không được tính vào tổng hợp (mặc định: tắt)")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.2,
+                       help="Khoảng cách vân tay tối đa để coi hai phiếu là trùng (mặc định: 0.2)")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                       help="Thư mục lưu đệm kết quả từng giai đoạn (làm phẳng, OCR, YOLO, ghép kết quả); "
+                            "lần chạy sau chỉ tính lại giai đoạn có cấu hình / mô hình thay đổi (mặc định: tắt)")
+    parser.add_argument("--cache-size-mb", type=int, default=2048,
+                       help="Dung lượng tối đa của bộ nhớ đệm, mục lâu không dùng bị xóa trước (mặc định: 2048)")
+    parser.add_argument("--ballot-timeout", type=float, default=None,
+                       help="Số giây tối đa xử lý một phiếu; phiếu quá hạn bị hủy và cách ly (mặc định: không giới hạn)")
+    parser.add_argument("--stage-timeout", type=str, default=None,
+                       help="Số giây tối đa của từng giai đoạn, ví dụ tien_xu_ly=10,ocr=30,phat_hien=20")
+    parser.add_argument("--read-workers", type=int, default=4,
+                       help="Số luồng đọc và decode ảnh song song khi --input là file zip/tar (mặc định: 4)")
+    parser.add_argument("--threads", type=int, default=0,
+                       help="Số lõi CPU chia cho tiền xử lý và mô hình (mặc định: 0 - tất cả lõi)")
+    parser.add_argument("--pin-cpu", action="store_true",
+                       help="Ghim từng tiến trình vào khối lõi của nó theo kế hoạch luồng")
+
+def kiem_tra_tham_so_batch(parser: argparse.ArgumentParser, args, che_do: str, cho_phep=()):
+    """
+    Báo lỗi (parser.error) khi tham số chỉ dùng cho batch được truyền cùng một chế độ khác
+    (stdin, theo dõi thư mục, video, hàng đợi, dịch vụ...) thay vì bỏ qua không báo
+    
+    Args:
+        parser: Parser đã tạo args
+        args: Tham số đã parse
+        che_do: Tên chế độ đang chạy (trong thông báo lỗi)
+        cho_phep: Các tham số batch mà chế độ này vẫn dùng
+    """
+    tham_so_batch = {
+        '--input': getattr(args, 'input', None) is not None,
+        '--pipeline': args.pipeline,
+        '--shared-memory': args.shared_memory,
+        '--processes': args.processes > 1,
+        '--no-resume': getattr(args, 'no_resume', False),
+        '--retry-quarantined': getattr(args, 'retry_quarantined', False)
+    }
+    cac_tham_so = [ten for ten, co_truyen in tham_so_batch.items() if co_truyen and ten not in cho_phep]
+    if cac_tham_so:
+        parser.error(f"{', '.join(cac_tham_so)} chỉ dùng khi xử lý batch, không dùng cùng {che_do}")
+
+def tao_processor(args) -> PhieuBauProcessor:
+    """Khởi tạo PhieuBauProcessor từ các tham số của them_tham_so_processor"""
+    so_worker_giai_doan = None
+    if args.pipeline_workers:
+        so_worker_giai_doan = {}
+        for cap in args.pipeline_workers.split(','):
+            ten, so = cap.split('=')
+            so_worker_giai_doan[ten.strip()] = int(so)
+    
+    return PhieuBauProcessor(yolo_weights_path=args.weights,
+                             kich_thuoc_lo_yolo=args.yolo_batch,
+                             che_do_phat_hien=args.detect_mode,
+                             loc_muc=args.ink_filter,
+                             nguong_o_trong=args.blank_threshold,
+                             yolo_backend=args.backend,
+                             int8=args.int8,
+                             du_lieu_int8=args.int8_data,
+                             imgsz_o=args.imgsz,
+                             o_chu_nhat=args.rect,
+                             max_det_o=args.max_det,
+                             conf_yolo=args.conf,
+                             lop_yolo=[c.strip() for c in args.classes.split(',')] if args.classes else None,
+                             leo_thang=args.escalate,
+                             vung_xam=tuple(float(x) for x in args.grey_zone.split(',')),
+                             imgsz_leo_thang=args.escalate_imgsz,
+                             day_chuyen=args.pipeline,
+                             so_worker_giai_doan=so_worker_giai_doan,
+                             kich_thuoc_hang_doi=args.queue_size,
+                             gom_lo=args.micro_batch,
+                             kich_thuoc_lo_ocr=args.ocr_batch,
+                             thoi_gian_cho_lo=args.max_wait_ms / 1000,
+                             so_tien_trinh=args.processes,
+                             bo_nho_chung=args.shared_memory,
+                             so_tien_trinh_tien_xu_ly=args.preprocess_workers,
+                             so_slot_bo_dem=args.ring_slots,
+                             so_loi=args.threads or None,
+                             ghim_cpu=args.pin_cpu,
+                             song_song_dong=args.row_parallel,
+                             so_luong_dong=args.row_workers,
+                             so_luong_doc_nen=args.read_workers,
+                             trung_lap=args.duplicates,
+                             nguong_trung_lap=args.duplicate_threshold,
+                             thu_muc_bo_nho_dem=args.cache_dir,
+                             dung_luong_bo_nho_dem=args.cache_size_mb << 20,
+                             gioi_han_phieu=args.ballot_timeout or None,
+                             gioi_han_giai_doan=phan_tich_gioi_han_giai_doan(args.stage_timeout)
+                                                if args.stage_timeout else None)
+
 def main():
     """
     Hàm main để test hệ thống
     """
     parser = argparse.ArgumentParser(description="Xử lý phiếu bầu với TrOCR + YOLO")
     parser.add_argument("--input", default=None, 
-                       help="Thư mục hoặc danh sách thư mục chứa ảnh phiếu bầu (mặc định: ballot/data1,ballot/data2)")
+                       help="Thư mục / file .zip, .tar, .tar.gz, PDF, TIFF nhiều trang hoặc danh sách phân cách bằng dấu phẩy "
+                            "(mặc định: ballot/data1,ballot/data2)")
     parser.add_argument("--output", default="results/ket_qua_trocr_yolo",
                        help="Thư mục lưu kết quả")
-    parser.add_argument("--weights", default="models/best.pt",
-                       help="Đường dẫn YOLO weights")
-    parser.add_argument("--single", type=str, 
+    parser.add_argument("--no-resume", action="store_true",
+                       help="Batch: xử lý lại mọi phiếu, bỏ qua bản kê ban_ke.jsonl của lần chạy trước")
+    parser.add_argument("--retry-quarantined", action="store_true",
+                       help="Batch: chỉ xử lý lại các phiếu trong thư mục cách ly <output>/cach_ly (cùng --input)")
+    # Các chế độ chạy thay cho batch, chỉ chọn một
+    che_do = parser.add_mutually_exclusive_group()
+    che_do.add_argument("--single", type=str, 
                        help="Xử lý một ảnh cụ thể")
+    che_do.add_argument("--stdin", choices=["paths", "bytes"], default=None,
+                       help="Đọc phiếu từ stdin (paths: mỗi dòng một đường dẫn hoặc JSON; bytes: khung "
+                            "'<số byte> [tên]' + ảnh), ghi mỗi phiếu một dòng JSON ra stdout")
+    parser.add_argument("--layout", choices=list(CAC_LAYOUT), default=None,
+                       help="Layout cho phiếu đọc từ stdin, --watch hoặc --video (mặc định: đoán theo đường dẫn/tên)")
+    che_do.add_argument("--watch", type=str, default=None,
+                       help="Theo dõi thư mục máy quét, xử lý ảnh mới ngay khi ghi xong, chuyển vào done/failed")
+    parser.add_argument("--settle-seconds", type=float, default=1.0,
+                       help="Số giây kích thước ảnh phải giữ nguyên trước khi xử lý (mặc định: 1.0)")
+    parser.add_argument("--rescan-seconds", type=float, default=2.0,
+                       help="Chu kỳ quét lại thư mục theo dõi (mặc định: 2.0)")
+    parser.add_argument("--no-inotify", action="store_true",
+                       help="Chỉ quét định kỳ, không dùng inotify")
+    che_do.add_argument("--video", type=str, default=None,
+                       help="File video, URL luồng hoặc chỉ số camera: chọn khung rõ nhất của từng phiếu rồi xử lý")
+    parser.add_argument("--min-markers", type=int, default=4, choices=[3, 4],
+                       help="Số marker ArUco phải thấy để coi là phiếu nằm trọn trong khung (mặc định: 4)")
+    parser.add_argument("--absent-seconds", type=float, default=0.5,
+                       help="Số giây không thấy marker thì coi là phiếu đã được lấy ra (mặc định: 0.5)")
+    parser.add_argument("--no-save-frames", action="store_true",
+                       help="Không lưu khung hình đã chọn của từng phiếu")
+    che_do.add_argument("--queue", type=str, default=None,
+                       help="File SQLite hàng đợi trên ổ dùng chung: nhận phiếu từ hàng đợi đến khi hết việc "
+                            "(mỗi máy chạy một hoặc nhiều worker)")
+    parser.add_argument("--enqueue", action="store_true",
+                       help="Cùng --queue: thêm các phiếu trong --input vào hàng đợi (kết quả ghi vào --output) rồi thoát")
+    parser.add_argument("--worker-name", type=str, default=None,
+                       help="Tên worker trong hàng đợi (mặc định: máy:pid)")
+    parser.add_argument("--lease-seconds", type=float, default=120.0,
+                       help="Số giây giữ phiếu nếu worker ngừng gia hạn, sau đó worker khác nhận lại (mặc định: 120)")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                       help="Số lần nhận một phiếu tối đa trước khi đánh dấu lỗi (mặc định: 3)")
+    che_do.add_argument("--parity-check", type=str, default=None,
+                       help="Thư mục ảnh ô để so sánh kết quả backend đã xuất với .pt rồi thoát")
+    them_tham_so_processor(parser)
     
     args = parser.parse_args()
     
+    if args.enqueue and not args.queue:
+        parser.error("--enqueue cần --queue")
+    for ten, gia_tri in (("--single", args.single), ("--stdin", args.stdin), ("--watch", args.watch),
+                         ("--video", args.video), ("--queue", args.queue), ("--parity-check", args.parity_check)):
+        if gia_tri:
+            # --enqueue liệt kê phiếu theo --input
+            kiem_tra_tham_so_batch(parser, args, ten, cho_phep=('--input',) if args.enqueue else ())
+            break
+    
     # Xử lý tham số input
     if args.input:
         if ',' in args.input:
@@ -489,10 +2690,68 @@ def main():
     else:
         input_dirs = None  # Sẽ dùng mặc định ["ballot/data1", "ballot/data2"]
     
+    if args.queue and args.enqueue:
+        # Đường dẫn tuyệt đối để worker trên máy khác (cùng điểm gắn ổ chung) tìm thấy ảnh và thư mục kết quả
+        if input_dirs is None:
+            input_dirs = ["ballot/data1", "ballot/data2"]
+        elif isinstance(input_dirs, str):
+            input_dirs = [input_dirs]
+        danh_sach_viec, _ = liet_ke_viec([os.path.abspath(d) for d in input_dirs], os.path.abspath(args.output))
+        # Worker đọc riêng từng phiếu: với tar nén, mỗi phiếu phải giải nén mọi thứ đứng trước nó
+        cac_tar_nen = sorted(nguon for nguon in {viec.get('nguon') for viec in danh_sach_viec} if nguon and la_tar_nen(nguon))
+        if cac_tar_nen:
+            parser.error(f"--enqueue không nhận tar nén (gzip/bz2/xz): {', '.join(cac_tar_nen)}. "
+                         f"Giải nén thành .tar hoặc đóng gói lại bằng .zip")
+        hang_doi = HangDoiCongViec(args.queue)
+        so_moi = hang_doi.them_viec(danh_sach_viec)
+        print(f"[INFO] Thêm {so_moi}/{len(danh_sach_viec)} phiếu vào {args.queue}: {hang_doi.thong_ke()}")
+        return
+    
+    # Chế độ stdin: stdout chỉ chứa kết quả JSON, mọi thông tin in ra stderr
+    dau_ra_json = sys.stdout
+    if args.stdin:
+        sys.stdout = sys.stderr
+    
     # Khởi tạo processor
-    processor = PhieuBauProcessor(yolo_weights_path=args.weights)
+    processor = tao_processor(args)
     
-    if args.single:
+    if args.stdin:
+        # Xử lý từng phiếu ngay khi đọc được, ảnh cắt giữ trong bộ nhớ
+        if args.stdin == "paths":
+            cac_muc = doc_duong_dan(sys.stdin)
+        else:
+            cac_muc = doc_khung_anh(sys.stdin.buffer)
+        thong_ke = chay_luong(cac_muc,
+                              lambda ten, anh, layout: processor.xu_ly_phieu_bau_hoan_chinh(ten, None, anh=anh, layout=layout),
+                              dau_ra_json, args.layout)
+        print(f"[INFO] Luồng stdin: {thong_ke['so_phieu']} phiếu, {thong_ke['thanh_cong']} thành công, "
+              f"{thong_ke['loi']} lỗi, {thong_ke['thoi_gian']}s")
+    elif args.watch:
+        # Xử lý phiếu ngay khi máy quét ghi vào thư mục
+        processor.theo_doi_thu_muc(args.watch, args.output,
+                                   layout=CAC_LAYOUT[args.layout]() if args.layout else None,
+                                   thoi_gian_on_dinh=args.settle_seconds,
+                                   chu_ky_quet=args.rescan_seconds,
+                                   dung_inotify=not args.no_inotify)
+    elif args.video:
+        # Chọn khung rõ nhất của từng phiếu trong video / camera
+        processor.xu_ly_video(args.video, args.output,
+                              layout=CAC_LAYOUT[args.layout]() if args.layout else None,
+                              luu_khung=not args.no_save_frames,
+                              so_marker_toi_thieu=args.min_markers,
+                              thoi_gian_vang=args.absent_seconds)
+    elif args.queue:
+        # Worker của hàng đợi dùng chung: chạy cùng lệnh trên mỗi máy để xử lý song song
+        processor.chay_worker_hang_doi(args.queue, args.output,
+                                       ten_worker=args.worker_name,
+                                       thoi_gian_thue=args.lease_seconds,
+                                       so_lan_thu_toi_da=args.max_attempts)
+    elif args.parity_check:
+        # So sánh backend đã xuất với .pt trên các ảnh ô đã cắt
+        danh_sach_anh = [os.path.join(args.parity_check, f) for f in sorted(os.listdir(args.parity_check))
+                         if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        processor.kiem_tra_tuong_duong_backend(danh_sach_anh)
+    elif args.single:
         # Xử lý một ảnh
         if os.path.exists(args.single):
             ket_qua = processor.xu_ly_phieu_bau_hoan_chinh(args.single)
@@ -500,7 +2759,8 @@ def main():
             print(f"[ERROR] File không tồn tại: {args.single}")
     else:
         # Xử lý batch
-        ket_qua = processor.xu_ly_nhieu_phieu_bau(input_dirs, args.output)
+        ket_qua = processor.xu_ly_nhieu_phieu_bau(input_dirs, args.output, tiep_tuc=not args.no_resume,
+                                                  chi_phieu_cach_ly=args.retry_quarantined)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,45 @@
+# phieu_gia.py - Ảnh phiếu tổng hợp cho các test (không cần ảnh quét thật)
+import cv2
+import numpy as np
+
+from core.tien_xu_ly import get_layout1, KICH_THUOC_PHANG
+
+LAYOUT = get_layout1()
+VUNG_O = [LAYOUT[dong][o] for dong in LAYOUT for o in ('agree', 'disagree')]
+
+def tao_anh_phang(hat_giong: int, do_day_net: int = 4):
+    """Ảnh phẳng tổng hợp: bảng in sẵn và dấu X viết tay ở ô đồng ý của các dòng lẻ"""
+    rng = np.random.default_rng(hat_giong)
+    rong, cao = KICH_THUOC_PHANG
+    anh = np.full((cao, rong, 3), 245, dtype=np.uint8)
+    for dong in LAYOUT.values():
+        for x1, y1, x2, y2 in dong.values():
+            cv2.rectangle(anh, (x1, y1), (x2, y2), (0, 0, 0), 3)
+    
+    for x1, y1, x2, y2 in VUNG_O[::2]:
+        cx = (x1 + x2) / 2 + rng.normal(0, (x2 - x1) * 0.08)
+        cy = (y1 + y2) / 2 + rng.normal(0, (y2 - y1) * 0.08)
+        nua = min(x2 - x1, y2 - y1) * rng.uniform(0.25, 0.4)
+        goc = rng.normal(0, 0.25)
+        for huong in (goc, goc + np.pi / 2 + rng.normal(0, 0.2)):
+            dx, dy = np.cos(huong + np.pi / 4) * nua, np.sin(huong + np.pi / 4) * nua
+            cv2.line(anh, (int(cx - dx), int(cy - dy)), (int(cx + dx), int(cy + dy)), (20, 20, 20), do_day_net)
+    return anh
+
+def tao_to_phieu(anh_phang, kich_thuoc_marker: int = 200):
+    """Tờ phiếu có 4 marker ArUco (id 0-3) đặt tâm tại 4 góc ảnh phẳng, như phiếu in"""
+    tu_dien = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    le = kich_thuoc_marker
+    cao, rong = anh_phang.shape[:2]
+    to_phieu = np.full((cao + 2 * le, rong + 2 * le, 3), 255, dtype=np.uint8)
+    to_phieu[le:le + cao, le:le + rong] = anh_phang
+    
+    nua = kich_thuoc_marker // 2
+    for id_marker, (x, y) in enumerate([(0, 0), (rong - 1, 0), (rong - 1, cao - 1), (0, cao - 1)]):
+        # Viền trắng quanh marker để detector tách được marker khỏi nội dung phiếu
+        cv2.rectangle(to_phieu, (le + x - nua - 20, le + y - nua - 20), (le + x + nua + 20, le + y + nua + 20),
+                      (255, 255, 255), -1)
+        marker = cv2.aruco.generateImageMarker(tu_dien, id_marker, kich_thuoc_marker)
+        to_phieu[le + y - nua:le + y - nua + kich_thuoc_marker, le + x - nua:le + x - nua + kich_thuoc_marker] = \
+            cv2.cvtColor(marker, cv2.COLOR_GRAY2BGR)
+    return to_phieu
@@ -0,0 +1,133 @@
+# test_hang_doi_cong_viec.py - Hàng đợi SQLite: hết hạn thuê, nhận lại, mỗi phiếu chỉ ghi nhận đúng một lần
+import time
+import multiprocessing
+from collections import Counter
+
+from core.hang_doi_cong_viec import HangDoiCongViec, CHO, DANG_XU_LY, XONG, LOI
+
+THOI_GIAN_THUE = 0.5
+
+def tao_hang_doi(duong_dan, so_viec: int, so_lan_thu_toi_da: int = 3):
+    hang_doi = HangDoiCongViec(str(duong_dan), thoi_gian_thue=THOI_GIAN_THUE, so_lan_thu_toi_da=so_lan_thu_toi_da)
+    hang_doi.them_viec([{'duong_dan_anh': f"phieu_{i}.jpg", 'file_ket_qua': f"phieu_{i}.json"}
+                        for i in range(so_viec)])
+    return hang_doi
+
+def la_viec_treo(viec) -> bool:
+    """Lần nhận đầu của mỗi việc thứ tư: worker treo quá hạn thuê mà không gia hạn"""
+    return viec['id'] % 4 == 0 and viec['so_lan_thu'] == 1
+
+def la_viec_cham(viec) -> bool:
+    """Việc chạy lâu hơn hạn thuê nhưng có nhịp tim gia hạn: không được để worker khác lấy mất"""
+    return viec['id'] % 4 == 1
+
+def chay_worker(duong_dan: str, ten_worker: str, ket_qua):
+    """Vòng lặp worker như chay_worker_hang_doi; gửi về (khóa, ma_thue, hoan_thanh có được ghi nhận)"""
+    hang_doi = HangDoiCongViec(duong_dan, thoi_gian_thue=THOI_GIAN_THUE, so_lan_thu_toi_da=3)
+    while True:
+        cac_viec = hang_doi.nhan_viec(ten_worker)
+        if not cac_viec:
+            dem = hang_doi.thong_ke()
+            if dem[DANG_XU_LY] == 0 and dem[CHO] == 0:
+                return
+            time.sleep(0.05)
+            continue
+        
+        viec = cac_viec[0]
+        if la_viec_treo(viec):
+            time.sleep(THOI_GIAN_THUE * 4)
+        else:
+            with hang_doi.giu_thue(viec) as mat_thue:
+                time.sleep(THOI_GIAN_THUE * 1.4 if la_viec_cham(viec) else 0.01)
+            if mat_thue.is_set():
+                ket_qua.put((viec['khoa'], viec['ma_thue'], False))
+                continue
+        ket_qua.put((viec['khoa'], viec['ma_thue'], hang_doi.hoan_thanh(viec, {'worker': ten_worker})))
+
+def test_bon_tien_trinh_moi_phieu_ghi_nhan_dung_mot_lan(tmp_path):
+    duong_dan = tmp_path / "hang_doi.sqlite"
+    so_viec = 16
+    tao_hang_doi(duong_dan, so_viec)
+    
+    ngu_canh = multiprocessing.get_context("spawn")
+    ket_qua = ngu_canh.Queue()
+    cac_tien_trinh = [ngu_canh.Process(target=chay_worker, args=(str(duong_dan), f"worker_{i}", ket_qua))
+                      for i in range(4)]
+    for tien_trinh in cac_tien_trinh:
+        tien_trinh.start()
+    
+    # Đọc hàng đợi kết quả trước khi join để tiến trình con không bị chặn khi ghi
+    cac_lan_ghi = []
+    han_cuoi = time.time() + 60
+    while any(tien_trinh.is_alive() for tien_trinh in cac_tien_trinh) and time.time() < han_cuoi:
+        while not ket_qua.empty():
+            cac_lan_ghi.append(ket_qua.get())
+        time.sleep(0.05)
+    for tien_trinh in cac_tien_trinh:
+        tien_trinh.join(timeout=5)
+        assert tien_trinh.exitcode == 0
+    while not ket_qua.empty():
+        cac_lan_ghi.append(ket_qua.get())
+    
+    ghi_nhan = Counter(khoa for khoa, _, duoc_ghi_nhan in cac_lan_ghi if duoc_ghi_nhan)
+    assert ghi_nhan == Counter({f"phieu_{i}.jpg": 1 for i in range(so_viec)})
+    
+    hang_doi = HangDoiCongViec(str(duong_dan), thoi_gian_thue=THOI_GIAN_THUE)
+    assert hang_doi.thong_ke() == {CHO: 0, DANG_XU_LY: 0, XONG: so_viec, LOI: 0}
+    so_lan_thu = {dong['khoa']: dong['so_lan_thu'] for dong in
+                  hang_doi._ket_noi().execute("SELECT id, khoa, so_lan_thu FROM viec")}
+    for i in range(so_viec):
+        khoa = f"phieu_{i}.jpg"
+        id_viec = i + 1
+        if id_viec % 4 == 0:
+            # Worker treo mất lượt thuê: worker khác nhận lại, kết quả muộn của worker treo bị bỏ
+            assert so_lan_thu[khoa] == 2
+            assert (khoa, 1, False) in cac_lan_ghi
+        elif id_viec % 4 == 1:
+            # Nhịp tim giữ lượt thuê dù việc chạy quá hạn thuê
+            assert so_lan_thu[khoa] == 1
+
+def test_het_han_thue_thi_worker_khac_nhan_lai(tmp_path):
+    hang_doi = tao_hang_doi(tmp_path / "hang_doi.sqlite", 1)
+    
+    (viec_cu,) = hang_doi.nhan_viec("worker_a")
+    assert hang_doi.nhan_viec("worker_b") == []
+    
+    time.sleep(THOI_GIAN_THUE + 0.1)
+    (viec_moi,) = hang_doi.nhan_viec("worker_b")
+    assert viec_moi['khoa'] == viec_cu['khoa']
+    assert viec_moi['ma_thue'] == viec_cu['ma_thue'] + 1
+    
+    # Lượt thuê cũ không gia hạn, không ghi kết quả, không trả việc về hàng đợi được nữa
+    assert not hang_doi.gia_han(viec_cu)
+    assert not hang_doi.hoan_thanh(viec_cu, {'worker': "worker_a"})
+    assert not hang_doi.bao_loi(viec_cu, "muộn")
+    assert hang_doi.hoan_thanh(viec_moi, {'worker': "worker_b"})
+    assert hang_doi.ket_qua()[0]['ket_qua'] == {'worker': "worker_b"}
+
+def test_bao_loi_du_so_lan_thu_toi_da_thi_danh_dau_loi(tmp_path):
+    hang_doi = tao_hang_doi(tmp_path / "hang_doi.sqlite", 1, so_lan_thu_toi_da=3)
+    
+    for lan in range(1, 4):
+        (viec,) = hang_doi.nhan_viec("worker")
+        assert viec['so_lan_thu'] == lan
+        assert hang_doi.bao_loi(viec, f"lỗi lần {lan}")
+        assert hang_doi.thong_ke()[CHO if lan < 3 else LOI] == 1
+    
+    assert hang_doi.nhan_viec("worker") == []
+    (dong,) = hang_doi.ket_qua()
+    assert dong['trang_thai'] == LOI
+    assert dong['loi'] == "lỗi lần 3"
+
+def test_het_han_thue_du_so_lan_thu_toi_da_thi_danh_dau_loi(tmp_path):
+    hang_doi = tao_hang_doi(tmp_path / "hang_doi.sqlite", 1, so_lan_thu_toi_da=2)
+    
+    # Phiếu làm worker chết hai lần: lần hết hạn thứ hai không được nhận lại nữa
+    for _ in range(2):
+        assert len(hang_doi.nhan_viec("worker")) == 1
+        time.sleep(THOI_GIAN_THUE + 0.1)
+    
+    assert hang_doi.nhan_viec("worker") == []
+    (dong,) = hang_doi.ket_qua()
+    assert dong['trang_thai'] == LOI
+    assert dong['loi'] == "Hết hạn thuê sau 2 lần thử"
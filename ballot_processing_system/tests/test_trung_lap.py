@@ -0,0 +1,41 @@
+# test_trung_lap.py - Vân tay phiếu: bản quét lại lệch vài pixel vẫn là phiếu trùng
+import json
+
+import cv2
+import numpy as np
+
+from core.trung_lap import ChiMucTrungLap, van_tay_phieu, PHIEN_BAN_VAN_TAY
+from tests.phieu_gia import tao_anh_phang, VUNG_O
+
+def dich_anh(anh, dx: float, dy: float):
+    """Bản quét lại: cùng tờ phiếu, làm phẳng lệch vài pixel"""
+    cao, rong = anh.shape[:2]
+    ma_tran = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv2.warpAffine(anh, ma_tran, (rong, cao), borderValue=(245, 245, 245))
+
+def test_ban_quet_lai_lech_vai_pixel_la_phieu_trung(tmp_path):
+    for do_day_net in (4, 8):
+        chi_muc = ChiMucTrungLap(str(tmp_path / f"chi_muc_{do_day_net}.jsonl"))
+        anh = tao_anh_phang(1, do_day_net)
+        assert chi_muc.kiem_tra("goc.jpg", van_tay_phieu(anh, VUNG_O)) is None
+        
+        for do_lech in (1, 2, 3, 4):
+            khoa = f"quet_lai_{do_lech}.jpg"
+            trung = chi_muc.kiem_tra(khoa, van_tay_phieu(dich_anh(anh, do_lech, do_lech / 2), VUNG_O))
+            assert trung is not None, f"nét {do_day_net}px lệch {do_lech}px không bị coi là trùng"
+            assert trung['trung_voi'] == "goc.jpg"
+
+def test_phieu_khac_cung_lua_chon_khong_trung(tmp_path):
+    chi_muc = ChiMucTrungLap(str(tmp_path / "chi_muc.jsonl"))
+    assert chi_muc.kiem_tra("phieu_1.jpg", van_tay_phieu(tao_anh_phang(1), VUNG_O)) is None
+    for hat_giong in range(2, 8):
+        assert chi_muc.kiem_tra(f"phieu_{hat_giong}.jpg", van_tay_phieu(tao_anh_phang(hat_giong), VUNG_O)) is None
+
+def test_van_tay_phien_ban_cu_khong_duoc_so(tmp_path):
+    duong_dan = tmp_path / "chi_muc.jsonl"
+    van_tay = van_tay_phieu(tao_anh_phang(1), VUNG_O)
+    duong_dan.write_text(json.dumps({'khoa': "cu.jpg", 'van_tay': van_tay.tobytes().hex()}) + "\n")
+    
+    chi_muc = ChiMucTrungLap(str(duong_dan))
+    assert chi_muc.kiem_tra("moi.jpg", van_tay) is None
+    assert json.loads(duong_dan.read_text().splitlines()[-1])['phien_ban'] == PHIEN_BAN_VAN_TAY